@@ -1,11 +1,405 @@
 import QtQuick 2.2
+import QtWebSockets 1.0
 import Painter 1.0
 
 PainterPlugin {
-	
-		tickIntervalMS: 1000
+		
+		// Bake request from Maya that arrived before a project was ready.
+		property var pendingBake: null
+		
+		// Highpoly meshes from Maya that arrived before the project was created.
+		property var pendingHighpoly: null
+		
+		// The mesh Maya asked to load and when, to report the load time back.
+		property var meshLoad: null
+		
+		// Baking parameters from Maya to apply once the project is ready.
+		property var pendingParameters: null
+		
+		// The Maya baking profile the current parameters came from. Parameters of a
+		// profile aren't reported back to Maya, so they don't become its defaults.
+		property var activeProfile: null
+		
+		// Open connections from Maya, used to report back to it.
+		property var mayaSockets: []
+		
+		// Maya pushes requests to this server as JSON messages, so nothing has to be polled.
+		property QtObject mayaLink: WebSocketServer {
+			listen: true
+			host: "127.0.0.1"
+			port: 37117
+		
+			onClientConnected: function(webSocket) {
+				mayaSockets.push(webSocket)
+				// Lets Maya know that Painter is up and can take meshes.
+				webSocket.sendTextMessage(JSON.stringify({type: "ready", projectOpen: alg.project.isOpen()}))
+				webSocket.onTextMessageReceived.connect(function(message) {
+					handleMayaMessage(JSON.parse(message))
+				})
+				webSocket.onStatusChanged.connect(function() {
+					if (webSocket.status != WebSocket.Open)
+					{
+						mayaSockets = mayaSockets.filter(function(s) { return s !== webSocket })
+					}
+				})
+			}
+		
+			onErrorStringChanged: {
+				alg.log.warn("Maya link: " + errorString)
+			}
+		}
+		
+		function sendToMaya(message)
+		{
+			var str = JSON.stringify(message)
+			mayaSockets.forEach(function(webSocket) {
+				webSocket.sendTextMessage(str)
+			})
+		}
+		
+		// Maya owns bakingParameters.json, so the current parameters are sent to it instead of written here.
+		function sendBakingParameters()
+		{
+			if (activeProfile)
+			{
+				return
+			}
+			try
+			{
+				var params = alg.baking.commonBakingParameters()
+			}
+			catch (e)
+			{
+				return
+			}
+			sendToMaya({
+				type: "bakingParameters",
+				parameters: {
+					Output_Size: params.commonParameters.Output_Size,
+					Antialiasing: params.detailParameters.Antialiasing,
+					Average_Normals: params.detailParameters.Average_Normals,
+					Match: params.detailParameters.Match
+				}
+			})
+		}
+		
+		function handleMayaMessage(message)
+		{
+			if (message.type == "bake")
+			{
+				// Wait for the mesh to be loaded and the highpoly to be set up.
+				if (alg.project.isOpen() && !alg.settings.value("meshFromMaya"))
+				{
+					bake(message.bakingParameters)
+				}
+				else
+				{
+					pendingBake = message.bakingParameters
+				}
+			}
+			else if (message.type == "batch")
+			{
+				processBatchManifest(message.manifest)
+			}
+			else if (message.type == "loadMesh")
+			{
+				loadMesh(message)
+			}
+			else if (message.type == "getBakingParameters")
+			{
+				sendBakingParameters()
+			}
+			else if (message.type == "meshUpdated")
+			{
+				alg.log.info("Mesh updated in Maya: " + message.mesh)
+				if (message.highpoly && message.highpoly.length > 0)
+				{
+					setHighDefinitionMeshes(message.highpoly)
+				}
+				if (message.parameters)
+				{
+					setBakingParameters(message.parameters)
+				}
+			}
+			else if (message.type == "setBakingParameters")
+			{
+				setBakingParameters(message.parameters)
+			}
+			else if (message.type == "highpoly")
+			{
+				setHighpoly(message.highpoly)
+			}
+			else if (message.type == "bakeJob")
+			{
+				runBakeJob(message.job)
+			}
+		}
+		
+		// Proxies from Maya's iteration quality are used like any other highpoly.
+		function setHighDefinitionMeshes(highpoly)
+		{
+			if (highpoly.some(function(path) { return path.indexOf("_high_proxy") != -1 }))
+			{
+				alg.log.info("Baking with a decimated highpoly proxy from Maya")
+			}
+			var params = alg.baking.commonBakingParameters()
+			params.detailParameters.High_Definition_Meshes = highpoly
+			alg.baking.setCommonBakingParameters(params)
+		}
+		
+		// Highpolys split into chunks, and proxies, can't be guessed from the name
+		// of the mesh, so Maya sends them after starting Painter.
+		function setHighpoly(highpoly)
+		{
+			if (!highpoly || highpoly.length == 0)
+			{
+				return
+			}
+			if (!alg.project.isOpen())
+			{
+				pendingHighpoly = highpoly
+			}
+			else if (alg.settings.value("meshFromMaya"))
+			{
+				alg.project.settings.setValue("highpoly", highpoly)
+			}
+			else
+			{
+				setHighDefinitionMeshes(highpoly)
+			}
+		}
+		
+		// Apply the baking parameters from Maya.
+		function applyBakingParameters(bakingParameters)
+		{
+			var params = alg.baking.commonBakingParameters()
+		
+			params.commonParameters.Output_Size = bakingParameters.Output_Size
+			params.detailParameters.Antialiasing = bakingParameters.Antialiasing
+			params.detailParameters.Average_Normals = bakingParameters.Average_Normals
+			params.detailParameters.Match = bakingParameters.Match
+		
+			alg.baking.setCommonBakingParameters(params)
+			activeProfile = bakingParameters.Profile || null
+		}
+		
+		// Apply the baking parameters now, or once the mesh from Maya is set up.
+		function setBakingParameters(bakingParameters)
+		{
+			if (alg.project.isOpen() && !alg.settings.value("meshFromMaya"))
+			{
+				applyBakingParameters(bakingParameters)
+			}
+			else
+			{
+				pendingParameters = bakingParameters
+			}
+		}
+		
+		// Turn on only the bakers Maya asked for, with their settings.
+		function applyBakers(materialName, bakingParameters)
+		{
+			if (!bakingParameters.Bakers)
+			{
+				return
+			}
+			try
+			{
+				var params = alg.baking.materialParameters(materialName)
+				var bakerSettings = bakingParameters.BakerSettings || {}
+				Object.keys(bakerSettings).forEach(function(baker) {
+					if (params[baker])
+					{
+						Object.keys(bakerSettings[baker]).forEach(function(key) {
+							params[baker][key] = bakerSettings[baker][key]
+						})
+					}
+				})
+				alg.baking.setMaterialParameters(materialName, params)
+				alg.baking.setEnabledBakers(materialName, bakingParameters.Bakers)
+			}
+			catch (e)
+			{
+				alg.log.warn("Couldn't set the bakers of " + materialName + ": " + e)
+			}
+		}
+		
+		// Apply the baking parameters from Maya, and bake the enabled maps on each texture set of the document.
+		// If Maya sent the texture sets that changed, only those are baked.
+		// The time each texture set took, and any errors, are reported to Maya, and returned.
+		function bake(bakingParameters)
+		{
+			applyBakingParameters(bakingParameters)
+			var result = {
+				type: "bakeResult",
+				project: alg.project.name(),
+				outputSize: alg.baking.commonBakingParameters().commonParameters.Output_Size,
+				start: Date.now(),
+				materials: []
+			}
+		
+			alg.mapexport.documentStructure().materials.forEach(function(material) {
+				if (bakingParameters.TextureSets && bakingParameters.TextureSets.indexOf(material.name) < 0)
+				{
+					alg.log.info("Unchanged, skipped baking: " + material.name)
+					return
+				}
+				applyBakers(material.name, bakingParameters)
+				var materialResult = {name: material.name, start: Date.now(), error: ""}
+				try
+				{
+					alg.baking.bake(material.name);
+				}
+				catch (e)
+				{
+					materialResult.error = e.toString()
+					alg.log.error("Baking " + material.name + " failed: " + materialResult.error)
+				}
+				materialResult.end = Date.now()
+				result.materials.push(materialResult)
+			});
+		
+			result.end = Date.now()
+			sendToMaya(result)
+			return result
+		}
+		
+		// Live link: reload the mesh into the open project, or create a project if none is open.
+		function loadMesh(message)
+		{
+			var meshUrl = alg.fileIO.localFileToUrl(message.mesh)
+			meshLoad = {mesh: message.mesh, start: Date.now()}
+			// A profile only applies to the mesh it was sent with.
+			activeProfile = null
+			if (message.parameters)
+			{
+				setBakingParameters(message.parameters)
+			}
+			if (message.bakingParameters)
+			{
+				// Baked when the new mesh is done loading.
+				pendingBake = message.bakingParameters
+			}
+			if (!alg.project.isOpen())
+			{
+				// Everything in a new project needs baking.
+				if (pendingBake)
+				{
+					delete pendingBake.TextureSets
+				}
+				logUdimTiles(message.udimTiles)
+				alg.project.create(meshUrl, [], "",
+					{splitMaterialsByUDIM: Boolean(message.splitByUdim)})
+				return
+			}
+			alg.log.info("Reloading mesh from Maya: " + message.mesh)
+			// Reloading is asynchronous; the load is reported once Painter is done computing.
+			alg.project.reload(meshUrl, {})
+			if (message.highpoly.length > 0)
+			{
+				setHighDefinitionMeshes(message.highpoly)
+			}
+		}
+		
+		// Maya works out which UDIM tiles every texture set uses before it
+		// sends a mesh, and only asks for a split when it's needed.
+		function logUdimTiles(udimTiles)
+		{
+			if (!udimTiles)
+			{
+				return
+			}
+			var tileCount = 0
+			for (var textureSet in udimTiles)
+			{
+				tileCount += udimTiles[textureSet].length
+			}
+			alg.log.info("UDIM tiles from Maya: " + tileCount + " tile(s) in " +
+				Object.keys(udimTiles).length + " texture set(s)")
+		}
+		
+		function reportMeshLoaded()
+		{
+			if (!meshLoad)
+			{
+				return
+			}
+			sendToMaya({type: "meshLoaded", mesh: meshLoad.mesh, seconds: (Date.now() - meshLoad.start) / 1000})
+			meshLoad = null
+		}
+		
+		// Creates one project per low/high pair in a manifest sent from Maya,
+		// sets up the highpoly, optionally bakes, and saves it next to the mesh.
+		function processBatchManifest(manifest)
+		{
+			manifest.pairs.forEach(function(pair) {
+				alg.log.info("Creating project for " + pair.name)
+				// Maya decides per pair whether it needs to be split.
+				var splitByUdim = pair.splitByUdim !== undefined ? pair.splitByUdim : manifest.splitByUdim
+				logUdimTiles(pair.udimTiles)
+				alg.project.create(alg.fileIO.localFileToUrl(pair.low), [], "",
+					{splitMaterialsByUDIM: Boolean(splitByUdim)})
+				
+				if (pair.highpoly.length > 0)
+				{
+					setHighDefinitionMeshes(pair.highpoly)
+				}
+				if (manifest.bake)
+				{
+					bake(pair.bakingParameters)
+				}
+				else
+				{
+					applyBakingParameters(pair.bakingParameters)
+				}
+				alg.project.save(alg.fileIO.localFileToUrl(pair.project))
+				alg.project.close()
+			});
+		}
+		
+		// Bakes one job from Maya's bake queue into its own project, saves it, and
+		// reports back so Maya can hand over the next one.
+		function runBakeJob(job)
+		{
+			var start = Date.now()
+			var error = ""
+			// Maya stops the queue instead of failing every job when a project is open.
+			var projectOpen = alg.project.isOpen()
+			try
+			{
+				if (projectOpen)
+				{
+					throw "Another project is open in Painter."
+				}
+				logUdimTiles(job.udimTiles)
+				alg.project.create(alg.fileIO.localFileToUrl(job.low), [], "",
+					{splitMaterialsByUDIM: Boolean(job.splitByUdim)})
+				if (job.highpoly.length > 0)
+				{
+					setHighDefinitionMeshes(job.highpoly)
+				}
+				var failed = bake(job.bakingParameters).materials.filter(function(material) {
+					return material.error
+				})
+				if (failed.length > 0)
+				{
+					error = failed.map(function(material) { return material.name + ": " + material.error }).join(", ")
+				}
+				alg.project.save(alg.fileIO.localFileToUrl(job.project))
+				alg.project.close()
+			}
+			catch (e)
+			{
+				error = e.toString()
+				alg.log.error("Bake job " + job.name + " failed: " + error)
+			}
+			sendToMaya({type: "bakeJobDone", id: job.id, seconds: (Date.now() - start) / 1000, error: error, projectOpen: projectOpen})
+		}
 		
 		onProjectOpened: {
+			reportMeshLoaded()
+			// Parameters Maya sent with the mesh are applied after this, with their profile.
+			activeProfile = null
 			// Checks whether the current project is started from command line arguments.
 			if (alg.project.isOpen() && alg.project.name() == "Untitled") {
 				// Boolean used to enable setting the common baking parameters.
@@ -14,7 +408,8 @@ PainterPlugin {
 				alg.settings.setValue("meshFromMaya", true)
 				
 				var pathToLow = alg.fileIO.urlToLocalFile(alg.project.lastImportedMeshUrl())
-				var pathToHigh = [pathToLow.replace("_low", "_high")]
+				var pathToHigh = pendingHighpoly || [pathToLow.replace("_low", "_high")]
+				pendingHighpoly = null
 
 				alg.project.settings.setValue("highpoly", pathToHigh)
 			}
@@ -28,14 +423,14 @@ PainterPlugin {
 				if (alg.settings.value("meshFromMaya")) 
 				{
 					// Check if the highpoly actually exists.
-					if (alg.fileIO.exists(alg.project.settings.value("highpoly")) && 
-					  alg.project.settings.value("highpoly") != 
-					  alg.fileIO.urlToLocalFile(alg.project.lastImportedMeshUrl())) 
+					var pathToLow = alg.fileIO.urlToLocalFile(alg.project.lastImportedMeshUrl())
+					var highpoly = alg.project.settings.value("highpoly").filter(function(path) {
+						return alg.fileIO.exists(path) && path != pathToLow
+					})
+					if (highpoly.length > 0) 
 				    {
 						// Create the parameters that contain the highpoly meshes.
-						var params = alg.baking.commonBakingParameters()
-						params.detailParameters.High_Definition_Meshes = alg.project.settings.value("highpoly")
-						alg.baking.setCommonBakingParameters(params)
+						setHighDefinitionMeshes(highpoly)
 					} 
 					else 
 					{
@@ -45,89 +440,29 @@ PainterPlugin {
 				}
 			}
 			
-			// Set the baking parameters in Maya.
-			var file = alg.fileIO.open(alg.plugin_root_directory +  "bakingParameters.json", "r")
-			var str = file.readAll()
-			var bakingParameters = JSON.parse(str)
-			file.close()
-			var params = alg.baking.commonBakingParameters()
-			
-			bakingParameters.Output_Size = params.commonParameters.Output_Size
-			bakingParameters.Antialiasing = params.detailParameters.Antialiasing
-			bakingParameters.Average_Normals = params.detailParameters.Average_Normals
-			bakingParameters.Match = params.detailParameters.Match
-			
-			str = JSON.stringify(bakingParameters)
-			file = alg.fileIO.open(alg.plugin_root_directory +  "bakingParameters.json", "w")
-			file.write(str)
-			file.close()
-			alg.settings.setValue("updateBakingParams", false)
-        }
-		
-		onTick: {
-			// Executes every second, waiting for a change in shouldBake.json. Not a pretty solution, but it works.
-			var file = alg.fileIO.open(alg.plugin_root_directory +  "shouldBake.json", "r")
-			var str = file.readAll()
-			var shouldBakeObject = JSON.parse(str)
-			file.close()
+			// Tell Maya a reloaded mesh is done loading.
+			if (!isComputing && alg.project.isOpen())
+			{
+				reportMeshLoaded()
+			}
 			
-			// I need to do this through a separate file, because SP settings don't update when they are updated externally,
-			// say, from a Python script in Maya...
-			if ( !shouldBakeObject.shouldBake && alg.settings.value("updateBakingParams") )
-			{
-				alg.settings.setValue("updateBakingParams", false)
-				// Get the desired baking parameters from Maya.
-				file = alg.fileIO.open(alg.plugin_root_directory +  "bakingParameters.json", "r")
-				str = file.readAll()
-				var bakingParameters = JSON.parse(str)
-				file.close()
-				try
-				{
-					var params = alg.baking.commonBakingParameters()
-				} 
-				catch (e)
-				{
-					return
-				}
-				
-				bakingParameters.Output_Size = params.commonParameters.Output_Size
-				bakingParameters.Antialiasing = params.detailParameters.Antialiasing
-				bakingParameters.Average_Normals = params.detailParameters.Average_Normals
-				bakingParameters.Match = params.detailParameters.Match
-				
-				str = JSON.stringify(bakingParameters)
-				file = alg.fileIO.open(alg.plugin_root_directory +  "bakingParameters.json", "w")
-				file.write(str)
-				file.close()
-
+			// Apply the parameters Maya sent while the project was loading.
+			if (!isComputing && pendingParameters && alg.project.isOpen())
+			{
+				applyBakingParameters(pendingParameters)
+				pendingParameters = null
 			}
-			if ( shouldBakeObject.shouldBake )
+			
+			// Run a bake that Maya requested while the project was loading.
+			if (!isComputing && pendingBake && alg.project.isOpen())
 			{
-				file = alg.fileIO.open(alg.plugin_root_directory +  "bakingParameters.json", "r")
-				str = file.readAll()
-				var bakingParameters = JSON.parse(str)
-				file.close()
-				var params = alg.baking.commonBakingParameters()
-				
-				params.commonParameters.Output_Size = bakingParameters.Output_Size
-				params.detailParameters.Antialiasing = bakingParameters.Antialiasing
-				params.detailParameters.Average_Normals = bakingParameters.Average_Normals
-				params.detailParameters.Match = bakingParameters.Match
-				
-				alg.baking.setCommonBakingParameters(params)
-				
-				// Bake all maps on each texture set of the document
-				alg.mapexport.documentStructure().materials.forEach(function(material) {
-					alg.baking.bake(material.name);
-				});
-				
-				shouldBakeObject.shouldBake = 0
-				str = JSON.stringify(shouldBakeObject)
-				file = alg.fileIO.open(alg.plugin_root_directory +  "shouldBake.json", "w")
-				file.write(str)
-				file.close()
-				alg.settings.setValue("updateBakingParams", true)
+				var requestedParameters = pendingBake
+				pendingBake = null
+				bake(requestedParameters)
+				return
 			}
-		}
+			
+			// Set the baking parameters in Maya.
+			sendBakingParameters()
+        }
 }
-
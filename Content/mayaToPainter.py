@@ -5,91 +5,1298 @@ Copyright (c) 2023 Viktor Pramberg <hi@viktorpramberg.com>
 """
 
 import os
+import re
 import sys
+import csv
+import copy
+import ctypes
 import json
+import time
+import bisect
+import hashlib
+import cProfile
+import functools
+import contextlib
 import subprocess
 import tempfile
+import threading
 import shutil
+import uuid
+import importlib
 import webbrowser
-import pymel.core as pm
+import concurrent.futures
+from array import array
+import maya.cmds as cmds
+import maya.mel
+import maya.api.OpenMaya as om2
+import maya.OpenMaya as om1
+import maya.utils
 import maya.OpenMayaMPx as OpenMayaMPx
 
+# Optional, but makes finding processes faster when it's installed.
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Optional, but makes splitting large highpolys into chunks and finding UDIM
+# tiles faster. The pre-flight checks only run when it's installed.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Stands in for a module that is only imported the first time one of its
+# attributes is used.
+class LazyModule(object):
+
+    def __init__(self, aName):
+        self.moduleName = aName
+        self.loadedModule = None
+
+    def __getattr__(self, aAttribute):
+        if self.loadedModule is None:
+            self.loadedModule = importlib.import_module(self.moduleName)
+        return getattr(self.loadedModule, aAttribute)
+
+
+# The parts that don't need Maya are in the mayaToPainterCore package, next
+# to this file.
+pluginDirectory = os.path.dirname(os.path.abspath(__file__))
+if pluginDirectory not in sys.path:
+    sys.path.insert(0, pluginDirectory)
+from mayaToPainterCore.fingerprint import (combineFingerprints,
+                                           computeFingerprint,
+                                           computeMeshFingerprint)
+from mayaToPainterCore.backgroundExport import (BackgroundExporter,
+                                                getMayapyPath,
+                                                getSnapshotPath)
+from mayaToPainterCore.painterLink import PainterLink
+from mayaToPainterCore.preflight import (findBoundsMismatch,
+                                         findNonManifoldEdges,
+                                         findOverlappingUVs,
+                                         findZeroAreaFaces,
+                                         formatComponents)
+
+# pymel takes seconds to import, so it's only used by the options window and
+# the dialogs, and left until one of them is first opened. Sends and exports
+# only use maya.cmds.
+pm = LazyModule("pymel.core")
+
 cmdName = 'mayaToPainter'
 version = "1.1.0"
 
+defaultPainterPath = R"C:\Program Files\Adobe\Adobe Substance 3D Painter\Adobe Substance 3D Painter.exe"
+
 # ---------------------------------------------------------------------- #
 # Create environment variables for everything if they don't already exist.
+# This is done the first time the plugin is used rather than when it's
+# loaded, since it can bring up a file dialog.
 # ---------------------------------------------------------------------- #
 
-# The export directory, which is set to a folder named "mayaToPainter" in the
-# user's temp folder.
-if "mayaToPainterExportDirectory" not in pm.env.optionVars:
-    pm.optionVar["mayaToPainterExportDirectory"] = os.path.join(
-        tempfile.gettempdir(), "mayaToPainter")
+optionsState = {"initialized": False}
 
-defaultPainterPath = R"C:\Program Files\Adobe\Adobe Substance 3D Painter\Adobe Substance 3D Painter.exe"
 
-# Get the path to the Substance Painter executable.
-if ("mayaToPainterSPDirectory" not in pm.env.optionVars and
-        not os.path.isfile(defaultPainterPath)):
-    # Bring up a file dialog if the user doesn't have a normal installation
-    # of Painter.
-    ret = pm.fileDialog2(dir="C:\\",
-                         cap="Select path to Substance Painter",
-                         fileMode=1)[0]
-    pm.optionVar(sv=("mayaToPainterSPDirectory", ret))
-
-elif ("mayaToPainterSPDirectory" not in pm.env.optionVars and
-        os.path.isfile(defaultPainterPath)):
-    pm.optionVar["mayaToPainterSPDirectory"] = defaultPainterPath
+def initializeOptions():
+    if optionsState["initialized"]:
+        return
+    optionsState["initialized"] = True
+
+    # The export directory, which is set to a folder named "mayaToPainter" in
+    # the user's temp folder.
+    if not cmds.optionVar(exists="mayaToPainterExportDirectory"):
+        cmds.optionVar(sv=("mayaToPainterExportDirectory", os.path.join(
+            tempfile.gettempdir(), "mayaToPainter")))
+
+    # Get the path to the Substance Painter executable.
+    if (not cmds.optionVar(exists="mayaToPainterSPDirectory") and
+            not os.path.isfile(defaultPainterPath) and
+            not cmds.about(batch=True)):
+        # Bring up a file dialog if the user doesn't have a normal
+        # installation of Painter.
+        ret = cmds.fileDialog2(dir="C:\\",
+                               cap="Select path to Substance Painter",
+                               fileMode=1)
+        if ret:
+            cmds.optionVar(sv=("mayaToPainterSPDirectory", ret[0]))
+
+    elif (not cmds.optionVar(exists="mayaToPainterSPDirectory") and
+            os.path.isfile(defaultPainterPath)):
+        cmds.optionVar(sv=("mayaToPainterSPDirectory", defaultPainterPath))
+
+    # Holds the settings for Split by UDIMs
+    if not cmds.optionVar(exists="mayaToPainterSplitByUDIMs"):
+        cmds.optionVar(iv=("mayaToPainterSplitByUDIMs", 0))
+
+    # When this is true Substance Painter will bake the current project
+    if not cmds.optionVar(exists="mayaToPainterShouldBake"):
+        cmds.optionVar(iv=("mayaToPainterShouldBake", 0))
+
+    # When this is true Substance Painter will bake the current project
+    if not cmds.optionVar(exists="mayaToPainterSameWidthHeight"):
+        cmds.optionVar(iv=("mayaToPainterSameWidthHeight", 1))
+
+    # When this is true FBX files are written by mayapy processes in the
+    # background, instead of on Maya's main thread.
+    if not cmds.optionVar(exists="mayaToPainterBackgroundExport"):
+        cmds.optionVar(iv=("mayaToPainterBackgroundExport", 0))
+
+    # When this is true meshes are loaded into an already running Painter
+    # through the Painter plugin, instead of starting a new instance.
+    if not cmds.optionVar(exists="mayaToPainterLiveLink"):
+        cmds.optionVar(iv=("mayaToPainterLiveLink", 0))
+
+    # When this is true a Painter instance is started when the plugin is
+    # loaded, so the first send only has to load the mesh.
+    if not cmds.optionVar(exists="mayaToPainterPrewarm"):
+        cmds.optionVar(iv=("mayaToPainterPrewarm", 0))
+
+    # The most disk space, in MB, that exported files may use before the
+    # least recently sent ones are removed. 0 means no limit.
+    if not cmds.optionVar(exists="mayaToPainterDiskBudgetMB"):
+        cmds.optionVar(iv=("mayaToPainterDiskBudgetMB", 0))
+
+    # Highpolys with more faces than this are exported as several spatial
+    # chunks instead of one file. 0 means they are never split.
+    if not cmds.optionVar(exists="mayaToPainterHighPolyChunkFaces"):
+        cmds.optionVar(iv=("mayaToPainterHighPolyChunkFaces", 0))
+
+    # The file format meshes are written in, one of the keys in
+    # exportFormats.
+    if not cmds.optionVar(exists="mayaToPainterExportFormat"):
+        cmds.optionVar(sv=("mayaToPainterExportFormat", "fbx"))
+
+    # When this is true objects that have been sent are watched, and exported
+    # again when they change.
+    if not cmds.optionVar(exists="mayaToPainterWatch"):
+        cmds.optionVar(iv=("mayaToPainterWatch", 0))
+
+    # When this is true, bakes requested for a mesh Painter already has only
+    # bake the texture sets that changed since the last send.
+    if not cmds.optionVar(exists="mayaToPainterBakeChangedOnly"):
+        cmds.optionVar(iv=("mayaToPainterBakeChangedOnly", 0))
+
+    # When this is true highpolys are sent as decimated proxies, for quicker
+    # iterations, instead of the full mesh.
+    if not cmds.optionVar(exists="mayaToPainterIterationQuality"):
+        cmds.optionVar(iv=("mayaToPainterIterationQuality", 0))
+
+    # The percentage of faces that are removed from highpoly proxies.
+    if not cmds.optionVar(exists="mayaToPainterProxyReduction"):
+        cmds.optionVar(iv=("mayaToPainterProxyReduction", 90))
+
+    # When this is true meshes are checked for problems that break bakes
+    # before they're exported.
+    if not cmds.optionVar(exists="mayaToPainterPreflight"):
+        cmds.optionVar(iv=("mayaToPainterPreflight", 1))
+
+
+# The value of the optionVar aName, or aDefault if it isn't set. The Painter
+# path is missing when its prompt was cancelled, or in batch mode.
+def getOption(aName, aDefault=None):
+    if not cmds.optionVar(exists=aName):
+        return aDefault
+    return cmds.optionVar(q=aName)
+
+
+# Set the optionVar aName to aValue, as a string, float or int optionVar
+# depending on its type. A value of None removes it.
+def setOption(aName, aValue):
+    if aValue is None:
+        cmds.optionVar(remove=aName)
+    elif isinstance(aValue, str):
+        cmds.optionVar(sv=(aName, aValue))
+    elif isinstance(aValue, float):
+        cmds.optionVar(fv=(aName, aValue))
+    else:
+        cmds.optionVar(iv=(aName, int(aValue)))
+
+
+# Function for adding files that are exported to the registry, so
+# they can be deleted later, if the user wants to.
+def addObjectToList(aObj, aSources=None, aFingerprint=None,
+                    aMaterialName=None):
+    return getExportRegistry().add(aObj, aSources, aFingerprint,
+                                   aMaterialName=aMaterialName)
+
 
-# Initialize the list that all exported files are added to.
-if "mayaToPainterExportedFiles" not in pm.env.optionVars:
-    pm.optionVar(sva=("mayaToPainterExportedFiles", ""))
-    pm.optionVar(ca="mayaToPainterExportedFiles")
+# ---------------------------------------------------------------------- #
+# Send timings. Every send records how long each stage took, together with
+# object, vertex and byte counts, as one JSON line in
+# mayaToPainterTimings.jsonl in the export directory.
+# ---------------------------------------------------------------------- #
 
-# Holds the settings for Split by UDIMs
-if "mayaToPainterSplitByUDIMs" not in pm.env.optionVars:
-    pm.optionVar(iv=("mayaToPainterSplitByUDIMs", 0))
+timingLogName = "mayaToPainterTimings.jsonl"
+
+# The send that is running: its timing, and its export report, which keeps
+# track of which files were written and which were skipped, so it can be
+# reported when the send is done. Every send starts with new ones, and a
+# send that finishes in the background takes its own along, see
+# runPendingExports, so they aren't mixed up with the next send's.
+currentSend = {"timing": None, "report": {"exported": [], "skipped": []}}
+
+
+def beginSendTiming(aKind):
+    currentSend["timing"] = {"kind": aKind,
+                             "start": time.time(),
+                             "stages": {},
+                             "objects": 0,
+                             "vertices": 0,
+                             "bytesWritten": 0,
+                             "filesExported": 0,
+                             "filesSkipped": 0}
+    currentSend["report"] = {"exported": [], "skipped": []}
+
+
+# Make aSend, as taken from currentSend, the running send for the block, and
+# put back the one that was running before.
+@contextlib.contextmanager
+def resumedSend(aSend):
+    previous = dict(currentSend)
+    currentSend.update(aSend)
+    try:
+        yield
+    finally:
+        currentSend.update(previous)
 
-# When this is true Substance Painter will bake the current project
-if "mayaToPainterShouldBake" not in pm.env.optionVars:
-    pm.optionVar(iv=("mayaToPainterShouldBake", 0))
 
-# When this is true Substance Painter will bake the current project
-if "mayaToPainterSameWidthHeight" not in pm.env.optionVars:
-    pm.optionVar(iv=("mayaToPainterSameWidthHeight", True))
+# Add the time spent in the block to aName. Stages that run more than once
+# during a send are summed. Does nothing if no send is being timed.
+@contextlib.contextmanager
+def timeStage(aName):
+    start = time.time()
+    try:
+        yield
+    finally:
+        addStageTime(aName, time.time() - start)
+
+
+def addStageTime(aName, aSeconds):
+    timing = currentSend["timing"]
+    if timing is not None:
+        timing["stages"][aName] = timing["stages"].get(aName, 0.0) + aSeconds
+
+
+def countTiming(**aCounts):
+    timing = currentSend["timing"]
+    if timing is not None:
+        for key, value in aCounts.items():
+            timing[key] += value
+
+
+# Drop the timing of aTiming's send without writing it, if it's still open.
+def discardSendTiming(aTiming):
+    if currentSend["timing"] is aTiming:
+        currentSend["timing"] = None
+
+
+# Times every call of the decorated send as aKind. A send that is done when
+# it returns closes its timing with endSendTiming, and one that hands files
+# to the background exporter takes its timing along to runPendingExports. If
+# it returns early or fails instead, the timing is dropped, so it isn't left
+# open for the next send.
+def timedSend(aKind):
+    def decorate(aFunction):
+        @functools.wraps(aFunction)
+        def wrapper(*args, **kwargs):
+            beginSendTiming(aKind)
+            timing = currentSend["timing"]
+            try:
+                return aFunction(*args, **kwargs)
+            finally:
+                discardSendTiming(timing)
+        return wrapper
+    return decorate
+
+
+# The time spent waiting for the user is logged as the userPrompt stage,
+# but isn't part of totalSeconds.
+def endSendTiming():
+    timing = currentSend["timing"]
+    currentSend["timing"] = None
+    if timing is None:
+        return
+    timing["totalSeconds"] = (time.time() - timing.pop("start") -
+                              timing["stages"].get("userPrompt", 0.0))
+    timing["timestamp"] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    timing["mayaVersion"] = cmds.about(version=True)
+    timing["pluginVersion"] = version
+    writeTimingLine(timing)
 
 
-# Function for adding files that are exported to a variable, so
-# they can be deleted later, if the user wants to.
-def addObjectToList(aObj):
-    for obj in pm.optionVar["mayaToPainterExportedFiles"]:
-        if aObj in obj:
-            return
-    pm.optionVar(sva=("mayaToPainterExportedFiles", aObj))
+def writeTimingLine(aTiming):
+    logPath = os.path.join(getOption("mayaToPainterExportDirectory"),
+                           timingLogName)
+    try:
+        with open(logPath, 'a') as logFile:
+            logFile.write(json.dumps(aTiming) + '\n')
+    except (IOError, OSError):
+        pass
+
+
+# Painter reports how long it took to load a mesh that was sent through the
+# link. It's logged with the format and size of the file, so formats can be
+# compared on real scenes.
+def onMeshLoaded(aMessage):
+    mesh = aMessage["mesh"]
+    writeTimingLine({"kind": "painterImport",
+                     "mesh": mesh,
+                     "format": os.path.splitext(mesh)[1].lstrip("."),
+                     "bytes": (os.path.getsize(mesh)
+                               if os.path.isfile(mesh) else 0),
+                     "totalSeconds": aMessage["seconds"],
+                     "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     "pluginVersion": version})
+    print('Painter loaded %s in %.2fs.' % (os.path.basename(mesh),
+                                            aMessage["seconds"]))
+
+
+# Run a single send under cProfile, and dump the stats next to the exports.
+# Background exports are only profiled up to the point where they are
+# handed to the workers.
+def profileSendToPainter():
+    initializeOptions()
+    profilePath = os.path.join(getOption("mayaToPainterExportDirectory"),
+                               "mayaToPainterSend.prof")
+    profiler = cProfile.Profile()
+    profiler.runcall(sendToPainter)
+    profiler.dump_stats(profilePath)
+    print('Profile written to ' + profilePath)
+
+
+# ---------------------------------------------------------------------- #
+# Export registry. Every exported file is indexed by its path in
+# mayaToPainterExports.json in the export directory, with its role, size,
+# mtime, the objects it was exported from, and a fingerprint of their
+# geometry, so unchanged meshes aren't written again.
+# ---------------------------------------------------------------------- #
+
+exportRegistryName = "mayaToPainterExports.json"
+
+
+# A file is a lowpoly or highpoly if its name ends in "_low" or "_high",
+# optionally followed by the suffix of a highpoly chunk or proxy. Names that
+# only contain them, like "flow_lowres", are other files.
+exportRolePattern = re.compile(r'_(low|high)(?:_part\d+|_proxy)?$')
+
+
+def getExportRole(aPath):
+    match = exportRolePattern.search(
+        os.path.splitext(os.path.basename(aPath))[0])
+    return match.group(1) if match else "other"
+
+
+# An object is a lowpoly or highpoly if its name ends in "_low" or "_high".
+def getObjectRole(aObj):
+    name = str(aObj).split("|")[-1]
+    for role in ("low", "high"):
+        if name.endswith("_" + role):
+            return role
+    return "other"
+
+
+class ExportRegistry(object):
+
+    def __init__(self, aPath, aDispatch=maya.utils.executeDeferred):
+        self.store = JsonStateStore(aPath, {"files": {}}, aDispatch)
+
+    def files(self):
+        return self.store.load()["files"]
+
+    def get(self, aPath):
+        return self.files().get(aPath)
+
+    # All registered paths, or only the ones with one of aRoles.
+    def paths(self, aRoles=None):
+        return [path for path, entry in self.files().items()
+                if aRoles is None or entry["role"] in aRoles]
+
+    # Add or refresh the entry for an exported file. The sources and
+    # fingerprint of an existing entry are kept unless new ones are given.
+    # aChunkOf is the highpoly file a chunk was split from, aProxyOf the one a
+    # proxy stands in for, and aMaterialName the texture set name the file
+    # was exported with.
+    def add(self, aPath, aSources=None, aFingerprint=None, aChunkOf=None,
+            aMaterialName=None, aProxyOf=None):
+        entry = self.files().setdefault(aPath, {"role": getExportRole(aPath),
+                                                "sources": [],
+                                                "fingerprint": None})
+        if aSources is not None:
+            entry["sources"] = [str(source) for source in aSources]
+        if aFingerprint is not None:
+            entry["fingerprint"] = aFingerprint
+        if aChunkOf is not None:
+            entry["chunkOf"] = aChunkOf
+        if aProxyOf is not None:
+            entry["proxyOf"] = aProxyOf
+        if aMaterialName is not None:
+            entry["materialName"] = aMaterialName
+        if os.path.isfile(aPath):
+            entry["size"] = os.path.getsize(aPath)
+            entry["mtime"] = os.path.getmtime(aPath)
+        entry["sent"] = time.time()
+        self.store.update({})
+        return entry
+
+    # Drop aPaths from the registry, and delete them and the assbin files
+    # Painter created for them in the background.
+    def remove(self, aPaths):
+        files = self.files()
+        for path in aPaths:
+            files.pop(path, None)
+        self.store.update({})
+        deleteFilesInBackground(aPaths)
+
+    # The chunks aPath was split into, in order.
+    def chunks(self, aPath):
+        return sorted(path for path, entry in self.files().items()
+                      if entry.get("chunkOf") == aPath)
+
+    # Drop entries for files that no longer exist.
+    def prune(self):
+        files = self.files()
+        missing = [path for path in files if not os.path.isfile(path)]
+        for path in missing:
+            del files[path]
+        if missing:
+            self.store.update({})
+        return missing
+
+
+# ---------------------------------------------------------------------- #
+# Cleanup. Files are deleted on a thread pool so large exports don't stall
+# Maya, and the export directory is kept within the disk budget by removing
+# the least recently sent exports first.
+# ---------------------------------------------------------------------- #
+
+# The thread pool files are deleted on, and the deletes that haven't
+# finished yet, by filename.
+cleanupPool = {"executor": None, "pending": {}, "lock": threading.Lock()}
+
+
+def getAssbinPath(aPath):
+    return os.path.splitext(aPath)[0] + ".assbin"
+
+
+# Returns the number of bytes freed.
+def deleteFile(aFilename):
+    try:
+        size = os.path.getsize(aFilename)
+        os.remove(aFilename)
+        return size
+    except OSError:
+        return 0
+
+
+# Delete aPaths and their assbin files, and print a summary on the main
+# thread when done.
+def deleteFilesInBackground(aPaths, aDispatch=maya.utils.executeDeferred):
+    filenames = []
+    for path in aPaths:
+        filenames.extend((path, getAssbinPath(path)))
+    if not filenames:
+        return
+    if cleanupPool["executor"] is None:
+        cleanupPool["executor"] = concurrent.futures.ThreadPoolExecutor(4)
+
+    lock = threading.Lock()
+    progress = {"remaining": len(filenames), "files": 0, "bytes": 0}
+
+    def onDeleted(aFuture):
+        freed = 0 if aFuture.cancelled() else aFuture.result()
+        with lock:
+            progress["remaining"] -= 1
+            if freed:
+                progress["files"] += 1
+                progress["bytes"] += freed
+            done = progress["remaining"] == 0
+        if done:
+            aDispatch(printCleanupSummary, progress["files"], progress["bytes"])
+
+    pending = cleanupPool["pending"]
+
+    def onFinished(aFilename, aFuture):
+        with cleanupPool["lock"]:
+            if pending.get(aFilename) is aFuture:
+                del pending[aFilename]
+        onDeleted(aFuture)
+
+    for filename in filenames:
+        future = cleanupPool["executor"].submit(deleteFile, filename)
+        with cleanupPool["lock"]:
+            pending[filename] = future
+        future.add_done_callback(functools.partial(onFinished, filename))
+
+
+# Called before aFilename is written, so a background delete of an earlier
+# export with the same name can't remove the new file. A delete that hasn't
+# started yet is cancelled, and one that has is waited for.
+def keepExportPath(aFilename):
+    with cleanupPool["lock"]:
+        future = cleanupPool["pending"].get(aFilename)
+    if future is not None and not future.cancel():
+        concurrent.futures.wait([future])
+
+
+# Wait until the background deletes of aFilenames, or of every file if
+# aFilenames isn't given, are done.
+def waitForCleanup(aFilenames=None):
+    pending = cleanupPool["pending"]
+    with cleanupPool["lock"]:
+        if aFilenames is None:
+            futures = list(pending.values())
+        else:
+            futures = [pending[filename] for filename in aFilenames
+                       if filename in pending]
+    concurrent.futures.wait(futures)
+
+
+def printCleanupSummary(aFiles, aBytes):
+    print('Removed %d file(s), %.1f MB freed.' %
+          (aFiles, aBytes / (1024.0 * 1024.0)))
+
+
+# Remove the least recently sent exports until the export directory is
+# within the disk budget. Files in aKeep are never removed.
+def enforceDiskBudget(aKeep=()):
+    budget = getOption("mayaToPainterDiskBudgetMB", 0) * 1024 * 1024
+    if budget <= 0:
+        return
+    registry = getExportRegistry()
+
+    usage = {}
+    for path, entry in registry.files().items():
+        assbin = getAssbinPath(path)
+        usage[path] = entry.get("size", 0) + (os.path.getsize(assbin)
+                                              if os.path.isfile(assbin)
+                                              else 0)
+    total = sum(usage.values())
+
+    evict = []
+    for path, entry in sorted(registry.files().items(),
+                              key=lambda item: item[1].get("sent", 0)):
+        if total <= budget:
+            break
+        if path in aKeep:
+            continue
+        total -= usage[path]
+        evict.append(path)
+    if evict:
+        print('Export directory is over its disk budget, removing %d least '
+              'recently sent file(s).' % len(evict))
+        registry.remove(evict)
+
+
+exportRegistries = {}
+
+
+# The registry of the current export directory. Files that were listed in
+# the old mayaToPainterExportedFiles optionVar are moved into it.
+def getExportRegistry():
+    exportDir = getOption("mayaToPainterExportDirectory")
+    if exportDir not in exportRegistries:
+        exportRegistries[exportDir] = ExportRegistry(
+            os.path.join(exportDir, exportRegistryName))
+        exportRegistries[exportDir].prune()
+    registry = exportRegistries[exportDir]
+
+    if cmds.optionVar(exists="mayaToPainterExportedFiles"):
+        for path in getOption("mayaToPainterExportedFiles") or []:
+            if path and os.path.isfile(path):
+                registry.add(path)
+        cmds.optionVar(remove="mayaToPainterExportedFiles")
+    return registry
+
+
+# The object space points of aShape as a flat array of 32 bit floats, copied
+# in one go from the buffer Maya keeps them in, instead of a point at a time.
+# Falls back to the points of aFnMesh if the buffer can't be read.
+def getRawPoints(aShape, aFnMesh):
+    points = array("f")
+    try:
+        selectionList = om1.MSelectionList()
+        selectionList.add(aShape)
+        dagPath = om1.MDagPath()
+        selectionList.getDagPath(0, dagPath)
+        fnMesh = om1.MFnMesh(dagPath)
+        count = fnMesh.numVertices() * 3
+        if count:
+            points.frombytes(ctypes.string_at(int(fnMesh.getRawPoints()),
+                                              count * 4))
+        return points
+    except (RuntimeError, TypeError, ValueError):
+        pass
+    if numpy is not None:
+        return numpy.array(aFnMesh.getPoints(om2.MSpace.kObject),
+                           dtype=numpy.float32)[:, :3].ravel()
+    for point in aFnMesh.getPoints(om2.MSpace.kObject):
+        points.extend((point.x, point.y, point.z))
+    return points
+
+
+# Mesh data read during a send, by the long path of its shape, so the
+# pre-flight checks, the fingerprints and the chunks read every mesh once.
+# "meshes" is None outside a send.
+meshCache = {"meshes": None}
+
+
+# Cache the mesh data read while the decorated send runs. A send started
+# from another one uses the cache of the outer send.
+def cachesMeshData(aFunction):
+    @functools.wraps(aFunction)
+    def wrapper(*args, **kwargs):
+        if meshCache["meshes"] is not None:
+            return aFunction(*args, **kwargs)
+        meshCache["meshes"] = {}
+        try:
+            return aFunction(*args, **kwargs)
+        finally:
+            meshCache["meshes"] = None
+    return wrapper
+
+
+# Drop aMeshes from the cache once they're exported, so a send of many
+# objects doesn't keep all of them in memory.
+def releaseMeshData(aMeshes):
+    if meshCache["meshes"] is not None:
+        for mesh in aMeshes:
+            meshCache["meshes"].pop(mesh["name"], None)
+
+
+# Collect the mesh data used by computeFingerprint from all meshes in (or
+# under) aObjects. "uvCounts" and "textureSets" are only used for UDIM tiles
+# and texture set fingerprints. Everything is read into arrays in bulk.
+def getMeshData(aObjects):
+    meshes = []
+    shapes = cmds.ls([str(obj) for obj in aObjects],
+                     dag=True,
+                     type="mesh",
+                     noIntermediate=True,
+                     long=True) or []
+    cache = meshCache["meshes"]
+    for shape in shapes:
+        if cache is not None and shape in cache:
+            meshes.append(cache[shape])
+            continue
+        selectionList = om2.MSelectionList()
+        selectionList.add(shape)
+        dagPath = selectionList.getDagPath(0)
+        fnMesh = om2.MFnMesh(dagPath)
+
+        counts, indices = fnMesh.getVertices()
+        us, vs = fnMesh.getUVs()
+        uvs = array("f", us)
+        uvs.extend(vs)
+        uvCounts, uvIndices = fnMesh.getAssignedUVs()
+        shaders, faceMaterials = fnMesh.getConnectedShaders(
+            dagPath.instanceNumber())
+        transform = cmds.listRelatives(shape, parent=True, fullPath=True)[0]
+        shadingGroups = [om2.MFnDependencyNode(sg).name() for sg in shaders]
+
+        mesh = {
+            "name": shape,
+            "points": getRawPoints(shape, fnMesh),
+            "counts": array("i", counts),
+            "indices": array("i", indices),
+            "uvs": uvs,
+            "uvCounts": array("i", uvCounts),
+            "uvIndices": array("i", uvIndices),
+            "matrix": cmds.xform(transform, q=True, ws=True, m=True),
+            "materials": shadingGroups,
+            "faceMaterials": array("i", faceMaterials),
+            # Painter names texture sets after the surface shaders.
+            "textureSets": [(cmds.listConnections(sg + '.surfaceShader',
+                                                  source=True,
+                                                  destination=False) or
+                             [sg])[0] for sg in shadingGroups],
+        }
+        if cache is not None:
+            cache[shape] = mesh
+        meshes.append(mesh)
+    return meshes
+
+
+# A fingerprint per texture set, made from aMeshFingerprints, the
+# fingerprints of aMeshes, so a texture set changes when any of its meshes
+# do.
+def computeTextureSetFingerprints(aMeshes, aMeshFingerprints):
+    meshFingerprints = {}
+    for mesh, meshFingerprint in zip(aMeshes, aMeshFingerprints):
+        for textureSet in mesh["textureSets"]:
+            meshFingerprints.setdefault(textureSet, []).append(
+                meshFingerprint)
+    return dict((textureSet, combineFingerprints(fingerprints))
+                for textureSet, fingerprints in meshFingerprints.items())
+
+
+# Keep the texture set fingerprints of an export in its registry entry,
+# together with the texture sets that changed since the previous export.
+def recordTextureSets(aEntry, aTextureSets):
+    if aTextureSets is None:
+        return
+    previous = aEntry.get("textureSets") or {}
+    aEntry["changedTextureSets"] = sorted(
+        textureSet for textureSet, fingerprint in aTextureSets.items()
+        if previous.get(textureSet) != fingerprint)
+    aEntry["textureSets"] = aTextureSets
+    getExportRegistry().store.update({})
+
+
+# The texture sets that need baking after a send of aPainterObj, or None if
+# everything should be baked. A changed highpoly can affect every texture
+# set, and so can files without texture set fingerprints.
+def getChangedTextureSets(aPainterObj, aExported):
+    if not getOption("mayaToPainterBakeChangedOnly"):
+        return None
+    if any(path in aExported for path in getHighpolyPaths(aPainterObj)):
+        return None
+    if aPainterObj not in aExported:
+        return []
+    entry = getExportRegistry().get(aPainterObj)
+    return entry.get("changedTextureSets") if entry else None
+
+
+# A file is up to date if it was exported from the same fingerprint, and
+# hasn't been touched by anything else since.
+def isExportUpToDate(aEntry, aFilename, aFingerprint):
+    if not aEntry or not os.path.isfile(aFilename):
+        return False
+    return (aEntry["fingerprint"] == aFingerprint and
+            aEntry.get("size") == os.path.getsize(aFilename) and
+            aEntry.get("mtime") == os.path.getmtime(aFilename))
+
+
+# Print and clear the report. Returns every file that was part of the send.
+def printExportReport():
+    report = currentSend["report"]
+    for filename in report["skipped"]:
+        print('Unchanged, skipped export: ' + filename)
+    for filename in report["exported"]:
+        print('Exported: ' + filename)
+    currentSend["report"] = {"exported": [], "skipped": []}
+    return report["exported"] + report["skipped"]
+
+
+# ---------------------------------------------------------------------- #
+# UDIM tiles. With Split by UDIM on, the tile of every face is worked out
+# from its UVs when it's exported, and Painter is told the tile layout with
+# the mesh. Meshes that stay in 1001 aren't split by Painter at all, and Bake
+# Changed Only compares every tile of a texture set on its own, so only the
+# tiles that changed are baked again. Uses numpy when it's installed.
+# ---------------------------------------------------------------------- #
+
+# The UDIM tile of every face, from the center of its UVs. aUVs holds all U
+# values followed by all V values, and aUVCounts and aUVIndices are the UVs
+# of every face, as returned by MFnMesh.getAssignedUVs. Faces without UVs
+# are in 1001.
+def computeFaceTiles(aUVs, aUVCounts, aUVIndices):
+    half = len(aUVs) // 2
+    if numpy is not None:
+        uvs = numpy.asarray(aUVs, dtype=numpy.float64)
+        counts = numpy.asarray(aUVCounts, dtype=numpy.int64)
+        indices = numpy.asarray(aUVIndices, dtype=numpy.int64)
+        faces = numpy.repeat(numpy.arange(len(counts)), counts)
+        divisor = numpy.maximum(counts, 1)
+        us = numpy.bincount(faces, uvs[indices], len(counts)) / divisor
+        vs = numpy.bincount(faces, uvs[half + indices], len(counts)) / divisor
+        tiles = (1001 + numpy.clip(numpy.floor(us), 0, 9) +
+                 10 * numpy.maximum(numpy.floor(vs), 0)).astype(numpy.int64)
+        tiles[counts == 0] = 1001
+        return tiles.tolist()
+
+    uvIndices = list(aUVIndices)
+    tiles = []
+    offset = 0
+    for count in aUVCounts:
+        faceIndices = uvIndices[offset:offset + count]
+        offset += count
+        if count == 0:
+            tiles.append(1001)
+            continue
+        u = sum(aUVs[i] for i in faceIndices) / float(count)
+        v = sum(aUVs[half + i] for i in faceIndices) / float(count)
+        tiles.append(1001 + min(max(int(u // 1), 0), 9) +
+                     10 * max(int(v // 1), 0))
+    return tiles
+
+
+# The faces of aMesh grouped by texture set and tile, as
+# {(textureSet, tile): [faces]}. Faces without a material are left out.
+def groupFacesByTile(aMesh, aTiles):
+    groups = {}
+    if numpy is not None and len(aTiles):
+        keys = (numpy.asarray(aMesh["faceMaterials"], dtype=numpy.int64) *
+                100000 + numpy.asarray(aTiles, dtype=numpy.int64))
+        order = numpy.argsort(keys, kind='stable')
+        uniqueKeys, starts = numpy.unique(keys[order], return_index=True)
+        for key, faces in zip(uniqueKeys.tolist(),
+                              numpy.split(order, starts[1:])):
+            material, tile = divmod(key, 100000)
+            if material >= 0:
+                groups.setdefault((aMesh["textureSets"][material], tile),
+                                  []).extend(faces.tolist())
+        return groups
+
+    for face, (material, tile) in enumerate(zip(aMesh["faceMaterials"],
+                                                aTiles)):
+        if material >= 0:
+            groups.setdefault((aMesh["textureSets"][material], tile),
+                              []).append(face)
+    return groups
+
+
+# The face counts, points and UVs of the given faces of aMesh, as bytes for
+# a fingerprint. Both paths give the same bytes.
+def getFaceBytes(aMesh, aFaces):
+    half = len(aMesh["uvs"]) // 2
+    if numpy is not None:
+        counts = numpy.asarray(aMesh["counts"], dtype=numpy.int64)
+        selected = numpy.zeros(len(counts), dtype=bool)
+        selected[numpy.asarray(aFaces, dtype=numpy.int64)] = True
+        points = numpy.asarray(aMesh["points"],
+                               dtype=numpy.float32).reshape(-1, 3)
+        indices = numpy.asarray(aMesh["indices"], dtype=numpy.int64)
+        uvs = numpy.asarray(aMesh["uvs"], dtype=numpy.float64)
+        uvIndices = numpy.asarray(aMesh["uvIndices"], dtype=numpy.int64)
+        uvIndices = uvIndices[numpy.repeat(
+            selected, numpy.asarray(aMesh["uvCounts"], dtype=numpy.int64))]
+        return [counts[selected].astype(numpy.int32).tobytes(),
+                points[indices[numpy.repeat(selected, counts)]].tobytes(),
+                numpy.column_stack((uvs[uvIndices],
+                                    uvs[half + uvIndices])).tobytes()]
+
+    offsets = [0]
+    for count in aMesh["counts"]:
+        offsets.append(offsets[-1] + count)
+    uvOffsets = [0]
+    for count in aMesh["uvCounts"]:
+        uvOffsets.append(uvOffsets[-1] + count)
+    indices = list(aMesh["indices"])
+    uvIndices = list(aMesh["uvIndices"])
+    counts = array("i")
+    points = array("f")
+    uvs = array("d")
+    for face in sorted(aFaces):
+        counts.append(aMesh["counts"][face])
+        for i in indices[offsets[face]:offsets[face + 1]]:
+            points.extend(aMesh["points"][i * 3:i * 3 + 3])
+        for i in uvIndices[uvOffsets[face]:uvOffsets[face + 1]]:
+            uvs.extend((aMesh["uvs"][i], aMesh["uvs"][half + i]))
+    return [counts.tobytes(), points.tobytes(), uvs.tobytes()]
+
+
+# The tiles every texture set of aMeshes uses, as {textureSet: [tiles]}.
+# With aFingerprints set, also a fingerprint per tile of every texture set,
+# keyed like Painter names the texture sets it splits ("textureSet_1001"),
+# otherwise None.
+def computeTileLayout(aMeshes, aFingerprints=False):
+    layout = {}
+    tileFingerprints = {}
+    for mesh in aMeshes:
+        tiles = computeFaceTiles(mesh["uvs"], mesh["uvCounts"],
+                                 mesh["uvIndices"])
+        for (textureSet, tile), faces in groupFacesByTile(mesh,
+                                                          tiles).items():
+            layout.setdefault(textureSet, set()).add(tile)
+            if not aFingerprints:
+                continue
+            fingerprint = hashlib.sha1(mesh["name"].encode("utf-8"))
+            fingerprint.update(array("d", mesh["matrix"]).tobytes())
+            for values in getFaceBytes(mesh, faces):
+                fingerprint.update(values)
+            tileFingerprints.setdefault("%s_%d" % (textureSet, tile),
+                                        []).append(fingerprint.hexdigest())
+
+    layout = dict((textureSet, sorted(tiles))
+                  for textureSet, tiles in layout.items())
+    if not aFingerprints:
+        return layout, None
+    return layout, dict((name, combineFingerprints(fingerprints))
+                        for name, fingerprints in tileFingerprints.items())
+
+
+# Rename the texture set aOld to aNew in the keys of aMapping, including the
+# keys of its tiles ("aOld_1001").
+def renameTextureSet(aMapping, aOld, aNew):
+    for key in list(aMapping):
+        if key == aOld:
+            aMapping[aNew] = aMapping.pop(key)
+        elif key.startswith(aOld + "_") and key[len(aOld) + 1:].isdigit():
+            aMapping[aNew + key[len(aOld):]] = aMapping.pop(key)
+
+
+# Keep the tile layout of an export in its registry entry.
+def recordTileLayout(aEntry, aTiles):
+    if aTiles is None:
+        return
+    aEntry["udimTiles"] = aTiles
+    getExportRegistry().store.update({})
+
+
+# Painter only needs to split a mesh with the tile layout aTiles if it uses
+# tiles other than 1001.
+def isSplitByUdim(aTiles):
+    return any(textureSetTiles != [1001] for textureSetTiles in aTiles.values())
+
+
+# Whether Painter should split aPainterObj by UDIM, and its tile layout if
+# it's known.
+def getUdimSettings(aPainterObj):
+    if not getOption("mayaToPainterSplitByUDIMs"):
+        return {"splitByUdim": 0}
+    entry = getExportRegistry().get(aPainterObj) or {}
+    tiles = entry.get("udimTiles")
+    if tiles is None:
+        return {"splitByUdim": 1}
+    return {"splitByUdim": int(isSplitByUdim(tiles)), "udimTiles": tiles}
+
+
+# ---------------------------------------------------------------------- #
+# Pre-flight checks. Before anything is written, the lowpoly is checked for
+# zero-area faces, non-manifold edges and overlapping UVs, and its bounding
+# box is compared to the highpoly's. The checks are plain functions over
+# numpy arrays in mayaToPainterCore.preflight, so they don't need Maya. The
+# mesh data they read is cached for the rest of the send.
+# ---------------------------------------------------------------------- #
+
+# Check aObjects, and aHighpoly if there is one, before they're exported.
+# The problems are printed, and returned as a list of messages.
+def runPreflightChecks(aObjects, aHighpoly=None):
+    if (not getOption("mayaToPainterPreflight", 1) or numpy is None or
+            not aObjects):
+        return []
+    problems = []
+    with timeStage("preflight"):
+        for mesh in getMeshData(aObjects):
+            faces = findZeroAreaFaces(mesh["points"], mesh["counts"],
+                                      mesh["indices"])
+            if len(faces):
+                problems.append('%d zero-area face(s): %s' %
+                                (len(faces), formatComponents(
+                                    mesh["name"], 'f[%d]', faces.tolist())))
+            edges = findNonManifoldEdges(mesh["counts"], mesh["indices"])
+            if len(edges):
+                problems.append('%d non-manifold edge(s): %s' %
+                                (len(edges), formatComponents(
+                                    mesh["name"], 'vtx[%d] to vtx[%d]',
+                                    [tuple(edge) for edge in
+                                     edges.tolist()])))
+            faces = findOverlappingUVs(mesh["uvs"], mesh["uvCounts"],
+                                       mesh["uvIndices"])
+            if len(faces):
+                problems.append('%d face(s) with overlapping UVs: %s' %
+                                (len(faces), formatComponents(
+                                    mesh["name"], 'f[%d]', faces.tolist())))
+        if aHighpoly is not None and findBoundsMismatch(
+                cmds.exactWorldBoundingBox([str(obj) for obj in aObjects]),
+                cmds.exactWorldBoundingBox(str(aHighpoly))):
+            problems.append("the bounding box doesn't match %s" %
+                            str(aHighpoly).split('|')[-1])
+
+    name = ', '.join(str(obj).split('|')[-1] for obj in aObjects)
+    for problem in problems:
+        print('Pre-flight, %s: %s' % (name, problem))
+    if problems:
+        cmds.warning('Pre-flight found %d problem(s) with %s, see the script '
+                     'editor.' % (len(problems), name))
+    return problems
+
+
+# ---------------------------------------------------------------------- #
+# Export formats. Every format is written by a MEL command, so the same
+# command can be run in Maya and by the background workers.
+# ---------------------------------------------------------------------- #
+
+exportFormats = {
+    "fbx": {"label": "FBX (binary)", "extension": ".fbx"},
+    "fbxAscii": {"label": "FBX (ASCII)", "extension": ".fbx"},
+    "obj": {"label": "OBJ", "extension": ".obj"},
+    "abc": {"label": "Alembic", "extension": ".abc"},
+}
+
+
+def getExportFormat():
+    exportFormat = getOption("mayaToPainterExportFormat", "fbx")
+    return exportFormat if exportFormat in exportFormats else "fbx"
+
+
+def getExportExtension():
+    return exportFormats[getExportFormat()]["extension"]
+
+
+# The MEL command that writes the current selection to aFilename.
+def getExportCommand(aFilename, aFormat=None):
+    exportFormat = aFormat or getExportFormat()
+    path = aFilename.replace('\\', '/')
+    if exportFormat == "obj":
+        return ('loadPlugin -quiet "objExport"; '
+                'file -force -preserveReferences -exportSelected '
+                '-type "OBJexport" '
+                '-options "groups=1;ptgroups=1;materials=1;smoothing=1;'
+                'normals=1" "%s";' % path)
+    if exportFormat == "abc":
+        # Face sets carry the material assignments, which become texture
+        # sets in Painter.
+        return ('loadPlugin -quiet "AbcExport"; '
+                'AbcExport -j "-frameRange 1 1 -selection -uvWrite '
+                '-writeFaceSets -worldSpace -dataFormat ogawa '
+                '-file \\"%s\\"";' % path)
+    return ('loadPlugin -quiet "fbxmaya"; FBXResetExport; '
+            'FBXExportInAscii -v %s; FBXExport -s -f "%s";' %
+            ("true" if exportFormat == "fbxAscii" else "false", path))
+
+
+# ---------------------------------------------------------------------- #
+# Background export. The selected geometry is snapshotted to a Maya binary
+# file on the main thread, which is quick, and the slow mesh writes happen in
+# headless mayapy processes. The scheduler and the worker protocol are in
+# mayaToPainterCore.backgroundExport.
+# ---------------------------------------------------------------------- #
+
+# Jobs collected during a send, that are handed to the background exporter
+# when the send is done.
+pendingExports = []
+
+# The files the background exporter is still writing.
+runningExports = set()
+
+
+# Snapshot aObjects so a worker can export them later. Returns the job.
+def queueBackgroundExport(aObjects, aFilename, aFingerprint,
+                          aMaterialName=None):
+    keepExportPath(aFilename)
+    snapshot = getSnapshotPath(os.path.join(tempfile.gettempdir(),
+                                            "mayaToPainter"), aFilename)
+    cmds.select(aObjects)
+    cmds.file(snapshot, force=True, exportSelected=True, type='mayaBinary',
+              preserveReferences=False, constructionHistory=False,
+              channels=False, expressions=False, constraints=False)
+    job = {"snapshot": snapshot,
+           "filename": aFilename,
+           "command": getExportCommand(aFilename),
+           "sources": [str(obj) for obj in aObjects],
+           "fingerprint": aFingerprint,
+           "materialName": aMaterialName}
+    pendingExports.append(job)
+    return job
+
+
+# Hand everything queued during a send to the background exporter, and call
+# aOnFinished when it's done. Calls aOnFinished right away if nothing was
+# queued. The progress and aOnFinished see the timing and export report of
+# the send that queued the files, whichever send is running by then.
+def runPendingExports(aOnFinished):
+    if not pendingExports:
+        aOnFinished()
+        return
+    jobs = list(pendingExports)
+    del pendingExports[:]
+    runningExports.update(job["filename"] for job in jobs)
+    # The send's timing and report go with the jobs, and the next send starts
+    # with new ones, even if it begins before these files are written.
+    send = dict(currentSend)
+    currentSend["timing"] = None
+    currentSend["report"] = {"exported": [], "skipped": []}
+
+    def onProgress(aJob):
+        with resumedSend(send):
+            onBackgroundExportProgress(aJob)
+
+    def onFinished(aJobs):
+        try:
+            with resumedSend(send):
+                aOnFinished()
+        finally:
+            # Changes made while the files were written are sent now.
+            scheduleResend()
+
+    print('Exporting %d file(s) in the background...' % len(jobs))
+    BackgroundExporter(aDispatch=maya.utils.executeDeferred).run(
+        jobs, onProgress, onFinished)
+
+
+# Drops the exports aFunction queued but didn't hand to runPendingExports,
+# together with their snapshots, when it returns early or fails, so the next
+# send doesn't pick them up.
+def dropsUnsentExports(aFunction):
+    @functools.wraps(aFunction)
+    def wrapper(*args, **kwargs):
+        try:
+            return aFunction(*args, **kwargs)
+        finally:
+            for job in pendingExports:
+                if os.path.isfile(job["snapshot"]):
+                    os.remove(job["snapshot"])
+            del pendingExports[:]
+    return wrapper
+
+
+def onBackgroundExportProgress(aJob):
+    runningExports.discard(aJob["filename"])
+    if os.path.isfile(aJob["snapshot"]):
+        os.remove(aJob["snapshot"])
+    if aJob["returncode"] != 0 or not os.path.isfile(aJob["filename"]):
+        cmds.warning('Background export failed: %s\n%s' %
+                     (aJob["filename"], aJob["error"]))
+        return
+    addStageTime("backgroundExport", aJob["seconds"])
+    entry = addObjectToList(aJob["filename"], aJob["sources"],
+                            aJob["fingerprint"], aJob["materialName"])
+    recordTextureSets(entry, aJob.get("textureSets"))
+    recordTileLayout(entry, aJob.get("udimTiles"))
+    countTiming(filesExported=1, bytesWritten=entry["size"])
+    currentSend["report"]["exported"].append(aJob["filename"])
+    print('Background export done: ' + aJob["filename"])
+
+
+# Assign a temporary material called aName to aObjects, to give the texture
+# set a nicer name in Painter. Returns the nodes that were created. If the
+# material can't be assigned, it's removed again before the error is raised.
+def createTextureSetMaterial(aObjects, aName):
+    mat = cmds.shadingNode('blinn', asShader=True, name=aName)
+    nodes = [mat]
+    try:
+        shadingGroup = cmds.sets(renderable=True,
+                                 noSurfaceShader=True,
+                                 empty=True,
+                                 name=mat + '_SG')
+        nodes.append(shadingGroup)
+        cmds.connectAttr('%s.outColor' % mat,
+                         '%s.surfaceShader' % shadingGroup)
+        for obj in aObjects:
+            cmds.sets(obj, forceElement=shadingGroup)
+    except Exception:
+        removeTextureSetMaterial(aObjects, nodes)
+        raise
+    return nodes
+
+
+# Put aObjects back on lambert1 and delete exactly the nodes created by
+# createTextureSetMaterial, without looking at anything else in the scene.
+def removeTextureSetMaterial(aObjects, aNodes):
+    cmds.sets(aObjects, forceElement='initialShadingGroup')
+    cmds.delete(aNodes)
+
+
+# Export aObjects to aFilename, unless the file on disk was exported from
+# identical geometry. If aMaterialName is set and the objects only have
+# lambert1 assigned, a temporary material with that name is created to give
+# the texture set a nicer name in Painter. Returns True if the file was
+# written, or queued to be written in the background.
+def exportObjects(aObjects, aFilename, aMaterialName=None):
+    with timeStage("fingerprint"):
+        entry = getExportRegistry().get(aFilename)
+        meshes = getMeshData(aObjects)
+        releaseMeshData(meshes)
+        # Every mesh is hashed once, for the file and its texture sets.
+        meshFingerprints = [computeMeshFingerprint(mesh) for mesh in meshes]
+        fingerprint = computeFingerprint(meshes, meshFingerprints)
+    countTiming(objects=len(aObjects),
+                vertices=sum(len(mesh["points"]) // 3 for mesh in meshes))
+    if isExportUpToDate(entry, aFilename, fingerprint):
+        addObjectToList(aFilename)
+        currentSend["report"]["skipped"].append(aFilename)
+        countTiming(filesSkipped=1)
+        return False
+
+    changedOnly = getOption("mayaToPainterBakeChangedOnly")
+    textureSets = None
+    if changedOnly:
+        with timeStage("fingerprint"):
+            textureSets = computeTextureSetFingerprints(meshes,
+                                                        meshFingerprints)
+    udimTiles = None
+    if getOption("mayaToPainterSplitByUDIMs"):
+        with timeStage("udimTiles"):
+            udimTiles, tileSets = computeTileLayout(meshes, changedOnly)
+        # Painter only names texture sets by tile when it splits the mesh.
+        if isSplitByUdim(udimTiles):
+            textureSets = tileSets
+
+    with timeStage("dagQueries"):
+        inConnections = []
+        nodes = cmds.ls(aObjects[0], dag=True, long=True)
+        if aMaterialName and len(nodes) > 1:
+            inConnections = list(set(cmds.listConnections(
+                nodes[1], type="shadingEngine") or []))
+        useTempMaterial = (len(inConnections) == 1 and
+                           "initialShadingGroup" in inConnections[0])
+
+    background = (getOption("mayaToPainterBackgroundExport") and
+                  os.path.isfile(getMayapyPath()))
+    # Assigning the temporary material dirties the objects, which isn't a
+    # change watch mode should pick up.
+    with pausedWatch():
+        tempMaterial = None
+        materialName = aMaterialName
+        if useTempMaterial:
+            with timeStage("materials"):
+                tempMaterial = createTextureSetMaterial(aObjects,
+                                                        aMaterialName)
+            # Maya renames the material if another node has the name, and
+            # Painter names the texture set after the material.
+            materialName = str(tempMaterial[0])
+            if textureSets:
+                renameTextureSet(textureSets, "lambert1", materialName)
+            if udimTiles:
+                renameTextureSet(udimTiles, "lambert1", materialName)
+
+        # The temporary material is removed even if the export fails, so it
+        # doesn't stay assigned in the scene.
+        try:
+            if background:
+                with timeStage("snapshot"):
+                    job = queueBackgroundExport(aObjects, aFilename,
+                                                fingerprint, materialName)
+                    job["textureSets"] = textureSets
+                    job["udimTiles"] = udimTiles
+            else:
+                with timeStage("meshExport"):
+                    cmds.select(aObjects)
+                    keepExportPath(aFilename)
+                    maya.mel.eval(getExportCommand(aFilename))
+        finally:
+            if tempMaterial:
+                with timeStage("materials"):
+                    removeTextureSetMaterial(aObjects, tempMaterial)
+
+    if background:
+        return True
+
+    with timeStage("jsonWrite"):
+        entry = addObjectToList(aFilename, aObjects, fingerprint,
+                                materialName)
+        recordTextureSets(entry, textureSets)
+        recordTileLayout(entry, udimTiles)
+    countTiming(filesExported=1, bytesWritten=entry["size"])
+    currentSend["report"]["exported"].append(aFilename)
+    return True
 
 
 # Export multiple objects in a single selection. Used when multiple
 # objects are selected that aren't named "_high" and "_low"
 # or the length of the selection is greater than 2.
 def exportMutliple(aSelection):
-    exportName = pm.promptDialog(title='Object Name',
-                                 message=('Enter the name of '
-                                          'the exported fbx:'),
-                                 button=['OK', 'Cancel'],
-                                 defaultButton='OK',
-                                 cancelButton='Cancel',
-                                 dismissString='Cancel')
+    # Timed so the time spent waiting for the user can be told apart.
+    with timeStage("userPrompt"):
+        exportName = pm.promptDialog(title='Object Name',
+                                     message=('Enter the name of '
+                                              'the exported file:'),
+                                     button=['OK', 'Cancel'],
+                                     defaultButton='OK',
+                                     cancelButton='Cancel',
+                                     dismissString='Cancel')
     if exportName == 'OK':
         text = pm.promptDialog(query=True, text=True)
         if text != '':
-            if '.fbx' in text:
+            extension = getExportExtension()
+            if extension in text:
                 text = text
-            elif '.FBX' in text:
+            elif extension.upper() in text:
                 text = text
             else:
-                text = text + '.fbx'
+                text = text + extension
         else:
             pm.warning(('No object sent to Substance Painter: '
                         'No export name specified'))
@@ -99,84 +1306,588 @@ def exportMutliple(aSelection):
                     'No export name specified'))
         return
 
-    filename = os.path.join(pm.optionVar["mayaToPainterExportDirectory"],
+    filename = os.path.join(getOption("mayaToPainterExportDirectory"),
                             "%s" % text)
     shouldUpdateMesh = os.path.exists(filename)
-    nodes = pm.ls(sl=1, dag=1)
-    inConnections = list(set(pm.listConnections(nodes[1],
-                                                type="shadingEngine")))
-    for sg in inConnections:
-        if ("initialShadingGroup" in sg.name() and
-                len(inConnections) == 1):
-            mat = pm.shadingNode('blinn', asShader=True, name=text[0:-4])
-            shadingGroup = pm.sets(renderable=True,
-                                   noSurfaceShader=True,
-                                   empty=True,
-                                   name=mat + '_SG')
-            pm.connectAttr('%s.outColor' % mat,
-                           '%s.surfaceShader' % shadingGroup)
-            for obj in aSelection:
-                pm.sets(shadingGroup, forceElement=obj)
-
-    pm.mel.FBXResetExport()
-    pm.select(aSelection)
-    pm.mel.FBXExport(s=True, f=filename)
-    addObjectToList(filename)
+    exportObjects(aSelection, filename, text[0:-4])
     painterObj = filename
-
-    for sg in inConnections:
-        if ("initialShadingGroup" in sg.name() and
-                len(inConnections) == 1):
-            # Remove material
-            materials = pm.ls(mat=True)
-            for mat in materials:
-                if text[0:-4] in mat.name():
-                    pm.delete(mat)
-
-            fileNodes = pm.ls(typ='shadingEngine')
-            for node in fileNodes:
-                if (aSelection[0] + '_TS' in node.name() and
-                        '_SG' in node.name()):
-                    pm.delete(node)
-
-            pm.sets('initialShadingGroup', forceElement=aSelection)
     return [painterObj, shouldUpdateMesh]
 
 
-# THANK YOU to "ewerybody" on StackOverflow for this function that checks
-# if a process exists!
+# ---------------------------------------------------------------------- #
+# Chunked highpoly export. Highpolys with more faces than the chunk size are
+# sliced into spatial chunks along their longest axis. The highpoly is
+# duplicated once, detached along the chunk borders and separated, and every
+# chunk is put together from its own pieces, written to
+# "name_high_partNN.fbx" and deleted before the next one. Painter gets all
+# chunks as highpoly meshes once they are all written, since a bake against
+# only some of them would be missing detail.
+# ---------------------------------------------------------------------- #
+
+# The center of every face, from the flat points and the face counts and
+# vertex indices of a mesh, as used by computeFingerprint.
+def computeFaceCenters(aPoints, aCounts, aIndices):
+    if numpy is not None:
+        points = numpy.asarray(aPoints, dtype=numpy.float64).reshape(-1, 3)
+        counts = numpy.asarray(aCounts, dtype=numpy.int64)
+        faces = numpy.repeat(numpy.arange(len(counts)), counts)
+        corners = points[numpy.asarray(aIndices, dtype=numpy.int64)]
+        centers = numpy.empty((len(counts), 3))
+        for axis in range(3):
+            centers[:, axis] = numpy.bincount(faces,
+                                              weights=corners[:, axis],
+                                              minlength=len(counts))
+        return centers / numpy.maximum(counts, 1)[:, None]
+
+    centers = []
+    offset = 0
+    for count in aCounts:
+        center = [0.0, 0.0, 0.0]
+        for index in aIndices[offset:offset + count]:
+            for axis in range(3):
+                center[axis] += aPoints[index * 3 + axis]
+        offset += count
+        centers.append([value / max(count, 1) for value in center])
+    return centers
+
+
+# Split the faces into aChunkCount groups of (almost) the same size, sliced
+# along the longest axis of the face centers. Returns the axis, and the
+# sorted face indices of every chunk.
+def splitFacesSpatially(aCenters, aChunkCount):
+    faceCount = len(aCenters)
+    if faceCount == 0:
+        return 0, []
+    if numpy is not None:
+        centers = numpy.asarray(aCenters, dtype=numpy.float64)
+        axis = int(numpy.argmax(centers.max(axis=0) - centers.min(axis=0)))
+        order = numpy.argsort(centers[:, axis], kind="stable")
+    else:
+        axis = max(range(3), key=lambda a: (max(c[a] for c in aCenters) -
+                                            min(c[a] for c in aCenters)))
+        order = sorted(range(faceCount), key=lambda face: aCenters[face][axis])
+
+    chunks = []
+    for chunk in range(aChunkCount):
+        faces = order[faceCount * chunk // aChunkCount:
+                      faceCount * (chunk + 1) // aChunkCount]
+        if len(faces):
+            chunks.append(sorted(faces) if numpy is None
+                          else numpy.sort(faces))
+    return axis, chunks
+
+
+# Component names for the sorted faces aFaces of aShape, with consecutive
+# faces merged into ranges to keep the list short.
+def getFaceComponents(aShape, aFaces):
+    if numpy is not None:
+        faces = numpy.asarray(aFaces, dtype=numpy.int64)
+        if not len(faces):
+            return []
+        breaks = numpy.flatnonzero(numpy.diff(faces) != 1) + 1
+        starts = faces[numpy.concatenate(([0], breaks))].tolist()
+        ends = faces[numpy.concatenate((breaks - 1,
+                                        [len(faces) - 1]))].tolist()
+        ranges = zip(starts, ends)
+    else:
+        ranges = []
+        for face in aFaces:
+            if ranges and face == ranges[-1][1] + 1:
+                ranges[-1][1] = face
+            else:
+                ranges.append([face, face])
+    return ['%s.f[%d:%d]' % (aShape, start, end) for start, end in ranges]
+
+
+# The center of the first face of aShape, in object space.
+def getFirstFaceCenter(aShape):
+    selectionList = om2.MSelectionList()
+    selectionList.add(aShape)
+    fnMesh = om2.MFnMesh(selectionList.getDagPath(0))
+    vertices = fnMesh.getPolygonVertices(0)
+    center = [0.0, 0.0, 0.0]
+    for vertex in vertices:
+        point = fnMesh.getPoint(vertex, om2.MSpace.kObject)
+        for axis in range(3):
+            center[axis] += point[axis]
+    return [value / len(vertices) for value in center]
+
+
+# Duplicate aObj once, detach the duplicate along the borders of aChunks and
+# separate it. Returns the duplicate, which holds the pieces, and the pieces
+# of every chunk. A piece belongs to the chunk its first face is in, which
+# is found from where the face center lies along aAxis.
+def separateChunks(aObj, aAxis, aCenters, aChunks):
+    duplicate = cmds.ls(cmds.duplicate(str(aObj))[0], long=True)[0]
+    shape = cmds.ls(duplicate, dag=True, type="mesh", noIntermediate=True,
+                    long=True)[0]
+    borders = []
+    for faces in aChunks[:-1]:
+        borders.extend(cmds.polyListComponentConversion(
+            getFaceComponents(shape, faces), fromFace=True, toEdge=True,
+            border=True) or [])
+    if borders:
+        cmds.polySplitEdge(borders, constructionHistory=False)
+    cmds.polySeparate(shape, constructionHistory=False)
+
+    # The largest face center of every chunk along the axis.
+    if numpy is not None:
+        centers = numpy.asarray(aCenters)[:, aAxis]
+        bounds = [float(centers[faces].max()) for faces in aChunks]
+    else:
+        bounds = [max(aCenters[face][aAxis] for face in faces)
+                  for faces in aChunks]
+    pieces = [[] for faces in aChunks]
+    for piece in cmds.listRelatives(duplicate, children=True,
+                                    type="transform", fullPath=True) or []:
+        pieceShapes = cmds.ls(piece, dag=True, type="mesh",
+                              noIntermediate=True, long=True)
+        if not pieceShapes:
+            continue
+        value = getFirstFaceCenter(pieceShapes[0])[aAxis]
+        chunk = min(bisect.bisect_left(bounds, value), len(aChunks) - 1)
+        pieces[chunk].append(piece)
+    return duplicate, pieces
+
+
+# Export a highpoly to aFilename, or in chunks next to it if it's a single
+# mesh with more faces than the chunk size. Files from the other mode are
+# removed, so getHighpolyPaths never mixes them up.
+def exportHighpoly(aObj, aFilename):
+    if getOption("mayaToPainterIterationQuality"):
+        return exportHighpolyProxy(aObj, aFilename)
+    registry = getExportRegistry()
+    chunkFaces = getOption("mayaToPainterHighPolyChunkFaces", 0)
+    shapes = cmds.ls(str(aObj),
+                     dag=True,
+                     type="mesh",
+                     noIntermediate=True,
+                     long=True) or []
+    faceCount = 0
+    if chunkFaces > 0 and len(shapes) == 1:
+        faceCount = cmds.polyEvaluate(shapes[0], face=True)
+
+    if faceCount <= chunkFaces:
+        if registry.chunks(aFilename):
+            registry.remove(registry.chunks(aFilename))
+        return exportObjects([aObj], aFilename)
+
+    if registry.get(aFilename):
+        registry.remove([aFilename])
+    return exportHighpolyChunks(aObj, aFilename, -(-faceCount // chunkFaces))
+
+
+# Chunks are always written on the main thread, since each one is built in
+# the scene. Returns True if they were written, False if all were up to date.
+def exportHighpolyChunks(aObj, aFilename, aChunkCount):
+    registry = getExportRegistry()
+    with timeStage("fingerprint"):
+        meshes = getMeshData([aObj])
+        # The chunk count is part of the fingerprint, so changing the chunk
+        # size exports the chunks again.
+        fingerprint = "%s-%d" % (computeFingerprint(meshes), aChunkCount)
+    countTiming(objects=1, vertices=len(meshes[0]["points"]) // 3)
+
+    oldChunks = registry.chunks(aFilename)
+    if (oldChunks and
+            all(isExportUpToDate(registry.get(path), path, fingerprint)
+                for path in oldChunks)):
+        for path in oldChunks:
+            addObjectToList(path)
+            currentSend["report"]["skipped"].append(path)
+        countTiming(filesSkipped=len(oldChunks))
+        return False
+
+    with timeStage("chunking"):
+        centers = computeFaceCenters(meshes[0]["points"],
+                                     meshes[0]["counts"],
+                                     meshes[0]["indices"])
+        # The mesh data can be large, and isn't needed anymore.
+        releaseMeshData(meshes)
+        del meshes[:]
+        axis, chunks = splitFacesSpatially(centers, aChunkCount)
+        duplicate, pieces = separateChunks(aObj, axis, centers, chunks)
+
+    name = str(aObj).split("|")[-1]
+    base = os.path.splitext(aFilename)[0]
+    chunkPaths = []
+    group = None
+    try:
+        for chunkPieces in pieces:
+            if not chunkPieces:
+                continue
+            chunkPath = "%s_part%02d%s" % (base, len(chunkPaths) + 1,
+                                           getExportExtension())
+            with timeStage("chunking"):
+                # The chunk gets the same name as the highpoly, under its own
+                # group, so baking by mesh name still works.
+                group = cmds.group(empty=True, name="mayaToPainterChunk")
+                chunk = chunkPieces[0]
+                if len(chunkPieces) > 1:
+                    chunk = cmds.polyUnite(chunkPieces, mergeUVSets=1,
+                                           constructionHistory=False)[0]
+                chunk = cmds.parent(chunk, group)[0]
+                cmds.rename("%s|%s" % (group, chunk), name)
+                chunk = cmds.listRelatives(group, children=True,
+                                           fullPath=True)[0]
+            with timeStage("meshExport"):
+                cmds.select(chunk)
+                keepExportPath(chunkPath)
+                maya.mel.eval(getExportCommand(chunkPath))
+            with timeStage("chunking"):
+                cmds.delete(group)
+                group = None
+
+            with timeStage("jsonWrite"):
+                entry = registry.add(chunkPath, [aObj], fingerprint,
+                                     aFilename)
+            countTiming(filesExported=1, bytesWritten=entry["size"])
+            currentSend["report"]["exported"].append(chunkPath)
+            chunkPaths.append(chunkPath)
+    finally:
+        # Whatever is left of the duplicate is removed, even if an export
+        # failed.
+        with timeStage("chunking"):
+            leftovers = [node for node in (group, duplicate)
+                         if node and cmds.objExists(node)]
+            if leftovers:
+                cmds.delete(leftovers)
+
+    staleChunks = [path for path in oldChunks if path not in chunkPaths]
+    if staleChunks:
+        registry.remove(staleChunks)
+    return True
+
+
+# ---------------------------------------------------------------------- #
+# Highpoly proxies. With iteration quality on, a highpoly is sent as a
+# decimated copy, "name_high_proxy.fbx", instead of the full mesh, so look
+# dev iterations don't export and bake the full sculpt every time. The proxy
+# is cached in the export registry by a quick key of the highpoly, and only
+# built again when it changes. Final quality sends the full mesh.
+# ---------------------------------------------------------------------- #
+
+def getProxyPath(aFilename):
+    base, extension = os.path.splitext(aFilename)
+    return "%s_proxy%s" % (base, extension)
+
+
+# The key the proxy of aObj is cached by, and its vertex count. Hashing the
+# whole highpoly would take about as long as decimating it, so only the
+# points are hashed, straight from Maya's buffer, together with the vertex,
+# face and UV counts and the world matrix of every mesh.
+def getProxyKey(aObj):
+    key = hashlib.sha1()
+    vertexCount = 0
+    for shape in cmds.ls(str(aObj), dag=True, type="mesh",
+                         noIntermediate=True, long=True) or []:
+        selectionList = om2.MSelectionList()
+        selectionList.add(shape)
+        fnMesh = om2.MFnMesh(selectionList.getDagPath(0))
+        transform = cmds.listRelatives(shape, parent=True, fullPath=True)[0]
+        key.update(shape.encode("utf-8"))
+        key.update(getRawPoints(shape, fnMesh).tobytes())
+        key.update(array("i", [fnMesh.numVertices, fnMesh.numPolygons,
+                               fnMesh.numFaceVertices,
+                               fnMesh.numUVs()]).tobytes())
+        key.update(array("d", cmds.xform(transform, q=True, ws=True,
+                                         m=True)).tobytes())
+        vertexCount += fnMesh.numVertices
+    return key.hexdigest(), vertexCount
+
+
+# Export a decimated copy of aObj to the proxy path of aFilename, unless the
+# cached proxy was made from the same highpoly with the same reduction.
+# Returns True if it was written, False if the cached one is up to date.
+def exportHighpolyProxy(aObj, aFilename):
+    registry = getExportRegistry()
+    proxyPath = getProxyPath(aFilename)
+    reduction = getOption("mayaToPainterProxyReduction", 90)
+    with timeStage("fingerprint"):
+        key, vertexCount = getProxyKey(aObj)
+        # The reduction is part of the fingerprint, so changing it builds
+        # the proxy again.
+        fingerprint = "%s-proxy%d" % (key, reduction)
+    countTiming(objects=1, vertices=vertexCount)
+    if isExportUpToDate(registry.get(proxyPath), proxyPath, fingerprint):
+        addObjectToList(proxyPath)
+        currentSend["report"]["skipped"].append(proxyPath)
+        countTiming(filesSkipped=1)
+        return False
+
+    name = str(aObj).split("|")[-1]
+    group = None
+    try:
+        with timeStage("proxy"):
+            # Like a chunk, the proxy gets the same name as the highpoly,
+            # under its own group, so baking by mesh name still works.
+            group = cmds.group(empty=True, name="mayaToPainterProxy")
+            proxy = cmds.parent(cmds.duplicate(str(aObj))[0], group)[0]
+            cmds.rename("%s|%s" % (group, proxy), name)
+            proxy = cmds.listRelatives(group, children=True,
+                                       fullPath=True)[0]
+            if reduction > 0:
+                for shape in cmds.ls(proxy, dag=True, type="mesh",
+                                     noIntermediate=True, long=True) or []:
+                    cmds.polyReduce(shape,
+                                    version=1,
+                                    percentage=reduction,
+                                    keepBorder=True,
+                                    constructionHistory=False)
+        with timeStage("meshExport"):
+            cmds.select(proxy)
+            keepExportPath(proxyPath)
+            maya.mel.eval(getExportCommand(proxyPath))
+    finally:
+        # The copy is removed even if decimating or exporting it failed.
+        with timeStage("proxy"):
+            if group and cmds.objExists(group):
+                cmds.delete(group)
+
+    with timeStage("jsonWrite"):
+        entry = registry.add(proxyPath, [aObj], fingerprint,
+                             aProxyOf=aFilename)
+    countTiming(filesExported=1, bytesWritten=entry["size"])
+    currentSend["report"]["exported"].append(proxyPath)
+    return True
+
+
+# ---------------------------------------------------------------------- #
+# Process detection. The Painter process the plugin launched is tracked
+# directly, and the last Painter pid that was found is revalidated cheaply
+# before falling back to searching all processes.
+# ---------------------------------------------------------------------- #
+
+# "prewarmed" is true while a Painter started ahead of time is waiting for
+# its first mesh, and "ready" once its plugin has answered on the link.
+painterProcess = {"popen": None, "pid": None,
+                  "prewarmed": False, "ready": False}
+
+
+# The executable name of a running process, or None if it isn't running.
+# kernel32 with the prototypes used by getProcessName. Without them ctypes
+# treats the process handle as a 32 bit int, which can cut it off on 64 bit
+# Windows. Its own WinDLL is used, so ctypes.windll.kernel32 isn't changed
+# for other scripts in Maya.
+kernel32State = {"dll": None}
+
+
+def getKernel32():
+    if kernel32State["dll"] is None:
+        from ctypes import wintypes
+        kernel32 = ctypes.WinDLL('kernel32')
+        kernel32.OpenProcess.restype = wintypes.HANDLE
+        kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL,
+                                         wintypes.DWORD]
+        kernel32.GetExitCodeProcess.restype = wintypes.BOOL
+        kernel32.GetExitCodeProcess.argtypes = [
+            wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD)]
+        kernel32.QueryFullProcessImageNameW.restype = wintypes.BOOL
+        kernel32.QueryFullProcessImageNameW.argtypes = [
+            wintypes.HANDLE, wintypes.DWORD, wintypes.LPWSTR,
+            ctypes.POINTER(wintypes.DWORD)]
+        kernel32.CloseHandle.restype = wintypes.BOOL
+        kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        kernel32State["dll"] = kernel32
+    return kernel32State["dll"]
+
+
+def getProcessName(aPid):
+    if psutil:
+        try:
+            return psutil.Process(aPid).name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+
+    if os.name == 'nt':
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = getKernel32()
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION,
+                                      False, aPid)
+        if not handle:
+            return None
+        try:
+            exitCode = ctypes.c_ulong()
+            if (not kernel32.GetExitCodeProcess(handle,
+                                                ctypes.byref(exitCode)) or
+                    exitCode.value != STILL_ACTIVE):
+                return None
+            size = ctypes.c_ulong(1024)
+            path = ctypes.create_unicode_buffer(size.value)
+            if not kernel32.QueryFullProcessImageNameW(handle, 0, path,
+                                                       ctypes.byref(size)):
+                return None
+            return os.path.basename(path.value)
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        return os.path.basename(os.readlink('/proc/%d/exe' % aPid))
+    except OSError:
+        pass
+    try:
+        with open('/proc/%d/cmdline' % aPid, 'rb') as cmdline:
+            return os.path.basename(
+                cmdline.read().split(b'\0')[0].decode('utf-8', 'replace'))
+    except (IOError, OSError):
+        return None
+
+
+# THANK YOU to "ewerybody" on StackOverflow for the TASKLIST approach, which
+# is used on Windows when psutil isn't installed.
 # Link: https://stackoverflow.com/a/29275361
+def findProcessPid(aProcessName):
+    name = aProcessName.lower()
+    if psutil:
+        for process in psutil.process_iter(['name']):
+            if (process.info['name'] or '').lower() == name:
+                return process.pid
+        return None
+
+    if os.name == 'nt':
+        call = ('TASKLIST', '/FI', 'imagename eq %s' % aProcessName,
+                '/FO', 'CSV', '/NH')
+        output = subprocess.check_output(call).decode(errors='replace')
+        for row in csv.reader(output.splitlines()):
+            if len(row) > 1 and row[0].lower() == name:
+                return int(row[1])
+        return None
+
+    if os.path.isdir('/proc'):
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                processName = getProcessName(int(entry))
+                if processName and processName.lower() == name:
+                    return int(entry)
+    return None
+
+
+# True if the Painter instance launched by this plugin is still running.
+def launchedPainterRunning():
+    popen = painterProcess["popen"]
+    return popen is not None and popen.poll() is None
+
+
 def processExists(process_name):
-    call = 'TASKLIST', '/FI', 'imagename eq %s' % process_name
-    # use buildin check_output right away
-    output = subprocess.check_output(call).decode()
-    # check in last line for process name
-    last_line = output.strip().split('\r\n')[-1]
-    # because Fail message could be translated
-    return last_line.lower().startswith(process_name.lower())
+    if launchedPainterRunning():
+        return True
+    pid = painterProcess["pid"]
+    if pid is not None:
+        processName = getProcessName(pid)
+        if processName and processName.lower() == process_name.lower():
+            return True
+    painterProcess["pid"] = findProcessPid(process_name)
+    return painterProcess["pid"] is not None
+
+
+def isPainterRunning():
+    return processExists(
+        os.path.basename(getOption("mayaToPainterSPDirectory", '')))
+
+
+# Start Painter with aArguments as a completely detached process, so Maya
+# can be closed while Painter is still running, and keep track of it.
+def launchPainter(aArguments):
+    if os.name == 'nt':
+        DETACHED_PROCESS = 0x00000008
+        popen = subprocess.Popen(
+            [getOption("mayaToPainterSPDirectory", '')] + aArguments,
+            close_fds=True,
+            creationflags=DETACHED_PROCESS)
+    else:
+        popen = subprocess.Popen(
+            [getOption("mayaToPainterSPDirectory", '')] + aArguments,
+            close_fds=True,
+            start_new_session=True)
+    painterProcess["popen"] = popen
+    painterProcess["pid"] = popen.pid
+    painterProcess["prewarmed"] = False
+    painterProcess["ready"] = False
+    return popen
+
+
+# Start Painter without a mesh, so it's already running on the first send.
+# Runs deferred when the plugin is loaded, so problems are only warned
+# about instead of raised.
+def prewarmPainter():
+    initializeOptions()
+    painterPath = getOption("mayaToPainterSPDirectory", '')
+    if not os.path.isfile(painterPath):
+        cmds.warning('Substance Painter not found, so it was not started '
+                     'ahead of time. Set its path in the options.')
+        return
+    try:
+        if isPainterRunning():
+            return
+        launchPainter([])
+    except (OSError, subprocess.SubprocessError) as e:
+        cmds.warning('Could not start Substance Painter: %s' % e)
+        return
+    painterProcess["prewarmed"] = True
+    getPainterLink().connect()
+    print('Starting Substance Painter in the background...')
+
+
+def onPainterReady(aMessage):
+    painterProcess["ready"] = True
+    if painterProcess["prewarmed"]:
+        print('Substance Painter is ready.')
+
+
+# ---------------------------------------------------------------------- #
+# Painter link. Requests are pushed to the Painter plugin as JSON messages
+# over a local WebSocket, which the plugin serves, and Painter can push
+# messages back the same way. Nothing is polled from disk. The protocol is
+# in mayaToPainterCore.painterLink.
+# ---------------------------------------------------------------------- #
+
+# Handlers for the messages Painter sends, by their "type". They are
+# registered when the plugin is loaded, but the link itself is only made the
+# first time it's used.
+painterLinkHandlers = {}
+
+painterLinkState = {"link": None}
+
+
+def getPainterLink():
+    if painterLinkState["link"] is None:
+        painterLinkState["link"] = PainterLink(
+            aDispatch=maya.utils.executeDeferred,
+            aHandlers=painterLinkHandlers,
+            aWarn=cmds.warning)
+    return painterLinkState["link"]
 
 
 # Verify that the path to Substance Painter is valid. Is run before every
-# export and when opening and closing the options.
-def verifyPaths():
-    spDir = pm.optionVar["mayaToPainterSPDirectory"]
-    if not os.path.isdir(pm.optionVar["mayaToPainterExportDirectory"]):
-        pm.error(pm.optionVar["mayaToPainterExportDirectory"] +
-                 ' is not a path.')
-
-    if not os.path.isfile(spDir):
-        pm.error('Substance Painter executable not found: ' + spDir +
-                 (' is not a file. You need to change path '
-                  'inside the option-box.'))
+# export and when opening and closing the options. The Painter path isn't
+# needed when only exporting.
+def verifyPaths(aCheckPainter=True):
+    exportDir = getOption("mayaToPainterExportDirectory", '')
+    if not os.path.isdir(exportDir):
+        cmds.error(exportDir + ' is not a path.')
+
+    spDir = getOption("mayaToPainterSPDirectory", '')
+    if aCheckPainter and not os.path.isfile(spDir):
+        cmds.error('Substance Painter executable not found: ' + spDir +
+                   (' is not a file. You need to change path '
+                    'inside the option-box.'))
 
 
 # Main export function that determines what type of selection the user has
 # made, and handles it appropriately.
-def sendToPainter():
-    verifyPaths()
+# With aDeliver set to False the meshes are only exported, and nothing is
+# sent to Painter.
+@timedSend("send")
+@dropsUnsentExports
+@cachesMeshData
+def sendToPainter(aDeliver=True):
+    with timeStage("verifyPaths"):
+        verifyPaths(aDeliver)
     painterObj = ''
-    selection = pm.ls(sl=True)
-    exportDir = pm.optionVar["mayaToPainterExportDirectory"]
+    with timeStage("dagQueries"):
+        selection = cmds.ls(sl=True)
+    exportDir = getOption("mayaToPainterExportDirectory")
 
     try:
         tempPath = os.path.join(tempfile.gettempdir(), "mayaToPainter")
@@ -187,66 +1898,34 @@ def sendToPainter():
 
     shouldUpdateMesh = False
     if len(selection) == 0:
-        pm.warning("No object selected: Can't send to Substance Painter")
+        cmds.warning("No object selected: Can't send to Substance Painter")
         return
 
+    lows = [obj for obj in selection if getObjectRole(obj) == "low"]
+    highs = [obj for obj in selection if getObjectRole(obj) == "high"]
+    if len(selection) == 2 and len(lows) == 1 and len(highs) == 1:
+        runPreflightChecks(lows, highs[0])
+    else:
+        runPreflightChecks(selection)
+
     if len(selection) == 2:
         # Need to check if the selection is one high and one low before the
         # actual function. Exit this block and do the fallback export
         # otherwise.
         for obj in selection:
-            if "_low" in obj.name():
-                filename = os.path.join(exportDir, "%s.fbx" % obj)
+            if getObjectRole(obj) == "low":
+                filename = os.path.join(exportDir,
+                                        "%s%s" % (obj, getExportExtension()))
                 shouldUpdateMesh = os.path.exists(filename)
-
-                nodes = pm.ls(sl=1, dag=1)
-                inConnections = pm.listConnections(nodes[1],
-                                                   type="shadingEngine")
-                inConnections = list(set(inConnections))
-                for sg in inConnections:
-                    if ("initialShadingGroup" in sg.name() and
-                            len(inConnections) == 1):
-                        mat = pm.shadingNode('blinn',
-                                             asShader=True,
-                                             name=obj[0:-4])
-                        shadingGroup = pm.sets(renderable=True,
-                                               noSurfaceShader=True,
-                                               empty=True,
-                                               name=mat + '_SG')
-                        pm.connectAttr('%s.outColor' % mat,
-                                       '%s.surfaceShader' % shadingGroup)
-                        pm.sets(shadingGroup, forceElement=obj)
-
-                pm.mel.FBXResetExport()
-                pm.select(obj)
-                pm.mel.FBXExport(s=True, f=filename)
-                addObjectToList(filename)
+                exportObjects([obj], filename, obj[0:-4])
                 painterObj = filename
 
-                for sg in inConnections:
-                    if ("initialShadingGroup" in sg.name() and
-                            len(inConnections) == 1):
-                        # Remove material
-                        materials = pm.ls(mat=True)
-                        for mat in materials:
-                            if obj[0:-4] in mat.name():
-                                pm.delete(mat)
-
-                        fileNodes = pm.ls(typ='shadingEngine')
-                        for node in fileNodes:
-                            if (obj + '_TS' in node.name() and
-                                    '_SG' in node.name()):
-                                pm.delete(node)
-
-                        pm.sets('initialShadingGroup', forceElement=obj)
-
-            elif "_high" in obj.name():
-                filename = os.path.join(exportDir, "%s.fbx" % obj)
-                shouldUpdateMesh = os.path.exists(filename)
-                pm.mel.FBXResetExport()
-                pm.select(obj)
-                pm.mel.FBXExport(s=True, f=filename)
-                addObjectToList(filename)
+            elif getObjectRole(obj) == "high":
+                filename = os.path.join(exportDir,
+                                        "%s%s" % (obj, getExportExtension()))
+                shouldUpdateMesh = (os.path.exists(filename) or
+                                    os.path.exists(getProxyPath(filename)))
+                exportHighpoly(obj, filename)
             else:
                 # If one of the objects isn't specified as a high or lowpoly,
                 # export it as a multi-export.
@@ -256,90 +1935,821 @@ def sendToPainter():
                 break
 
     elif len(selection) == 1:
-        filename = os.path.join(exportDir, "%s.fbx" % selection[0])
+        filename = os.path.join(exportDir, "%s%s" % (selection[0],
+                                                     getExportExtension()))
         shouldUpdateMesh = os.path.exists(filename)
-        nodes = pm.ls(sl=1, dag=1)
-        inConnections = pm.listConnections(nodes[1], type="shadingEngine")
-        inConnections = list(set(inConnections))
-        for sg in inConnections:
-            if ("initialShadingGroup" in sg.name() and
-                    len(inConnections) == 1):
-                mat = pm.shadingNode('blinn',
-                                     asShader=True,
-                                     name=selection[0] + '_TS')
-                shadingGroup = pm.sets(renderable=True,
-                                       noSurfaceShader=True,
-                                       empty=True,
-                                       name=mat + '_SG')
-                pm.connectAttr('%s.outColor' % mat,
-                               '%s.surfaceShader' % shadingGroup)
-                pm.sets(shadingGroup, forceElement=selection[0])
-
-        pm.mel.FBXResetExport()
-        pm.select(selection)
-        pm.mel.FBXExport(s=True, f=filename)
-        addObjectToList(filename)
+        exportObjects(selection, filename, selection[0] + '_TS')
         painterObj = filename
-        for sg in inConnections:
-            if ("initialShadingGroup" in sg.name() and
-                    len(inConnections) == 1):
-                # Remove material
-                materials = pm.ls(mat=True)
-                for mat in materials:
-                    if selection[0] + '_TS' in mat.name():
-                        pm.delete(mat)
-
-                fileNodes = pm.ls(typ='shadingEngine')
-                for node in fileNodes:
-                    if (selection[0] + '_TS' in node.name() and
-                            '_SG' in node.name()):
-                        pm.delete(node)
-
-                pm.sets('initialShadingGroup', forceElement=selection[0])
 
     else:
         output = exportMutliple(selection)
         painterObj = output[0]
         shouldUpdateMesh = output[1]
 
-    # Only update the JSON-file if the user has exported.
-    # This prevents Painter from baking when the toggle is pressed, only when
-    # the user expects the plugin to start baking.
-    updateAutoBakeJSON()
-
-    spExeName = os.path.basename(pm.optionVar["mayaToPainterSPDirectory"])
-    if processExists(spExeName) and shouldUpdateMesh:
+    if aDeliver:
+        runPendingExports(lambda: openInPainter(painterObj, shouldUpdateMesh))
+    else:
+        runPendingExports(finishExportOnly)
+
+
+def finishExportOnly():
+    enforceDiskBudget(printExportReport())
+    endSendTiming()
+    watchSentObjects()
+
+
+# The highpoly files that belong to a lowpoly file, if they were exported.
+# A highpoly that was split into chunks gives all of its chunks.
+def getHighpolyPaths(aPainterObj):
+    base, extension = os.path.splitext(aPainterObj)
+    if not base.endswith("_low"):
+        return []
+    highpoly = base[:-len("_low")] + "_high" + extension
+    if (getOption("mayaToPainterIterationQuality") and
+            os.path.isfile(getProxyPath(highpoly))):
+        return [getProxyPath(highpoly)]
+    chunks = getExportRegistry().chunks(highpoly)
+    if chunks:
+        return chunks
+    return [highpoly] if os.path.isfile(highpoly) else []
+
+
+# The live link message that loads aPainterObj into a running Painter.
+# aTextureSets limits a bake to those texture sets, if a project is open.
+def getLoadMeshMessage(aPainterObj, aTextureSets=None):
+    message = {"type": "loadMesh",
+               "mesh": aPainterObj,
+               "highpoly": getHighpolyPaths(aPainterObj)}
+    message.update(getUdimSettings(aPainterObj))
+    parameters = getFileBakingParameters(aPainterObj)
+    if "Profile" in parameters:
+        message["parameters"] = parameters
+    if getOption("mayaToPainterShouldBake"):
+        message["bakingParameters"] = dict(parameters)
+        if aTextureSets is not None:
+            message["bakingParameters"]["TextureSets"] = aTextureSets
+    return message
+
+
+# Tells Painter that aPainterObj was exported again.
+def getMeshUpdatedMessage(aPainterObj):
+    message = {"type": "meshUpdated",
+               "mesh": aPainterObj,
+               "highpoly": getHighpolyPaths(aPainterObj)}
+    message.update(getUdimSettings(aPainterObj))
+    parameters = getFileBakingParameters(aPainterObj)
+    if "Profile" in parameters:
+        message["parameters"] = parameters
+    return message
+
+
+# Second half of a send, which runs when all files are exported.
+def openInPainter(aPainterObj, aShouldUpdateMesh):
+    exported = list(currentSend["report"]["exported"])
+    sentFiles = printExportReport()
+    with timeStage("processExists"):
+        painterRunning = isPainterRunning()
+
+    # A prewarmed Painter is waiting for its first mesh. It's delivered the
+    # same way as with live link.
+    prewarmed = painterProcess["prewarmed"] and launchedPainterRunning()
+    if (getOption("mayaToPainterLiveLink") or prewarmed) and painterRunning:
+        # Let the running Painter reload the mesh into the current project,
+        # or create one if none is open.
+        painterProcess["prewarmed"] = False
+        with timeStage("painterLink"):
+            getPainterLink().send(getLoadMeshMessage(
+                aPainterObj, getChangedTextureSets(aPainterObj, exported)))
+        if prewarmed and not painterProcess["ready"]:
+            print('Substance Painter is still starting, the mesh is loaded '
+                  'as soon as it is ready.')
+        else:
+            print('Mesh sent to Painter!')
+
+    elif painterRunning and aShouldUpdateMesh:
+        # Only request a bake if the user has exported.
+        # This prevents Painter from baking when the toggle is pressed, only
+        # when the user expects the plugin to start baking.
+        with timeStage("painterLink"):
+            requestBake(aPainterObj,
+                        getChangedTextureSets(aPainterObj, exported))
+            getPainterLink().send(getMeshUpdatedMessage(aPainterObj))
         print('Meshes updated!')
+
+    else:
+        with timeStage("painterLaunch"):
+            requestBake(aPainterObj)
+            # Split by UDIM is only applicable on project creation.
+            if getUdimSettings(aPainterObj)["splitByUdim"]:
+                launchPainter(["--mesh", aPainterObj, "--split-by-udim"])
+            else:
+                launchPainter(["--mesh", aPainterObj])
+            # The Painter plugin can only guess a single "_high" file from
+            # the mesh name, so chunked highpolys and proxies are sent to it.
+            # Without any, the highpoly Painter guesses is left alone.
+            highpoly = getHighpolyPaths(aPainterObj)
+            if highpoly and (len(highpoly) > 1 or getOption(
+                    "mayaToPainterIterationQuality")):
+                getPainterLink().send({"type": "highpoly",
+                                  "mesh": aPainterObj,
+                                  "highpoly": highpoly})
+            # The profile is applied once the new project is set up.
+            parameters = getFileBakingParameters(aPainterObj)
+            if "Profile" in parameters:
+                getPainterLink().send({"type": "setBakingParameters",
+                                  "parameters": parameters})
+
+    enforceDiskBudget(sentFiles)
+    endSendTiming()
+    watchSentObjects()
+
+
+# ---------------------------------------------------------------------- #
+# Watch mode. The objects that exported files were made from are watched
+# with node dirty callbacks. Once nothing has changed for watchDelay seconds,
+# only the files made from changed objects are exported again, and delivered
+# to a running Painter.
+# ---------------------------------------------------------------------- #
+
+watchDelay = 1.0
+
+# "changed" is when the last change happened, and "exporting" is true while
+# the plugin itself is touching the watched objects. The lock guards "dirty",
+# "changed" and "timer", which the timer thread uses too.
+watchState = {"callbacks": [], "dirty": set(), "changed": 0.0,
+              "timer": None, "exporting": False, "lock": threading.Lock()}
+
+
+def stopWatching():
+    for callbackId in watchState["callbacks"]:
+        try:
+            om2.MMessage.removeCallback(callbackId)
+        except RuntimeError:
+            pass
+    watchState["callbacks"] = []
+    with watchState["lock"]:
+        watchState["dirty"].clear()
+
+
+# Watch the sources of every registered file, if watch mode is on. Runs
+# after every send, so newly sent objects are picked up.
+def watchSentObjects():
+    stopWatching()
+    if not getOption("mayaToPainterWatch"):
+        return
+    sources = set()
+    for entry in getExportRegistry().files().values():
+        sources.update(entry["sources"])
+    for source in sorted(sources):
+        nodes = cmds.ls(source,
+                        dag=True,
+                        type=("transform", "mesh"),
+                        noIntermediate=True,
+                        long=True) or []
+        for node in nodes:
+            selectionList = om2.MSelectionList()
+            selectionList.add(node)
+            watchState["callbacks"].append(
+                om2.MNodeMessage.addNodeDirtyCallback(
+                    selectionList.getDependNode(0), onWatchedNodeDirty,
+                    source))
+
+
+# Called for every dirty node, often many times per edit, so it only notes
+# the change. A single timer waits for the changes to settle.
+def onWatchedNodeDirty(aNode, aSource):
+    if watchState["exporting"]:
+        return
+    with watchState["lock"]:
+        watchState["dirty"].add(aSource)
+        watchState["changed"] = time.time()
+    scheduleResend()
+
+
+# Start the timer, unless it's already running or nothing changed.
+def scheduleResend():
+    with watchState["lock"]:
+        if watchState["timer"] is None and watchState["dirty"]:
+            watchState["timer"] = threading.Timer(watchDelay, waitForChanges)
+            watchState["timer"].daemon = True
+            watchState["timer"].start()
+
+
+# Runs on the timer thread.
+def waitForChanges():
+    with watchState["lock"]:
+        remaining = watchState["changed"] + watchDelay - time.time()
+        if remaining > 0:
+            watchState["timer"] = threading.Timer(remaining, waitForChanges)
+            watchState["timer"].daemon = True
+            watchState["timer"].start()
+            return
+        watchState["timer"] = None
+    maya.utils.executeDeferred(resendChangedObjects)
+
+
+# Ignore dirty callbacks while the plugin itself changes the watched objects,
+# like assigning a temporary material during an export. Can be nested.
+@contextlib.contextmanager
+def pausedWatch():
+    exporting = watchState["exporting"]
+    watchState["exporting"] = True
+    try:
+        yield
+    finally:
+        watchState["exporting"] = exporting
+
+
+# Export every registered file made from a changed object again, the same
+# way it was exported the first time. Files in another format than the
+# current one, or with sources that were deleted, are left alone. Files the
+# background exporter is still writing are sent once it's done.
+@timedSend("watch")
+@dropsUnsentExports
+@cachesMeshData
+def resendChangedObjects():
+    with watchState["lock"]:
+        dirty = set(watchState["dirty"])
+        watchState["dirty"].clear()
+    registry = getExportRegistry()
+
+    exports = {}
+    for path, entry in sorted(registry.files().items()):
+        target = entry.get("chunkOf", entry.get("proxyOf", path))
+        if target in runningExports and dirty.intersection(entry["sources"]):
+            with watchState["lock"]:
+                watchState["dirty"].update(
+                    dirty.intersection(entry["sources"]))
+            continue
+        if (target in exports or
+                not dirty.intersection(entry["sources"]) or
+                os.path.splitext(target)[1] != getExportExtension() or
+                not all(cmds.objExists(source)
+                        for source in entry["sources"])):
+            continue
+        exports[target] = entry
+    if not exports:
+        return
+
+    selection = cmds.ls(sl=True, long=True) or []
+    try:
+        with pausedWatch():
+            for target, entry in sorted(exports.items()):
+                if entry["role"] == "high" and len(entry["sources"]) == 1:
+                    exportHighpoly(entry["sources"][0], target)
+                else:
+                    exportObjects(entry["sources"], target,
+                                  entry.get("materialName"))
+    finally:
+        # Exporting selects the objects, which shouldn't disturb the user.
+        if selection:
+            cmds.select(selection, replace=True)
+        else:
+            cmds.select(clear=True)
+    runPendingExports(deliverChangedObjects)
+
+
+# Load the updated meshes into a running Painter. Highpolys are read again
+# by Painter when baking, so they don't need to be sent.
+def deliverChangedObjects():
+    exported = list(currentSend["report"]["exported"])
+    sentFiles = printExportReport()
+    with timeStage("processExists"):
+        painterRunning = isPainterRunning()
+    if painterRunning:
+        with timeStage("painterLink"):
+            for path in exported:
+                if getExportRole(path) == "high":
+                    continue
+                if getOption("mayaToPainterLiveLink"):
+                    getPainterLink().send(getLoadMeshMessage(
+                        path, getChangedTextureSets(path, exported)))
+                else:
+                    getPainterLink().send(getMeshUpdatedMessage(path))
+    enforceDiskBudget(sentFiles)
+    endSendTiming()
+
+
+# ---------------------------------------------------------------------- #
+# Batch send. Pairs every "_low" with its "_high" and hands them to Painter
+# in one manifest.
+# ---------------------------------------------------------------------- #
+
+# The transforms to search for pairs in. Uses the members of selected sets,
+# everything under the selected objects, or the whole scene if nothing is
+# selected.
+def getBatchScope():
+    selection = cmds.ls(sl=True, long=True) or []
+    if not selection:
+        return cmds.ls(type='transform', long=True) or []
+    roots = []
+    for node in selection:
+        if cmds.objectType(node, isType='objectSet'):
+            roots.extend(cmds.sets(node, q=True) or [])
+        else:
+            roots.append(node)
+    return cmds.ls(roots, dag=True, type='transform', long=True) or []
+
+
+# Index every "_low"/"_high" pair in aTransforms in a single pass. Returns
+# a sorted list of (name, low, high) tuples, all objects that didn't have a
+# match, and all objects that were ignored because another object already
+# has the same short name. Objects under another "_low"/"_high" object are
+# exported with it, so they aren't paired on their own.
+def findLowHighPairs(aTransforms):
+    lows = {}
+    highs = {}
+    duplicates = []
+    matched = set(node for node in aTransforms
+                  if node.split('|')[-1].endswith(('_low', '_high')))
+    for node in aTransforms:
+        shortName = node.split('|')[-1]
+        parents = ['|'.join(node.split('|')[:i])
+                   for i in range(2, node.count('|') + 1)]
+        if any(parent in matched for parent in parents):
+            continue
+        if shortName.endswith('_low'):
+            index, name = lows, shortName[0:-4]
+        elif shortName.endswith('_high'):
+            index, name = highs, shortName[0:-5]
+        else:
+            continue
+        if name in index:
+            duplicates.append(node)
+        else:
+            index[name] = node
+
+    pairs = [(name, lows[name], highs[name])
+             for name in sorted(lows) if name in highs]
+    unmatched = ([lows[name] for name in sorted(lows) if name not in highs] +
+                 [highs[name] for name in sorted(highs) if name not in lows])
+    return pairs, unmatched, duplicates
+
+
+# Export every pair in the batch scope. Returns the name, lowpoly file and
+# project path of every pair, or an empty list if there were none.
+def exportAllPairs():
+    exportDir = getOption("mayaToPainterExportDirectory")
+    with timeStage("dagQueries"):
+        pairs, unmatched, duplicates = findLowHighPairs(getBatchScope())
+
+    for node in unmatched:
+        print('No matching _low/_high found for: ' + node)
+    for node in duplicates:
+        print('Skipped, name is used by another object: ' + node)
+    if unmatched or duplicates:
+        cmds.warning('%d object(s) were not paired, see the script editor.' %
+                     (len(unmatched) + len(duplicates)))
+    if not pairs:
+        cmds.warning("No _low/_high pairs found: Can't send to Substance "
+                     "Painter")
+        return []
+
+    exported = []
+    for name, low, high in pairs:
+        lowFile = os.path.join(exportDir, "%s_low%s" %
+                               (name, getExportExtension()))
+        highFile = os.path.join(exportDir, "%s_high%s" %
+                                (name, getExportExtension()))
+        runPreflightChecks([low], high)
+        exportObjects([low], lowFile, name)
+        exportHighpoly(high, highFile)
+        exported.append({
+            "name": name,
+            "low": lowFile,
+            "project": os.path.join(exportDir, "%s.spp" % name)
+        })
+    return exported
+
+
+@timedSend("batch")
+@dropsUnsentExports
+@cachesMeshData
+def sendAllPairsToPainter():
+    with timeStage("verifyPaths"):
+        verifyPaths()
+    pairs = exportAllPairs()
+    if not pairs:
+        return
+
+    manifest = {"pairs": pairs,
+                "splitByUdim": getOption("mayaToPainterSplitByUDIMs"),
+                "bake": getOption("mayaToPainterShouldBake")}
+    runPendingExports(lambda: sendManifestToPainter(manifest))
+
+
+# Painter picks up the manifest and creates, and optionally bakes, one
+# project per pair.
+def sendManifestToPainter(aManifest):
+    sentFiles = printExportReport()
+    # Looked up once every file is written, since a highpoly may have been
+    # exported in the background or split into chunks.
+    for pair in aManifest["pairs"]:
+        pair["highpoly"] = getHighpolyPaths(pair["low"])
+        pair["bakingParameters"] = getFileBakingParameters(pair["low"])
+        pair.update(getUdimSettings(pair["low"]))
+    with timeStage("painterLink"):
+        getPainterLink().send({"type": "batch", "manifest": aManifest})
+    print('Sent %d pair(s) to Painter.' % len(aManifest["pairs"]))
+
+    with timeStage("processExists"):
+        painterRunning = isPainterRunning()
+    if not painterRunning:
+        with timeStage("painterLaunch"):
+            launchPainter([])
+    enforceDiskBudget(sentFiles)
+    endSendTiming()
+    watchSentObjects()
+
+
+# ---------------------------------------------------------------------- #
+# Bake queue. Jobs are kept in bakeQueue.json in the export directory, so
+# queued and interrupted jobs survive a crash of Maya or Painter. Painter is
+# a single instance, so the Painter plugin bakes one job at a time, each into
+# its own project, and reports back when it's done.
+# ---------------------------------------------------------------------- #
+
+bakeQueueName = "bakeQueue.json"
+
+# A job that Painter hasn't reported back on after this many seconds is
+# queued again, and failed after bakeJobAttempts tries.
+bakeJobTimeout = 2 * 60 * 60.0
+bakeJobAttempts = 3
+
+bakeQueues = {}
+
+# "running" is true while jobs are being handed to Painter, and "timer"
+# times out the job Painter is baking.
+bakeQueueState = {"running": False, "timer": None}
+
+
+# The queue of the current export directory.
+def getBakeQueue():
+    exportDir = getOption("mayaToPainterExportDirectory")
+    if exportDir not in bakeQueues:
+        bakeQueues[exportDir] = JsonStateStore(
+            os.path.join(exportDir, bakeQueueName), {"jobs": []})
+    return bakeQueues[exportDir]
+
+
+# Change a job, and write the queue right away instead of on the next
+# deferred flush, so it's on disk if anything crashes.
+def updateBakeJob(aJob, **aChanges):
+    aJob.update(aChanges)
+    bakeQueue = getBakeQueue()
+    bakeQueue.update({})
+    bakeQueue.flush()
+
+
+# Add a job that bakes aLow with aHighpoly and saves it to aProject. Uses
+# the current baking parameters unless aBakingParameters is given.
+def queueBakeJob(aName, aLow, aHighpoly, aProject, aBakingParameters=None):
+    job = {"id": uuid.uuid4().hex,
+           "name": aName,
+           "low": aLow,
+           "highpoly": aHighpoly,
+           "project": aProject,
+           "bakingParameters": dict(aBakingParameters or
+                                    readBakingParameters()),
+           "status": "queued",
+           "attempts": 0,
+           "queued": time.time()}
+    job.update(getUdimSettings(aLow))
+    getBakeQueue().get("jobs").append(job)
+    updateBakeJob(job)
+    return job
+
+
+# Export every pair in the batch scope, and queue a bake job for each.
+@timedSend("queue")
+@dropsUnsentExports
+@cachesMeshData
+def queuePairsForBaking():
+    with timeStage("verifyPaths"):
+        verifyPaths(False)
+    pairs = exportAllPairs()
+    if not pairs:
+        return
+    runPendingExports(lambda: addPairsToBakeQueue(pairs))
+
+
+def addPairsToBakeQueue(aPairs):
+    sentFiles = printExportReport()
+    for pair in aPairs:
+        queueBakeJob(pair["name"], pair["low"],
+                     getHighpolyPaths(pair["low"]), pair["project"],
+                     getFileBakingParameters(pair["low"]))
+    queued = [job for job in getBakeQueue().get("jobs")
+              if job["status"] == "queued"]
+    print('Queued %d pair(s) for baking, %d job(s) waiting.' %
+          (len(aPairs), len(queued)))
+    enforceDiskBudget(sentFiles)
+    endSendTiming()
+    watchSentObjects()
+
+
+# Hand the queued jobs to Painter, one at a time. Jobs that were running
+# when Maya or Painter went down are run again.
+def runBakeQueue():
+    verifyPaths()
+    for job in getBakeQueue().get("jobs"):
+        if job["status"] == "running":
+            updateBakeJob(job, status="queued")
+    bakeQueueState["running"] = True
+    if not isPainterRunning():
+        launchPainter([])
+    runNextBakeJob()
+
+
+def runNextBakeJob():
+    jobs = getBakeQueue().get("jobs")
+    queued = [job for job in jobs if job["status"] == "queued"]
+    if not queued:
+        bakeQueueState["running"] = False
+        print('Bake queue done: %d done, %d failed.' %
+              (len([job for job in jobs if job["status"] == "done"]),
+               len([job for job in jobs if job["status"] == "failed"])))
+        return
+    job = queued[0]
+    updateBakeJob(job, status="running", started=time.time(),
+                  attempts=job["attempts"] + 1)
+    stopBakeJobTimer()
+    bakeQueueState["timer"] = threading.Timer(
+        bakeJobTimeout, maya.utils.executeDeferred,
+        (onBakeJobTimedOut, job["id"], job["started"]))
+    bakeQueueState["timer"].daemon = True
+    bakeQueueState["timer"].start()
+    getPainterLink().send({"type": "bakeJob", "job": job})
+    print('Baking %s, %d job(s) left.' % (job["name"], len(queued) - 1))
+
+
+def stopBakeJobTimer():
+    if bakeQueueState["timer"] is not None:
+        bakeQueueState["timer"].cancel()
+        bakeQueueState["timer"] = None
+
+
+# The job started at aStarted took too long. It's queued again, or failed
+# if it used up its attempts, and the next job is handed over.
+def onBakeJobTimedOut(aId, aStarted):
+    jobs = [job for job in getBakeQueue().get("jobs")
+            if job["id"] == aId and job["status"] == "running" and
+            job["started"] == aStarted]
+    if not jobs:
+        return
+    job = jobs[0]
+    bakeQueueState["timer"] = None
+    if job["attempts"] >= bakeJobAttempts:
+        updateBakeJob(job, status="failed", finished=time.time(),
+                      error="Timed out after %d attempt(s)." %
+                      job["attempts"])
+        cmds.warning('Baking %s failed: %s' % (job["name"], job["error"]))
+    else:
+        updateBakeJob(job, status="queued")
+        cmds.warning('Baking %s timed out, it was queued again.' %
+                     job["name"])
+    if bakeQueueState["running"]:
+        runNextBakeJob()
+
+
+# Painter reports a finished job with how long the bake took. The time spent
+# waiting in the queue and the total time are logged with it.
+def onBakeJobDone(aMessage):
+    # Jobs that timed out meanwhile were already queued again or failed.
+    jobs = [job for job in getBakeQueue().get("jobs")
+            if job["id"] == aMessage["id"] and job["status"] == "running"]
+    if not jobs:
+        return
+    job = jobs[0]
+    stopBakeJobTimer()
+    if aMessage.get("projectOpen"):
+        # Every job would fail the same way, so the queue stops with the job
+        # still queued, until the project is closed.
+        updateBakeJob(job, status="queued", attempts=job["attempts"] - 1)
+        bakeQueueState["running"] = False
+        cmds.warning('A project is open in Painter, so the bake queue was '
+                     'stopped. Close the project and run the queue again.')
         return
+    updateBakeJob(job,
+                  status="failed" if aMessage.get("error") else "done",
+                  error=aMessage.get("error") or None,
+                  finished=time.time(),
+                  bakeSeconds=aMessage["seconds"])
+    writeTimingLine({"kind": "bakeJob",
+                     "name": job["name"],
+                     "status": job["status"],
+                     "waitSeconds": job["started"] - job["queued"],
+                     "bakeSeconds": job["bakeSeconds"],
+                     "totalSeconds": job["finished"] - job["started"],
+                     "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     "pluginVersion": version})
+    if job["error"]:
+        cmds.warning('Baking %s failed: %s' % (job["name"], job["error"]))
+    else:
+        print('Baked %s in %.1fs.' % (job["name"], job["bakeSeconds"]))
+    if bakeQueueState["running"]:
+        runNextBakeJob()
+
+
+# Drop finished jobs from the queue.
+def clearFinishedBakeJobs():
+    bakeQueue = getBakeQueue()
+    jobs = bakeQueue.get("jobs")
+    jobs[:] = [job for job in jobs if job["status"] not in ("done", "failed")]
+    bakeQueue.update({})
+
+
+# ---------------------------------------------------------------------- #
+# Headless export, for mayapy and render farm nodes. Nothing here opens a
+# dialog or window or talks to Painter, and every export is reported in a
+# summary that can be written as JSON. From a shell:
+# mayapy mayaToPainter.py scene.mb --output D:/exports --pattern "*_low"
+# ---------------------------------------------------------------------- #
 
-    # Split by UDIM is only applicable on project creation.
-    splitByUDIM = pm.optionVar["mayaToPainterSplitByUDIMs"]
-
-    # Used when creating a detached process. If it isn't used,
-    # Substance Painter needs to be closed before Maya can be
-    # closed.
-    DETACHED_PROCESS = 0x00000008
-    if (splitByUDIM):
-        arguments = [
-            pm.optionVar["mayaToPainterSPDirectory"],
-            "--mesh",
-            painterObj,
-            "--split-by-udim"
-        ]
-        subprocess.Popen(arguments,
-                         close_fds=True,
-                         creationflags=DETACHED_PROCESS)
+# The transforms in the open scene whose names match aPattern, which may use
+# Maya's wildcards, and that have a mesh under them. Transforms under another
+# match are left out, since they are exported with it.
+def findHeadlessObjects(aPattern):
+    matches = cmds.ls(aPattern, type='transform', long=True) or []
+    matched = set(matches)
+    roots = []
+    for node in sorted(matches):
+        parents = ['|'.join(node.split('|')[:i])
+                   for i in range(2, node.count('|') + 1)]
+        if any(parent in matched for parent in parents):
+            continue
+        if cmds.ls(node, dag=True, type='mesh', noIntermediate=True):
+            roots.append(node)
+    return roots
+
+
+# Export the objects matching aPattern in the open scene to
+# aOutputDirectory. Every object is written to its own file, named by
+# aNaming, a format string with the fields {name} (the object's short name)
+# and {scene} (the scene's file name). With aPairs set, the matches are
+# paired like Send All Pairs To Painter, and {name} is the pair's name
+# without "_low"/"_high". With aShard set to (index, count) only every
+# count'th object or pair, starting at index, is exported, so a scene can be
+# split over several machines. Returns a summary of every export; an object
+# that fails is recorded in the summary and the rest are still exported.
+@cachesMeshData
+def exportHeadless(aOutputDirectory, aPattern='*', aNaming='{name}',
+                   aPairs=False, aFormat=None, aShard=None):
+    initializeOptions()
+    start = time.time()
+    if not os.path.isdir(aOutputDirectory):
+        os.makedirs(aOutputDirectory)
+    sceneName = os.path.splitext(os.path.basename(
+        cmds.file(q=True, sceneName=True) or 'untitled'))[0]
+
+    # The files are the full quality ones, whatever the user's iteration
+    # and chunking settings are.
+    savedOptions = {}
+    for option in ("mayaToPainterExportDirectory",
+                   "mayaToPainterBackgroundExport",
+                   "mayaToPainterExportFormat",
+                   "mayaToPainterIterationQuality",
+                   "mayaToPainterHighPolyChunkFaces"):
+        savedOptions[option] = getOption(option)
+    setOption("mayaToPainterExportDirectory", aOutputDirectory)
+    setOption("mayaToPainterBackgroundExport", 0)
+    setOption("mayaToPainterIterationQuality", 0)
+    setOption("mayaToPainterHighPolyChunkFaces", 0)
+    if aFormat:
+        setOption("mayaToPainterExportFormat", aFormat)
+
+    exports = []
+
+    # Highpolys are only checked against their lowpoly, so aPreflight is
+    # off for them.
+    def export(aName, aSources, aFilename, aExport, aPreflight=True,
+               aHighpoly=None):
+        result = {"name": aName,
+                  "sources": aSources,
+                  "file": aFilename,
+                  "status": "failed",
+                  "problems": []}
+        try:
+            if aPreflight:
+                result["problems"] = runPreflightChecks(aSources, aHighpoly)
+            written = aExport()
+            result["status"] = "exported" if written else "skipped"
+        except Exception as e:
+            result["error"] = str(e)
+        exports.append(result)
+
+    beginSendTiming("headless")
+    try:
+        exportFormat = getExportFormat()
+        extension = getExportExtension()
+        if aPairs:
+            pairs, unmatched, duplicates = findLowHighPairs(
+                cmds.ls(aPattern, type='transform', long=True) or [])
+            if aShard:
+                pairs = pairs[aShard[0]::aShard[1]]
+            for name, low, high in pairs:
+                baseName = aNaming.format(name=name, scene=sceneName)
+                lowFile = os.path.join(aOutputDirectory,
+                                       baseName + '_low' + extension)
+                highFile = os.path.join(aOutputDirectory,
+                                        baseName + '_high' + extension)
+                export(name, [low], lowFile,
+                       lambda: exportObjects([low], lowFile, baseName),
+                       aHighpoly=high)
+                export(name, [high], highFile,
+                       lambda: exportHighpoly(high, highFile), False)
+        else:
+            unmatched, duplicates = [], []
+            objects = findHeadlessObjects(aPattern)
+            if aShard:
+                objects = objects[aShard[0]::aShard[1]]
+            for node in objects:
+                name = node.split('|')[-1]
+                baseName = aNaming.format(name=name, scene=sceneName)
+                filename = os.path.join(aOutputDirectory, baseName + extension)
+                export(name, [node], filename,
+                       lambda: exportObjects([node], filename, baseName))
+        getExportRegistry().store.flush()
+    finally:
+        printExportReport()
+        endSendTiming()
+        for option, value in savedOptions.items():
+            setOption(option, value)
+
+    summary = {"scene": cmds.file(q=True, sceneName=True),
+               "outputDirectory": aOutputDirectory,
+               "pattern": aPattern,
+               "naming": aNaming,
+               "format": exportFormat,
+               "exports": exports,
+               "unmatched": unmatched,
+               "duplicates": duplicates,
+               "seconds": time.time() - start}
+    for status in ("exported", "skipped", "failed"):
+        summary[status] = len([result for result in exports
+                               if result["status"] == status])
+    return summary
+
+
+# The command line, run with mayapy. Opens the scene, exports it with
+# exportHeadless and writes the summary as JSON to --summary, or prints it.
+# Returns 1 if anything failed to export.
+def main(aArguments=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='mayapy mayaToPainter.py',
+        description='Export meshes from a Maya scene for Substance Painter, '
+                    'without a UI.')
+    parser.add_argument('scene', help='the Maya scene to open')
+    parser.add_argument('--output', required=True,
+                        help='the directory the meshes are written to')
+    parser.add_argument('--pattern', default='*',
+                        help='the transforms to export, with Maya '
+                             'wildcards (default: *)')
+    parser.add_argument('--naming', default='{name}',
+                        help='the file name of every export, with the '
+                             'fields {name} and {scene} (default: {name})')
+    parser.add_argument('--pairs', action='store_true',
+                        help='export matching "_low"/"_high" pairs')
+    parser.add_argument('--format', choices=sorted(exportFormats),
+                        help='the export format (default: the format set '
+                             'in the options)')
+    parser.add_argument('--shard', metavar='INDEX/COUNT',
+                        help='only export every COUNT\'th object or pair, '
+                             'starting at INDEX, e.g. 0/4')
+    parser.add_argument('--summary',
+                        help='write the JSON summary to this file instead '
+                             'of printing it')
+    arguments = parser.parse_args(aArguments)
+
+    shard = None
+    if arguments.shard:
+        try:
+            shard = tuple(int(part) for part in arguments.shard.split('/'))
+            if len(shard) != 2 or not 0 <= shard[0] < shard[1]:
+                raise ValueError
+        except ValueError:
+            parser.error('--shard must be INDEX/COUNT, e.g. 0/4')
+
+    import maya.standalone
+    maya.standalone.initialize(name='python')
+    try:
+        cmds.file(arguments.scene, open=True, force=True)
+        summary = exportHeadless(os.path.abspath(arguments.output),
+                                 arguments.pattern,
+                                 arguments.naming,
+                                 arguments.pairs,
+                                 arguments.format,
+                                 shard)
+    finally:
+        maya.standalone.uninitialize()
+
+    if arguments.summary:
+        with open(arguments.summary, 'w') as summaryFile:
+            json.dump(summary, summaryFile, indent=2)
     else:
-        # Create a completely detached process, so Maya can be closed while
-        # Painter is still running.
-        arguments = [
-            pm.optionVar["mayaToPainterSPDirectory"],
-            "--mesh",
-            painterObj
-        ]
-        subprocess.Popen(arguments,
-                         close_fds=True,
-                         creationflags=DETACHED_PROCESS)
+        print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
 
 
 def changeExportPath():
@@ -366,12 +2776,10 @@ def changeExportPath():
 
 def changePainterPath():
     try:
-        ret = pm.fileDialog2(dir=pm.optionVar["mayaToPainterSPDirectory"],
+        ret = pm.fileDialog2(dir=getOption("mayaToPainterSPDirectory",
+                                           "C:\\"),
                              cap="Select path to Substance Painter",
                              fileMode=1)[0]
-    except KeyError:
-        ret = pm.fileDialog2(cap="Select path to Substance Painter",
-                             fileMode=1)[0]
     except TypeError:
         return
     if (os.path.isfile(ret)):
@@ -379,7 +2787,7 @@ def changePainterPath():
     else:
         print("Selected file doesn\'t exist: %s" % ret)
     pm.textField("painterPath", e=True,
-                 tx=pm.optionVar["mayaToPainterSPDirectory"])
+                 tx=getOption("mayaToPainterSPDirectory", ''))
 
 
 def resetExportPath():
@@ -395,7 +2803,7 @@ def resetExportPath():
 def resetPainterPath():
     pm.optionVar["mayaToPainterSPDirectory"] = defaultPainterPath
     pm.textField("painterPath", e=True,
-                 tx=pm.optionVar["mayaToPainterSPDirectory"])
+                 tx=getOption("mayaToPainterSPDirectory", ''))
 
 
 # Remove the temp-folder that was created initially, and used as the default
@@ -405,13 +2813,13 @@ def removeTempFolder():
     if os.listdir(temp) != 0:
         msg = ('Do you want to remove the temp folder '
                'that was created by this plugin, and all files in it?')
-        rd = pm.confirmDialog(title='Clean up',
-                              message=msg,
-                              button=['Yes', 'No'],
-                              defaultButton='No',
-                              cancelButton='No',
-                              dismissString='No',
-                              ma='center')
+        rd = cmds.confirmDialog(title='Clean up',
+                                message=msg,
+                                button=['Yes', 'No'],
+                                defaultButton='No',
+                                cancelButton='No',
+                                dismissString='No',
+                                ma='center')
         if rd == 'Yes':
             shutil.rmtree(temp)
             print('Removed ' + temp)
@@ -421,66 +2829,56 @@ def removeTempFolder():
 
 # Functions for handling the removal of exported fbx-files.
 def removeAllTempFiles():
-    for index, file in enumerate(pm.optionVar["mayaToPainterExportedFiles"]):
-        if os.path.isfile(file):
-            os.remove(file)
-            pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-            print(file + " removed")
-        else:
-            # Remove from optionVar
-            pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-        assbin = file[0:-3] + "assbin"
-        if os.path.isfile(assbin):
-            os.remove(assbin)
-            print(assbin + " removed")
+    registry = getExportRegistry()
+    registry.remove(registry.paths())
 
 
 def removeLowTempFiles():
-    for index, file in enumerate(pm.optionVar["mayaToPainterExportedFiles"]):
-        if "_low" in file:
-            if os.path.isfile(file):
-                os.remove(file)
-                pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-                print(file + " removed")
-            else:
-                # Remove from optionVar
-                pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-            assbin = file[0:-3] + "assbin"
-            if os.path.isfile(assbin):
-                os.remove(assbin)
-                print(assbin + " removed")
+    registry = getExportRegistry()
+    registry.remove(registry.paths(["low"]))
 
 
 def removeHighTempFiles():
-    for index, file in enumerate(pm.optionVar["mayaToPainterExportedFiles"]):
-        if "_high" in file:
-            if os.path.isfile(file):
-                os.remove(file)
-                pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-                print(file + " removed")
-            else:
-                # Remove from optionVar
-                pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-            assbin = file[0:-3] + "assbin"
-            if os.path.isfile(assbin):
-                os.remove(assbin)
-                print(assbin + " removed")
+    registry = getExportRegistry()
+    registry.remove(registry.paths(["high"]))
 
 
 def removeNotLowHighTempFiles():
-    for index, file in enumerate(pm.optionVar["mayaToPainterExportedFiles"]):
-        if "_high" not in file and "_low" not in file:
-            if os.path.isfile(file):
-                os.remove(file)
-                pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-                print(file + " removed")
-            else:
-                # Remove from optionVar
-                pm.optionVar(rfa=("mayaToPainterExportedFiles", index))
-            assbin = file[0:-3] + "assbin"
-            if os.path.isfile(assbin):
-                os.remove(assbin)
-                print(assbin + " removed")
+    registry = getExportRegistry()
+    registry.remove(registry.paths(["other"]))
+
+
+def updateExportFormat(aLabel):
+    for exportFormat, details in exportFormats.items():
+        if details["label"] == aLabel:
+            pm.optionVar["mayaToPainterExportFormat"] = exportFormat
+
+
+def updateIterationQuality():
+    pm.optionVar["mayaToPainterIterationQuality"] = pm.checkBox(
+        "IterationQualityToggle", q=True, v=True)
+
+
+def updateProxyReduction():
+    pm.optionVar["mayaToPainterProxyReduction"] = pm.intField(
+        "ProxyReduction", q=True, v=True)
+
+
+def updatePreflight():
+    pm.optionVar["mayaToPainterPreflight"] = pm.checkBox(
+        "PreflightToggle", q=True, v=True)
+
+
+def updateHighPolyChunkFaces():
+    pm.optionVar["mayaToPainterHighPolyChunkFaces"] = pm.intField(
+        "HighPolyChunkFaces", q=True, v=True)
+
+
+def updateDiskBudget():
+    pm.optionVar["mayaToPainterDiskBudgetMB"] = pm.intField("DiskBudget",
+                                                            q=True,
+                                                            v=True)
+    enforceDiskBudget()
 
 
 def openCurrentTempFolder():
@@ -506,7 +2904,7 @@ def updatePainterPath():
     pm.optionVar["mayaToPainterSPDirectory"] = pm.textField('painterPath',
                                                             q=True,
                                                             tx=True)
-    painterDir = pm.optionVar["mayaToPainterSPDirectory"]
+    painterDir = getOption("mayaToPainterSPDirectory", '')
     if not os.path.isfile(painterDir):
         pm.error('Substance Painter executable not found: ' + painterDir +
                  (' is not a file. You need to change path '
@@ -519,11 +2917,48 @@ def updateSplitByUDIMs():
                                                             v=True)
 
 
+def updateBackgroundExport():
+    pm.optionVar["mayaToPainterBackgroundExport"] = pm.checkBox(
+        "BackgroundExportToggle", q=True, v=True)
+
+
+def updateWatch():
+    pm.optionVar["mayaToPainterWatch"] = pm.checkBox("WatchToggle",
+                                                     q=True,
+                                                     v=True)
+    watchSentObjects()
+
+
+def updateLiveLink():
+    pm.optionVar["mayaToPainterLiveLink"] = pm.checkBox("LiveLinkToggle",
+                                                        q=True,
+                                                        v=True)
+
+
+def updatePrewarm():
+    pm.optionVar["mayaToPainterPrewarm"] = pm.checkBox("PrewarmToggle",
+                                                       q=True,
+                                                       v=True)
+    if pm.optionVar["mayaToPainterPrewarm"]:
+        verifyPaths()
+        prewarmPainter()
+
+
 def updateAutoBake():
     pm.optionVar["mayaToPainterShouldBake"] = pm.checkBox("AutoBakeToggle",
                                                           q=True,
                                                           v=True)
-    updateBakingParametersJSON()
+
+
+def updateBakeChangedOnly():
+    pm.optionVar["mayaToPainterBakeChangedOnly"] = pm.checkBox(
+        "BakeChangedOnlyToggle", q=True, v=True)
+
+
+def updateBakers():
+    bakingParametersStore.update({"Bakers": [
+        baker for i, baker in enumerate(bakerNames)
+        if pm.checkBox("Baker%d" % i, q=True, v=True)]})
 
 
 # Made this a function because it may need to change to support users who
@@ -534,19 +2969,323 @@ def getPathToPainterPlugin():
     return os.path.expanduser(path)
 
 
-# Update the shouldBake.json that is in the Painter plugin path with the
-# current value in the options.
-def updateAutoBakeJSON():
-    pathToPainterPlugin = getPathToPainterPlugin()
-    pathToShouldBake = pathToPainterPlugin + 'shouldBake.json'
-    if not os.path.exists(pathToShouldBake):
+# ---------------------------------------------------------------------- #
+# State store. Maya is the only writer of the JSON files it shares with the
+# Painter plugin. Documents are cached in memory, changes are coalesced into
+# one write, and files are replaced atomically so a reader never sees a
+# partial file.
+# ---------------------------------------------------------------------- #
+
+class JsonStateStore(object):
+
+    def __init__(self, aPath, aDefaults, aDispatch=maya.utils.executeDeferred):
+        self.path = aPath
+        self.defaults = aDefaults
+        self.dispatch = aDispatch
+        self.document = None
+        self.stat = None
+        self.flushScheduled = False
+
+    # The parsed document. Only parsed again if the file was changed by
+    # something else. Keys missing from the file are filled with the
+    # defaults, and an unreadable file keeps the last good document.
+    def load(self):
+        try:
+            stat = os.stat(self.path)
+            stat = (stat.st_mtime, stat.st_size)
+        except OSError:
+            stat = None
+        if self.document is not None and (stat == self.stat or
+                                          self.flushScheduled):
+            return self.document
+
+        document = copy.deepcopy(self.defaults)
+        document["Version"] = 0
+        if self.document is not None:
+            document.update(self.document)
+        try:
+            with open(self.path, 'r') as jsonFile:
+                document.update(json.load(jsonFile))
+        except (IOError, OSError, ValueError):
+            pass
+        self.document = document
+        self.stat = stat
+        return self.document
+
+    def get(self, aKey):
+        return self.load()[aKey]
+
+    # Apply aChanges in memory, and write them with the next flush.
+    def update(self, aChanges):
+        document = self.load()
+        document.update(aChanges)
+        document["Version"] += 1
+        if not self.flushScheduled:
+            self.flushScheduled = True
+            self.dispatch(self.flush)
+
+    # Write to a temporary file next to the target and rename it over the
+    # target, which is atomic on the same volume.
+    def flush(self):
+        self.flushScheduled = False
+        if self.document is None:
+            return
+        tempPath = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tempPath, 'w') as jsonFile:
+            json.dump(self.document, jsonFile)
+            jsonFile.flush()
+            os.fsync(jsonFile.fileno())
+        os.replace(tempPath, self.path)
+        stat = os.stat(self.path)
+        self.stat = (stat.st_mtime, stat.st_size)
+
+
+# The bakers that can be turned on and off from Maya, named as in Painter's
+# baking parameters.
+bakerNames = ["Normal", "World Space Normal", "ID", "Ambient Occlusion",
+              "Curvature", "Position", "Thickness"]
+
+# "Bakers" are the bakers to run, and "BakerSettings" holds parameters per
+# baker, like {"Ambient Occlusion": {"Secondary_Rays": 64}}.
+defaultBakingParameters = {"Antialiasing": "None",
+                           "Output_Size": [7, 7],
+                           "Match": "Always",
+                           "Average_Normals": True,
+                           "Bakers": list(bakerNames),
+                           "BakerSettings": {}}
+
+bakingParametersStore = JsonStateStore(
+    getPathToPainterPlugin() + 'bakingParameters.json',
+    defaultBakingParameters)
+
+
+# The baking parameters Painter should use, as last set in the options or
+# reported by Painter. The store's own "Version" is left out.
+def readBakingParameters():
+    parameters = dict(bakingParametersStore.load())
+    parameters.pop("Version", None)
+    return parameters
+
+
+# Painter reports its baking parameters when they change, and when asked
+# for them.
+def onBakingParametersFromPainter(aMessage):
+    bakingParametersStore.update(aMessage["parameters"])
+    if pm.optionMenu("XResolution", exists=True):
+        updateOptionsFromJSON()
+
+
+painterLinkHandlers["bakingParameters"] = onBakingParametersFromPainter
+painterLinkHandlers["ready"] = onPainterReady
+painterLinkHandlers["meshLoaded"] = onMeshLoaded
+painterLinkHandlers["bakeJobDone"] = onBakeJobDone
+
+
+# ---------------------------------------------------------------------- #
+# Baking profiles. Named sets of baking parameters, kept in
+# bakingProfiles.json next to bakingParameters.json. A profile is assigned
+# to an object (or a group above it) with the mayaToPainterProfile string
+# attribute, and is sent to Painter together with the mesh, instead of the
+# parameters that were last picked in the options.
+# ---------------------------------------------------------------------- #
+
+profileAttribute = "mayaToPainterProfile"
+
+noProfileLabel = "(none)"
+
+bakingProfilesStore = JsonStateStore(
+    getPathToPainterPlugin() + 'bakingProfiles.json', {"profiles": {}})
+
+
+# The profile assigned to the first of aObjects, or to the closest of their
+# parents, that has one.
+def getBakingProfileName(aObjects):
+    for obj in aObjects:
+        nodes = cmds.ls(str(obj), long=True) or []
+        node = nodes[0] if nodes else None
+        while node:
+            if cmds.attributeQuery(profileAttribute, node=node, exists=True):
+                profileName = cmds.getAttr(node + '.' + profileAttribute)
+                if profileName:
+                    return profileName
+            parents = cmds.listRelatives(node, parent=True, fullPath=True)
+            node = parents[0] if parents else None
+    return None
+
+
+# The baking parameters for aObjects: the current ones, overridden by the
+# assigned profile if there is one. The profile name is included as
+# "Profile".
+def getBakingParameters(aObjects=()):
+    parameters = readBakingParameters()
+    profileName = getBakingProfileName(aObjects)
+    if not profileName:
+        return parameters
+    profile = bakingProfilesStore.get("profiles").get(profileName)
+    if profile is None:
+        cmds.warning('Baking profile %s not found, using the current baking '
+                     'parameters.' % profileName)
+        return parameters
+    parameters.update(profile)
+    parameters["Profile"] = profileName
+    return parameters
+
+
+# The baking parameters for an exported file, from the objects it and its
+# highpolys were exported from.
+def getFileBakingParameters(aPath):
+    registry = getExportRegistry()
+    sources = []
+    for path in [aPath] + getHighpolyPaths(aPath):
+        entry = registry.get(path)
+        if entry:
+            sources.extend(entry["sources"])
+    return getBakingParameters(sources)
+
+
+# Save the current baking parameters as a profile called aName.
+def saveBakingProfile(aName):
+    profile = readBakingParameters()
+    profiles = dict(bakingProfilesStore.get("profiles"))
+    profiles[aName] = profile
+    bakingProfilesStore.update({"profiles": profiles})
+
+
+def deleteBakingProfile(aName):
+    profiles = dict(bakingProfilesStore.get("profiles"))
+    profiles.pop(aName, None)
+    bakingProfilesStore.update({"profiles": profiles})
+
+
+# Assign the profile aName to aObjects, or clear it if aName is empty.
+def assignBakingProfile(aObjects, aName):
+    for obj in aObjects:
+        node = str(obj)
+        if not cmds.attributeQuery(profileAttribute, node=node, exists=True):
+            if not aName:
+                continue
+            cmds.addAttr(node, longName=profileAttribute, dataType="string")
+        cmds.setAttr(node + '.' + profileAttribute, aName or "",
+                     type="string")
+
+
+# Ask Painter to bake the current project if Auto Bake is on. Painter holds
+# on to the request until a project is open. The profile of aPainterObj is
+# used if it has one, and only aTextureSets are baked if it's given.
+def requestBake(aPainterObj=None, aTextureSets=None):
+    if not getOption("mayaToPainterShouldBake"):
         return
+    parameters = (getFileBakingParameters(aPainterObj)
+                  if aPainterObj else readBakingParameters())
+    if aTextureSets is not None:
+        parameters["TextureSets"] = aTextureSets
+    getPainterLink().send({"type": "bake", "bakingParameters": parameters})
+
+
+# ---------------------------------------------------------------------- #
+# Bake results. The Painter plugin reports every bake over the link, with
+# the start and end of each texture set, the output size and any errors.
+# They're appended to bakeResults.jsonl in the export directory, and the
+# latest ones are shown in the options.
+# ---------------------------------------------------------------------- #
+
+bakeResultsName = "bakeResults.jsonl"
 
-    with open(pathToShouldBake, 'r') as shouldBakeJSON:
-        obj = json.loads(shouldBakeJSON.read())
-        obj['shouldBake'] = pm.optionVar["mayaToPainterShouldBake"]
-    with open(pathToShouldBake, 'w') as shouldBakeJSON:
-        json.dump(obj, shouldBakeJSON)
+# The latest results, newest first, of the bakeResults.jsonl at "path".
+bakeResults = {"path": None, "recent": None}
+
+maxRecentBakeResults = 20
+
+
+def getBakeResultsPath():
+    return os.path.join(getOption("mayaToPainterExportDirectory"),
+                        bakeResultsName)
+
+
+# The last aCount lines of the file at aPath. The file is read backwards in
+# blocks of aBlockSize bytes, so a long log isn't read as a whole.
+def readLastLines(aPath, aCount, aBlockSize=65536):
+    with open(aPath, 'rb') as logFile:
+        logFile.seek(0, os.SEEK_END)
+        position = logFile.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= aCount:
+            size = min(aBlockSize, position)
+            position -= size
+            logFile.seek(position)
+            data = logFile.read(size) + data
+    lines = data.decode('utf-8', 'replace').splitlines()
+    return [line for line in lines if line.strip()][-aCount:]
+
+
+# The latest results, read from bakeResults.jsonl the first time, and again
+# when the export directory changes.
+def getRecentBakeResults():
+    path = getBakeResultsPath()
+    if bakeResults["recent"] is None or bakeResults["path"] != path:
+        bakeResults["path"] = path
+        bakeResults["recent"] = []
+        try:
+            lines = readLastLines(path, maxRecentBakeResults)
+            for line in reversed(lines):
+                bakeResults["recent"].append(json.loads(line))
+        except (IOError, OSError, ValueError):
+            pass
+    return bakeResults["recent"]
+
+
+# Painter sends times in milliseconds since the epoch, and the output size
+# as powers of two.
+def onBakeResult(aMessage):
+    result = {"project": aMessage["project"],
+              "outputSize": [2 ** size for size in aMessage["outputSize"]],
+              "seconds": (aMessage["end"] - aMessage["start"]) / 1000.0,
+              "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S',
+                                         time.localtime(
+                                             aMessage["start"] / 1000.0)),
+              "materials": [{"name": material["name"],
+                             "seconds": (material["end"] -
+                                         material["start"]) / 1000.0,
+                             "error": material["error"] or None}
+                            for material in aMessage["materials"]]}
+    # Read before the result is written, so it isn't listed twice.
+    recent = getRecentBakeResults()
+    try:
+        with open(getBakeResultsPath(), 'a') as resultsFile:
+            resultsFile.write(json.dumps(result) + '\n')
+    except (IOError, OSError):
+        pass
+    recent.insert(0, result)
+    del recent[maxRecentBakeResults:]
+
+    failed = [material for material in result["materials"]
+              if material["error"]]
+    for material in failed:
+        cmds.warning('Baking %s failed: %s' % (material["name"],
+                                               material["error"]))
+    print('Painter baked %d texture set(s) at %dx%d in %.1fs.' %
+          (len(result["materials"]) - len(failed), result["outputSize"][0],
+           result["outputSize"][1], result["seconds"]))
+    if pm.scrollField("BakeResults", exists=True):
+        pm.scrollField("BakeResults", e=True, text=formatBakeResults())
+
+
+def formatBakeResults():
+    lines = []
+    for result in getRecentBakeResults():
+        lines.append('%s  %s  %dx%d  %.1fs' %
+                     (result["timestamp"], result["project"],
+                      result["outputSize"][0], result["outputSize"][1],
+                      result["seconds"]))
+        for material in result["materials"]:
+            lines.append('    %s  %.1fs%s' %
+                         (material["name"], material["seconds"],
+                          '  FAILED: ' + material["error"]
+                          if material["error"] else ''))
+    return '\n'.join(lines) or 'No bakes yet.'
+
+
+painterLinkHandlers["bakeResult"] = onBakeResult
 
 
 def sendToPainterOptionsButton(aWindow):
@@ -554,14 +3293,6 @@ def sendToPainterOptionsButton(aWindow):
     pm.deleteUI(aWindow, window=True)
 
 
-# Update desired baking parameters.
-def updateBakingParametersJSON():
-    pathToPainterPlugin = getPathToPainterPlugin()
-    jsonFile = pathToPainterPlugin + 'bakingParameters.json'
-    with open(jsonFile, 'r') as shouldBakeJSON:
-        obj = json.loads(shouldBakeJSON.read())
-
-
 # This is what Painter expects in their baking parameters.
 resolutions = {
     '32': 5,
@@ -590,13 +3321,9 @@ read_resolutions = {
 
 
 def updateXResolution(aMenuItem):
-    pathToPainterPlugin = getPathToPainterPlugin()
-    jsonFile = pathToPainterPlugin + 'bakingParameters.json'
-    with open(jsonFile, 'r') as shouldBakeJSON:
-        obj = json.loads(shouldBakeJSON.read())
-        obj["Output_Size"][0] = resolutions[aMenuItem]
-    with open(jsonFile, 'w') as shouldBakeJSON:
-        json.dump(obj, shouldBakeJSON)
+    outputSize = list(bakingParametersStore.get("Output_Size"))
+    outputSize[0] = resolutions[aMenuItem]
+    bakingParametersStore.update({"Output_Size": outputSize})
     if (pm.optionVar["mayaToPainterSameWidthHeight"]):
         pm.optionMenu("YResolution", e=True,
                       v=pm.optionMenu("XResolution",
@@ -606,13 +3333,79 @@ def updateXResolution(aMenuItem):
 
 
 def updateYResolution(aMenuItem):
-    pathToPainterPlugin = getPathToPainterPlugin()
-    jsonFile = pathToPainterPlugin + 'bakingParameters.json'
-    with open(jsonFile, 'r') as shouldBakeJSON:
-        obj = json.loads(shouldBakeJSON.read())
-        obj["Output_Size"][1] = resolutions[aMenuItem]
-    with open(jsonFile, 'w') as shouldBakeJSON:
-        json.dump(obj, shouldBakeJSON)
+    outputSize = list(bakingParametersStore.get("Output_Size"))
+    outputSize[1] = resolutions[aMenuItem]
+    bakingParametersStore.update({"Output_Size": outputSize})
+
+
+def createProfileDropdown():
+    with pm.horizontalLayout(ratios=[1, 2, 1, 1, 1]):
+        pm.text(label="Profile",
+                al="left",
+                fn="smallPlainLabelFont")
+        pm.optionMenu("BakingProfile")
+        pm.button(label="Save As",
+                  command=pm.Callback(saveBakingProfileFromOptions))
+        pm.button(label="Delete",
+                  command=pm.Callback(deleteBakingProfileFromOptions))
+        pm.button(label="Assign",
+                  command=pm.Callback(assignBakingProfileFromOptions))
+    updateProfileDropdown()
+
+
+def updateProfileDropdown(aSelected=None):
+    for item in pm.optionMenu("BakingProfile", q=True, itemListLong=True) or []:
+        pm.deleteUI(item)
+    pm.menuItem(label=noProfileLabel, parent="BakingProfile")
+    for profileName in sorted(bakingProfilesStore.get("profiles")):
+        pm.menuItem(label=profileName, parent="BakingProfile")
+    if aSelected:
+        pm.optionMenu("BakingProfile", e=True, v=aSelected)
+
+
+def saveBakingProfileFromOptions():
+    result = pm.promptDialog(title='Save Baking Profile',
+                             message=('Save the current baking parameters '
+                                      'as:'),
+                             button=['OK', 'Cancel'],
+                             defaultButton='OK',
+                             cancelButton='Cancel',
+                             dismissString='Cancel')
+    name = pm.promptDialog(query=True, text=True)
+    if result != 'OK' or not name or name == noProfileLabel:
+        return
+    saveBakingProfile(name)
+    updateProfileDropdown(name)
+
+
+def deleteBakingProfileFromOptions():
+    profileName = pm.optionMenu("BakingProfile", q=True, v=True)
+    if profileName != noProfileLabel:
+        deleteBakingProfile(profileName)
+        updateProfileDropdown()
+
+
+# Selecting "(none)" clears the profile of the selected objects.
+def assignBakingProfileFromOptions():
+    profileName = pm.optionMenu("BakingProfile", q=True, v=True)
+    selection = cmds.ls(sl=True, long=True, type="transform") or []
+    if not selection:
+        pm.warning("No object selected: Can't assign a baking profile")
+        return
+    assignBakingProfile(selection,
+                        "" if profileName == noProfileLabel else profileName)
+    print('Assigned baking profile %s to %d object(s).' %
+          (profileName, len(selection)))
+
+
+def createBakerToggles():
+    for row in (bakerNames[:4], bakerNames[4:]):
+        with pm.horizontalLayout(ratios=[1]):
+            for baker in row:
+                pm.checkBox("Baker%d" % bakerNames.index(baker),
+                            label=baker,
+                            al="left",
+                            cc=pm.Callback(updateBakers))
 
 
 def createResolutionDropdown():
@@ -649,29 +3442,16 @@ def createResolutionDropdown():
 
 
 def updateOptionsFromJSON():
-    pathToPainterPlugin = getPathToPainterPlugin()
-    jsonFile = pathToPainterPlugin + 'bakingParameters.json'
-    shouldReset = False
-    with open(jsonFile, 'r') as shouldBakeJSON:
-        obj = json.loads(shouldBakeJSON.read())
-        try:
-            pm.optionMenu("XResolution",
-                          e=True,
-                          v=read_resolutions[obj["Output_Size"][0]])
-            pm.optionMenu("YResolution",
-                          e=True,
-                          v=read_resolutions[obj["Output_Size"][1]])
-        except KeyError:
-            pm.warning("Json file is empty. Resetting it.")
-            shouldReset = True
-    if shouldReset:
-        with open(jsonFile, 'w') as shouldBakeJSON:
-            newJson = {"Antialiasing": "None",
-                       "Output_Size": [7, 7],
-                       "Match": "Always",
-                       "Average_Normals": True}
-            json.dump(newJson, shouldBakeJSON)
-        updateOptionsFromJSON()
+    bakers = bakingParametersStore.get("Bakers")
+    for i, baker in enumerate(bakerNames):
+        pm.checkBox("Baker%d" % i, e=True, v=baker in bakers)
+    outputSize = bakingParametersStore.get("Output_Size")
+    pm.optionMenu("XResolution",
+                  e=True,
+                  v=read_resolutions[outputSize[0]])
+    pm.optionMenu("YResolution",
+                  e=True,
+                  v=read_resolutions[outputSize[1]])
 
 
 def updateSameWidthHeight():
@@ -735,11 +3515,21 @@ def openOptions():
                                 al="left",
                                 v=pm.optionVar["mayaToPainterShouldBake"],
                                 cc=pm.Callback(updateAutoBake))
+                    pm.checkBox("BakeChangedOnlyToggle",
+                                label="Only changed texture sets",
+                                al="left",
+                                v=pm.optionVar[
+                                    "mayaToPainterBakeChangedOnly"],
+                                cc=pm.Callback(updateBakeChangedOnly))
+
+                createBakerToggles()
 
                 pm.separator()
 
                 createResolutionDropdown()
 
+                createProfileDropdown()
+
                 pm.separator()
 
                 # ####
@@ -756,6 +3546,44 @@ def openOptions():
                                 v=pm.optionVar["mayaToPainterSplitByUDIMs"],
                                 cc=pm.Callback(updateSplitByUDIMs))
 
+                with pm.horizontalLayout(ratios=[1]):
+                    pm.text(label="Highpoly",
+                            al="left",
+                            fn="smallPlainLabelFont")
+                    pm.checkBox("IterationQualityToggle",
+                                label="Iteration quality (decimated proxy)",
+                                al="left",
+                                v=pm.optionVar[
+                                    "mayaToPainterIterationQuality"],
+                                cc=pm.Callback(updateIterationQuality))
+
+                pm.separator()
+
+                # #################
+                # Background export
+                # #################
+
+                with pm.horizontalLayout(ratios=[1]):
+                    pm.text(label="Export",
+                            al="left",
+                            fn="smallPlainLabelFont")
+                    pm.checkBox("BackgroundExportToggle",
+                                label="Export in background",
+                                al="left",
+                                v=pm.optionVar[
+                                    "mayaToPainterBackgroundExport"],
+                                cc=pm.Callback(updateBackgroundExport))
+                    pm.checkBox("LiveLinkToggle",
+                                label="Live link",
+                                al="left",
+                                v=pm.optionVar["mayaToPainterLiveLink"],
+                                cc=pm.Callback(updateLiveLink))
+                    pm.checkBox("WatchToggle",
+                                label="Watch for changes",
+                                al="left",
+                                v=pm.optionVar["mayaToPainterWatch"],
+                                cc=pm.Callback(updateWatch))
+
                 pm.separator()
 
                 # ################
@@ -775,7 +3603,8 @@ def openOptions():
                 0.5, 0.5, 1,
                 1, 1, 0.5,
                 1, 1, 1.0,
-                0.5, 0.5, 2
+                0.5, 0.5, 2,
+                0.5, 0.5, 4
             ]
 
             with pm.verticalLayout(ratios=ratios, spacing=15) as advancedLayout:
@@ -810,7 +3639,7 @@ def openOptions():
                         fn="smallPlainLabelFont")
                 pm.textField("painterPath",
                              pht='Select path to Substance Painter',
-                             tx=pm.optionVar["mayaToPainterSPDirectory"],
+                             tx=getOption("mayaToPainterSPDirectory", ''),
                              en=True,
                              ip=0,
                              cc=pm.Callback(updatePainterPath))
@@ -822,6 +3651,12 @@ def openOptions():
                     pm.button(label="Reset Painter path",
                               command=pm.Callback(resetPainterPath))
 
+                pm.checkBox("PrewarmToggle",
+                            label="Start Painter when the plugin is loaded",
+                            al="left",
+                            v=pm.optionVar["mayaToPainterPrewarm"],
+                            cc=pm.Callback(updatePrewarm))
+
                 pm.separator()
 
                 # #######
@@ -844,6 +3679,74 @@ def openOptions():
                     pm.button(label="Remove high",
                               command=pm.Callback(removeHighTempFiles))
 
+                with pm.horizontalLayout(ratios=[1]):
+                    pm.text(label="Disk budget in MB (0 = no limit)",
+                            al="left",
+                            fn="smallPlainLabelFont")
+                    pm.intField("DiskBudget",
+                                min=0,
+                                v=pm.optionVar["mayaToPainterDiskBudgetMB"],
+                                cc=pm.Callback(updateDiskBudget))
+
+                with pm.horizontalLayout(ratios=[1]):
+                    pm.text(label="Export format",
+                            al="left",
+                            fn="smallPlainLabelFont")
+                    pm.optionMenu("ExportFormat", cc=updateExportFormat)
+                    for exportFormat in ("fbx", "fbxAscii", "obj", "abc"):
+                        pm.menuItem(label=exportFormats[exportFormat]["label"])
+                    pm.optionMenu("ExportFormat", e=True,
+                                  v=exportFormats[getExportFormat()]["label"])
+
+                with pm.horizontalLayout(ratios=[1]):
+                    pm.text(label="Split highpolys above N faces (0 = never)",
+                            al="left",
+                            fn="smallPlainLabelFont")
+                    pm.intField("HighPolyChunkFaces",
+                                min=0,
+                                v=pm.optionVar[
+                                    "mayaToPainterHighPolyChunkFaces"],
+                                cc=pm.Callback(updateHighPolyChunkFaces))
+
+                with pm.horizontalLayout(ratios=[1]):
+                    pm.text(label="Faces removed from proxies in %",
+                            al="left",
+                            fn="smallPlainLabelFont")
+                    pm.intField("ProxyReduction",
+                                min=0,
+                                max=99,
+                                v=pm.optionVar["mayaToPainterProxyReduction"],
+                                cc=pm.Callback(updateProxyReduction))
+
+                pm.checkBox("PreflightToggle",
+                            label="Check meshes before export",
+                            al="left",
+                            v=pm.optionVar["mayaToPainterPreflight"],
+                            cc=pm.Callback(updatePreflight))
+
+                pm.separator()
+
+                # #########
+                # Profiling
+                # #########
+
+                pm.button(label="Send To Painter with profiling",
+                          command=pm.Callback(profileSendToPainter))
+
+                pm.separator()
+
+                # ############
+                # Bake results
+                # ############
+
+                pm.text(label="Latest bakes",
+                        al="left",
+                        fn="smallPlainLabelFont")
+                pm.scrollField("BakeResults",
+                               editable=False,
+                               wordWrap=False,
+                               text=formatBakeResults())
+
             pm.tabLayout(
                 tabLayout, e=True,
                 tabLabel=((generalLayout, "General Settings"),
@@ -851,6 +3754,310 @@ def openOptions():
 
         updateOptionsFromJSON()
 
+    # Ask a running Painter for its current baking parameters, they are
+    # shown in the options when they arrive.
+    if getPainterLink().isConnected() or isPainterRunning():
+        getPainterLink().send({"type": "getBakingParameters"})
+
+
+# ---------------------------------------------------------------------- #
+# Benchmarks. These replace the open scene, so run them in mayapy, e.g.:
+# mayapy -c "import maya.standalone; maya.standalone.initialize();
+#            import mayaToPainter; mayaToPainter.runBenchmarks()"
+# Results are written as JSON, and two runs (e.g. from two commits) can be
+# compared with compareBenchmarks.
+# ---------------------------------------------------------------------- #
+
+def getBenchmarkDirectory():
+    outputDir = os.path.join(tempfile.gettempdir(), "mayaToPainterBenchmark")
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    return outputDir
+
+
+def timeCall(aFunction, *args):
+    start = time.time()
+    aFunction(*args)
+    return time.time() - start
+
+
+# Point the export directory at an empty folder of its own for the duration
+# of the block, so the benchmarks only ever add and remove their own files.
+# Files from the old optionVar are moved into the user's registry first, so
+# they can't end up in the benchmark's. Returns the folder.
+@contextlib.contextmanager
+def benchmarkExportDirectory():
+    getExportRegistry()
+    savedOptions = {}
+    for option in ("mayaToPainterExportDirectory",
+                   "mayaToPainterBackgroundExport"):
+        savedOptions[option] = getOption(option)
+    exportDir = tempfile.mkdtemp(prefix="exports_",
+                                 dir=getBenchmarkDirectory())
+    setOption("mayaToPainterExportDirectory", exportDir)
+    setOption("mayaToPainterBackgroundExport", 0)
+    try:
+        yield exportDir
+    finally:
+        waitForCleanup()
+        registry = exportRegistries.pop(exportDir, None)
+        if registry:
+            # Nothing is written to the folder once it's removed.
+            registry.store.document = None
+        for option, value in savedOptions.items():
+            setOption(option, value)
+        shutil.rmtree(exportDir, ignore_errors=True)
+
+
+# A new scene with aCount cubes named like lowpolys, spread over
+# aCount // 10 + 1 materials.
+def createBenchmarkScene(aCount):
+    cmds.file(new=True, force=True)
+    shadingGroups = []
+    for i in range(aCount // 10 + 1):
+        mat = cmds.shadingNode('blinn', asShader=True)
+        shadingGroup = cmds.sets(renderable=True, noSurfaceShader=True,
+                                 empty=True)
+        cmds.connectAttr(mat + '.outColor', shadingGroup + '.surfaceShader')
+        shadingGroups.append(shadingGroup)
+    cubes = []
+    for i in range(aCount):
+        cube = cmds.polyCube(name='bench%d_low' % i)[0]
+        cmds.sets(cube, forceElement=shadingGroups[i % len(shadingGroups)])
+        cubes.append(cube)
+    return cubes
+
+
+# Register aCount empty files as exported, half lows and half highs, in the
+# export directory. Files with the same names from an earlier round may
+# still be queued for deletion, so that is waited for first.
+def createBenchmarkFiles(aCount):
+    outputDir = getOption("mayaToPainterExportDirectory")
+    waitForCleanup()
+    filenames = []
+    for i in range(aCount):
+        filename = os.path.join(outputDir, 'file%d_%s.fbx' %
+                                (i, 'low' if i % 2 else 'high'))
+        open(filename, 'w').close()
+        filenames.append(filename)
+    return filenames
+
+
+# Time the export of a lambert1 object, including the temporary material,
+# in scenes with an increasing number of unrelated materials.
+def benchmarkMaterialScaling(aMaterialCounts=(0, 100, 1000, 5000)):
+    initializeOptions()
+    cmds.loadPlugin('fbxmaya', quiet=True)
+
+    results = []
+    with benchmarkExportDirectory() as outputDir:
+        for count in aMaterialCounts:
+            cmds.file(new=True, force=True)
+            for i in range(count):
+                mat = cmds.shadingNode('blinn', asShader=True)
+                shadingGroup = cmds.sets(renderable=True,
+                                         noSurfaceShader=True, empty=True)
+                cmds.connectAttr(mat + '.outColor',
+                                 shadingGroup + '.surfaceShader')
+            cube = cmds.polyCube(name='bench_low')[0]
+            filename = os.path.join(outputDir, 'bench_%d_low.fbx' % count)
+
+            start = time.time()
+            exportObjects([cube], filename, 'bench')
+            results.append({"materials": count,
+                            "seconds": time.time() - start})
+            print('%6d materials: %.3fs' % (count, results[-1]["seconds"]))
+    return results
+
+
+# Time writing the same mesh in every export format, at every face count in
+# aFaceCounts, and note the file sizes. Painter's import times are logged in
+# mayaToPainterTimings.jsonl when meshes are sent with live link.
+def benchmarkExportFormats(aFaceCounts=(10000, 1000000)):
+    outputDir = getBenchmarkDirectory()
+
+    results = []
+    for count in aFaceCounts:
+        cmds.file(new=True, force=True)
+        subdivisions = max(1, int(count ** 0.5))
+        plane = cmds.polyPlane(name='bench_high',
+                               subdivisionsX=subdivisions,
+                               subdivisionsY=subdivisions)[0]
+        for exportFormat in sorted(exportFormats):
+            filename = os.path.join(outputDir, 'bench_%d_%s%s' %
+                                    (count, exportFormat,
+                                     exportFormats[exportFormat]["extension"]))
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+            cmds.select(plane)
+            start = time.time()
+            maya.mel.eval(getExportCommand(filename, exportFormat))
+            results.append({"format": exportFormat,
+                            "faces": subdivisions * subdivisions,
+                            "seconds": time.time() - start,
+                            "bytes": os.path.getsize(filename)})
+            print('%-9s %8d faces: %.3fs, %.1f MB' %
+                  (exportFormat, results[-1]["faces"],
+                   results[-1]["seconds"],
+                   results[-1]["bytes"] / (1024.0 * 1024.0)))
+    return results
+
+
+startupBenchmarkScript = '''
+import sys
+import json
+import time
+import maya.standalone
+maya.standalone.initialize(name='python')
+import maya.cmds as cmds
+start = time.time()
+cmds.loadPlugin(sys.argv[1])
+print(json.dumps({"seconds": time.time() - start,
+                  "pymelImported": "pymel.core" in sys.modules}))
+maya.standalone.uninitialize()
+'''
+
+
+# Time loading the plugin (importing this module and initializePlugin) in
+# aRuns fresh mayapy processes, so nothing is already imported, and check
+# that pymel isn't pulled in while loading. The menu items aren't added in
+# batch mode, so they aren't included.
+def benchmarkStartup(aRuns=5):
+    pluginPath = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+    results = []
+    for i in range(aRuns):
+        output = subprocess.check_output([getMayapyPath(), '-c',
+                                          startupBenchmarkScript, pluginPath])
+        lines = output.decode('utf-8', 'replace').strip().splitlines()
+        results.append(json.loads(lines[-1]))
+        print('Run %d: %.3fs%s' % (i + 1, results[-1]["seconds"],
+                                   ', pymel imported'
+                                   if results[-1]["pymelImported"] else ''))
+    if results:
+        print('Mean: %.3fs' % (sum(r["seconds"] for r in results) /
+                               len(results)))
+    return results
+
+
+# Run aRemove, and wait until the files it removed are deleted.
+def removeAndWait(aRemove):
+    aRemove()
+    waitForCleanup()
+
+
+# Time the registry and the cleanup functions with aCount files, and pass
+# every result to aRecord(name, count, seconds). The deletes are waited for,
+# so the times include the files actually being removed. Only needs files
+# and optionVars, so it can run outside Maya.
+def benchmarkCleanup(aCount, aRecord):
+    filenames = createBenchmarkFiles(aCount)
+    aRecord("addObjectToList", aCount,
+            timeCall(lambda: [addObjectToList(filename)
+                              for filename in filenames]))
+    aRecord("removeNotLowHighTempFiles", aCount,
+            timeCall(removeAndWait, removeNotLowHighTempFiles))
+    aRecord("removeHighTempFiles", aCount,
+            timeCall(removeAndWait, removeHighTempFiles))
+    aRecord("removeLowTempFiles", aCount,
+            timeCall(removeAndWait, removeLowTempFiles))
+    for filename in createBenchmarkFiles(aCount):
+        addObjectToList(filename)
+    aRecord("removeAllTempFiles", aCount,
+            timeCall(removeAndWait, removeAllTempFiles))
+
+
+# Time aCount resolution changes, flushed like the deferred flush in the
+# UI, and aCount reads of the baking parameters.
+def benchmarkBakingParameters(aCount, aRecord):
+    deferred = []
+    store = JsonStateStore(
+        os.path.join(getOption("mayaToPainterExportDirectory"),
+                     'bakingParameters.json'),
+        defaultBakingParameters,
+        deferred.append)
+
+    def updateResolutions():
+        for i in range(aCount):
+            store.update({"Output_Size": [7 + i % 6, 7 + i % 6]})
+        for flush in deferred:
+            flush()
+
+    aRecord("bakingParametersUpdate", aCount, timeCall(updateResolutions))
+    aRecord("bakingParametersRead", aCount,
+            timeCall(lambda: [store.load() for i in range(aCount)]))
+
+
+# Time the send and cleanup paths in scenes of every size in aObjectCounts.
+# Everything is exported to a folder of its own, which is removed
+# afterwards, and the optionVars that are changed are restored. Returns the
+# report, which is also written to aResultPath (or a time stamped file in
+# the benchmark directory). Only runs in mayapy, as the sends export real
+# meshes.
+def runBenchmarks(aObjectCounts=(10, 100, 1000, 10000), aResultPath=None,
+                  aLabel=''):
+    initializeOptions()
+    cmds.loadPlugin('fbxmaya', quiet=True)
+    outputDir = getBenchmarkDirectory()
+
+    results = []
+
+    def record(aName, aCount, aSeconds):
+        results.append({"name": aName, "objects": aCount,
+                        "seconds": aSeconds})
+        print('%-24s %6d  %.4fs' % (aName, aCount, aSeconds))
+
+    with benchmarkExportDirectory():
+        for count in aObjectCounts:
+            cubes = createBenchmarkScene(count)
+            removeAndWait(removeAllTempFiles)
+
+            cmds.select(cubes[0])
+            record("sendToPainter", count, timeCall(sendToPainter, False))
+            cmds.select(cubes[0])
+            record("sendToPainterUnchanged", count,
+                   timeCall(sendToPainter, False))
+            removeAndWait(removeAllTempFiles)
+
+            benchmarkCleanup(count, record)
+            benchmarkBakingParameters(count, record)
+
+    report = {"label": aLabel,
+              "pluginVersion": version,
+              "mayaVersion": cmds.about(version=True),
+              "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+              "results": results}
+    if not aResultPath:
+        aResultPath = os.path.join(outputDir, 'benchmark_%s.json' %
+                                   time.strftime('%Y%m%d_%H%M%S'))
+    with open(aResultPath, 'w') as resultFile:
+        json.dump(report, resultFile, indent=2)
+    print('Benchmark results written to ' + aResultPath)
+    return report
+
+
+# Print how every benchmark in aCurrentPath changed compared to
+# aBaselinePath. Returns (name, objects, baseline, current) tuples.
+def compareBenchmarks(aBaselinePath, aCurrentPath):
+    with open(aBaselinePath, 'r') as baselineFile:
+        baseline = json.load(baselineFile)
+    with open(aCurrentPath, 'r') as currentFile:
+        current = json.load(currentFile)
+
+    baselineTimes = dict(((r["name"], r["objects"]), r["seconds"])
+                         for r in baseline["results"])
+    rows = []
+    for result in current["results"]:
+        key = (result["name"], result["objects"])
+        if key not in baselineTimes:
+            continue
+        rows.append((key[0], key[1], baselineTimes[key], result["seconds"]))
+        print('%-24s %6d  %.4fs -> %.4fs (%+.0f%%)' %
+              (key[0], key[1], baselineTimes[key], result["seconds"],
+               (result["seconds"] / max(baselineTimes[key], 1e-9) - 1) * 100))
+    return rows
+
 
 # Do plugin stuff... This is for the main button.
 class MayaToPainter(OpenMayaMPx.MPxCommand):
@@ -859,6 +4066,7 @@ class MayaToPainter(OpenMayaMPx.MPxCommand):
         OpenMayaMPx.MPxCommand.__init__(self)
 
     def doIt(self, args):
+        initializeOptions()
         sendToPainter()
 
     @staticmethod
@@ -873,6 +4081,7 @@ class MayaToPainterOptions(OpenMayaMPx.MPxCommand):
         OpenMayaMPx.MPxCommand.__init__(self)
 
     def doIt(self, args):
+        initializeOptions()
         openOptions()
 
     @staticmethod
@@ -880,6 +4089,49 @@ class MayaToPainterOptions(OpenMayaMPx.MPxCommand):
         return OpenMayaMPx.asMPxPtr(MayaToPainterOptions())
 
 
+# Sends every _low/_high pair in the scene or selected sets.
+class MayaToPainterBatch(OpenMayaMPx.MPxCommand):
+
+    def __init__(self):
+        OpenMayaMPx.MPxCommand.__init__(self)
+
+    def doIt(self, args):
+        initializeOptions()
+        sendAllPairsToPainter()
+
+    @staticmethod
+    def cmdCreator():
+        return OpenMayaMPx.asMPxPtr(MayaToPainterBatch())
+
+
+class MayaToPainterQueue(OpenMayaMPx.MPxCommand):
+
+    def __init__(self):
+        OpenMayaMPx.MPxCommand.__init__(self)
+
+    def doIt(self, args):
+        initializeOptions()
+        queuePairsForBaking()
+
+    @staticmethod
+    def cmdCreator():
+        return OpenMayaMPx.asMPxPtr(MayaToPainterQueue())
+
+
+class MayaToPainterRunQueue(OpenMayaMPx.MPxCommand):
+
+    def __init__(self):
+        OpenMayaMPx.MPxCommand.__init__(self)
+
+    def doIt(self, args):
+        initializeOptions()
+        runBakeQueue()
+
+    @staticmethod
+    def cmdCreator():
+        return OpenMayaMPx.asMPxPtr(MayaToPainterRunQueue())
+
+
 # These two functions are required for any plugin.
 def initializePlugin(mobject):
     ''' Initialize the plug-in when Maya loads it. '''
@@ -889,22 +4141,50 @@ def initializePlugin(mobject):
                                 MayaToPainter.cmdCreator)
         mplugin.registerCommand(cmdName + 'Options',
                                 MayaToPainterOptions.cmdCreator)
-        mplugin.addMenuItem("Send To Painter",
-                            "MayaWindow|mainMeshMenu",
-                            cmdName,
-                            "",
-                            True,
-                            "mayaToPainterOptions")
-        # Set the icon on the menu item.
-        pm.menuItem("Send_To_Painter",
-                    e=True,
-                    i="mayaToPainter.png")
+        mplugin.registerCommand(cmdName + 'Batch',
+                                MayaToPainterBatch.cmdCreator)
+        mplugin.registerCommand(cmdName + 'Queue',
+                                MayaToPainterQueue.cmdCreator)
+        mplugin.registerCommand(cmdName + 'RunQueue',
+                                MayaToPainterRunQueue.cmdCreator)
+        # Register the menu items as cheaply as possible, with maya.cmds,
+        # since this runs while Maya starts. There's no menu in batch mode.
+        if not cmds.about(batch=True):
+            mplugin.addMenuItem("Send To Painter",
+                                "MayaWindow|mainMeshMenu",
+                                cmdName,
+                                "",
+                                True,
+                                "mayaToPainterOptions")
+            mplugin.addMenuItem("Send All Pairs To Painter",
+                                "MayaWindow|mainMeshMenu",
+                                cmdName + 'Batch',
+                                "",
+                                False)
+            mplugin.addMenuItem("Queue Pairs For Baking",
+                                "MayaWindow|mainMeshMenu",
+                                cmdName + 'Queue',
+                                "",
+                                False)
+            mplugin.addMenuItem("Run Bake Queue",
+                                "MayaWindow|mainMeshMenu",
+                                cmdName + 'RunQueue',
+                                "",
+                                False)
+            # Set the icon on the menu item.
+            cmds.menuItem("Send_To_Painter",
+                          e=True,
+                          i="mayaToPainter.png")
         try:
             os.makedirs(os.path.join(tempfile.gettempdir(), "mayaToPainter"))
             print('Created ' + os.path.join(tempfile.gettempdir(),
                                             "mayaToPainter"))
         except:
             pass
+        # Deferred so it doesn't hold up Maya's startup.
+        if (cmds.optionVar(q="mayaToPainterPrewarm") and
+                not cmds.about(batch=True)):
+            maya.utils.executeDeferred(prewarmPainter)
     except:
         sys.stderr.write('Failed to register command: ' + cmdName)
 
@@ -915,7 +4195,19 @@ def uninitializePlugin(mobject):
     try:
         mplugin.deregisterCommand(cmdName)
         mplugin.deregisterCommand(cmdName + "Options")
-        mplugin.removeMenuItem(["Send_To_Painter"])
+        mplugin.deregisterCommand(cmdName + "Batch")
+        mplugin.deregisterCommand(cmdName + "Queue")
+        mplugin.deregisterCommand(cmdName + "RunQueue")
+        if not cmds.about(batch=True):
+            mplugin.removeMenuItem(["Send_To_Painter",
+                                    "Send_All_Pairs_To_Painter",
+                                    "Queue_Pairs_For_Baking",
+                                    "Run_Bake_Queue"])
+        stopWatching()
         removeTempFolder()
     except:
         sys.stderr.write('Failed to unregister command: ' + cmdName)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2023 Viktor Pramberg <hi@viktorpramberg.com>
+
+The parts of Maya To Painter that don't need Maya. mayaToPainter.py imports
+them from here, and they can be tested with a plain Python interpreter.
+"""
+
+
+# The default dispatch of the background exporter and the Painter link.
+# Maya replaces it with maya.utils.executeDeferred.
+def callDirectly(aFunction, *aArguments):
+    aFunction(*aArguments)
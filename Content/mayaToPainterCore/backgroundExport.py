@@ -0,0 +1,117 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2023 Viktor Pramberg <hi@viktorpramberg.com>
+"""
+
+import os
+import sys
+import time
+import uuid
+import queue
+import threading
+import subprocess
+
+from mayaToPainterCore import callDirectly
+
+# The worker protocol: a worker is started with the snapshot path, the path
+# of the file to write and the MEL command from getExportCommand as
+# arguments, writes the file and exits with 0 on success. Anything written to
+# stderr is reported if it fails.
+exportWorkerScript = """
+import sys
+import maya.standalone
+maya.standalone.initialize(name='python')
+import maya.cmds as cmds
+import maya.mel as mel
+cmds.file(sys.argv[1], open=True, force=True)
+cmds.select([node for node in cmds.ls(assemblies=True)
+             if not cmds.listRelatives(node, shapes=True, type='camera')])
+mel.eval(sys.argv[3])
+maya.standalone.uninitialize()
+"""
+
+
+def getMayapyPath():
+    exeName = 'mayapy.exe' if os.name == 'nt' else 'mayapy'
+    return os.path.join(os.path.dirname(sys.executable), exeName)
+
+
+# A snapshot path in aDirectory for an export to aFilename. Every snapshot
+# gets its own name, so two exports of the same file, or of files with the
+# same name in different folders, can't overwrite each other's snapshot.
+def getSnapshotPath(aDirectory, aFilename):
+    return os.path.join(aDirectory, "snapshot_%s_%s.mb" % (
+        os.path.splitext(os.path.basename(aFilename))[0], uuid.uuid4().hex))
+
+
+# The arguments that start a worker for aJob, following the worker protocol.
+def getWorkerArguments(aJob, aMayapyPath=None):
+    return [aMayapyPath or getMayapyPath(), '-c', exportWorkerScript,
+            aJob["snapshot"], aJob["filename"], aJob["command"]]
+
+
+def createWorkerProcess(aJob):
+    # Don't flash a console window for every worker on Windows.
+    CREATE_NO_WINDOW = 0x08000000
+    return subprocess.Popen(getWorkerArguments(aJob),
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            creationflags=(CREATE_NO_WINDOW
+                                           if os.name == 'nt' else 0))
+
+
+# Runs export jobs in worker processes, at most aMaxWorkers at a time.
+# aCreateProcess takes a job and returns something that behaves like a
+# subprocess.Popen object, and aDispatch is used to get the callbacks back on
+# the main thread. In Maya that is maya.utils.executeDeferred. By default the
+# callbacks are called on the worker threads.
+class BackgroundExporter(object):
+
+    def __init__(self, aCreateProcess=createWorkerProcess,
+                 aDispatch=callDirectly, aMaxWorkers=None):
+        self.createProcess = aCreateProcess
+        self.dispatch = aDispatch
+        self.maxWorkers = aMaxWorkers or max(1, (os.cpu_count() or 2) - 1)
+
+    # aOnProgress is called with every job when it finishes, and aOnFinished
+    # is called with all jobs when the last one is done. Every job gets a
+    # "returncode", an "error" and a "seconds" key. Returns the worker
+    # threads.
+    def run(self, aJobs, aOnProgress, aOnFinished):
+        jobQueue = queue.Queue()
+        for job in aJobs:
+            jobQueue.put(job)
+        lock = threading.Lock()
+        remaining = [len(aJobs)]
+
+        def work():
+            while True:
+                try:
+                    job = jobQueue.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.time()
+                try:
+                    process = self.createProcess(job)
+                    out, err = process.communicate()
+                    job["returncode"] = process.returncode
+                    job["error"] = err.decode('utf-8', 'replace') if err else ''
+                except (OSError, ValueError) as e:
+                    job["returncode"] = -1
+                    job["error"] = str(e)
+                job["seconds"] = time.time() - start
+                self.dispatch(aOnProgress, job)
+                with lock:
+                    remaining[0] -= 1
+                    isLast = remaining[0] == 0
+                if isLast:
+                    self.dispatch(aOnFinished, aJobs)
+
+        threads = []
+        for i in range(min(self.maxWorkers, len(aJobs))):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
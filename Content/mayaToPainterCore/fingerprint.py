@@ -0,0 +1,59 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2023 Viktor Pramberg <hi@viktorpramberg.com>
+"""
+
+import hashlib
+from array import array
+
+
+# Packs aValues as aTypeCode. Arrays of the right type and numpy arrays are
+# used as they are, so a mesh read in bulk is hashed without a Python loop.
+def packValues(aTypeCode, aValues):
+    if isinstance(aValues, array) and aValues.typecode == aTypeCode:
+        return aValues
+    if hasattr(aValues, "astype"):
+        return aValues.astype(aTypeCode, copy=False).ravel()
+    return array(aTypeCode, aValues)
+
+
+# Creates a fingerprint from plain mesh data. Each mesh is a dictionary with
+# the keys "name", "points", "counts", "indices", "uvs", "uvIndices",
+# "matrix", "materials" and "faceMaterials". Everything except the names is a
+# flat sequence of numbers: a list, an array or a numpy array. Points and UVs
+# are hashed as 32 bit floats, which is how Maya stores them.
+def computeMeshFingerprint(aMesh):
+    fingerprint = hashlib.sha1()
+
+    def addValues(aTypeCode, aValues):
+        values = packValues(aTypeCode, aValues)
+        fingerprint.update(str(len(values)).encode("utf-8"))
+        fingerprint.update(values.tobytes())
+
+    fingerprint.update(aMesh["name"].encode("utf-8"))
+    addValues("f", aMesh["points"])
+    addValues("i", aMesh["counts"])
+    addValues("i", aMesh["indices"])
+    addValues("f", aMesh["uvs"])
+    addValues("i", aMesh["uvIndices"])
+    addValues("d", aMesh["matrix"])
+    fingerprint.update("|".join(aMesh["materials"]).encode("utf-8"))
+    addValues("i", aMesh["faceMaterials"])
+    return fingerprint.hexdigest()
+
+
+# One fingerprint from several, that changes when any of them does, no
+# matter in which order they come.
+def combineFingerprints(aFingerprints):
+    return hashlib.sha1("|".join(sorted(aFingerprints)).encode(
+        "utf-8")).hexdigest()
+
+
+# The fingerprint of several meshes. aMeshFingerprints can hold the
+# fingerprints of aMeshes if they are already known, so they aren't hashed
+# again.
+def computeFingerprint(aMeshes, aMeshFingerprints=None):
+    if aMeshFingerprints is None:
+        aMeshFingerprints = [computeMeshFingerprint(mesh) for mesh in aMeshes]
+    return combineFingerprints(aMeshFingerprints)
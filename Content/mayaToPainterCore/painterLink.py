@@ -0,0 +1,299 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2023 Viktor Pramberg <hi@viktorpramberg.com>
+"""
+
+import os
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import threading
+
+from mayaToPainterCore import callDirectly
+
+painterLinkPort = 37117
+websocketGUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def recvExactly(aSocket, aSize):
+    data = b''
+    while len(data) < aSize:
+        chunk = aSocket.recv(aSize - len(data))
+        if not chunk:
+            raise IOError('Painter link closed')
+        data += chunk
+    return data
+
+
+# Read the HTTP header of a WebSocket handshake one byte at a time, so no
+# frame data that follows it is consumed.
+def recvHandshake(aSocket):
+    data = b''
+    while not data.endswith(b'\r\n\r\n'):
+        data += recvExactly(aSocket, 1)
+    return data.decode('latin-1')
+
+
+def websocketAccept(aKey):
+    digest = hashlib.sha1((aKey + websocketGUID).encode('latin-1')).digest()
+    return base64.b64encode(digest).decode('latin-1')
+
+
+# Clients have to mask their frames, servers must not.
+def encodeFrame(aPayload, aOpcode=0x1, aMask=True):
+    header = bytearray([0x80 | aOpcode])
+    maskBit = 0x80 if aMask else 0
+    length = len(aPayload)
+    if length < 126:
+        header.append(maskBit | length)
+    elif length < 65536:
+        header.append(maskBit | 126)
+        header.extend(struct.pack('>H', length))
+    else:
+        header.append(maskBit | 127)
+        header.extend(struct.pack('>Q', length))
+    if not aMask:
+        return bytes(header) + aPayload
+    mask = os.urandom(4)
+    payload = bytearray(aPayload)
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return bytes(header) + mask + bytes(payload)
+
+
+def readFrame(aSocket):
+    first, second = bytearray(recvExactly(aSocket, 2))
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', recvExactly(aSocket, 2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', recvExactly(aSocket, 8))[0]
+    mask = recvExactly(aSocket, 4) if second & 0x80 else None
+    payload = bytearray(recvExactly(aSocket, length))
+    if mask:
+        mask = bytearray(mask)
+        for i in range(length):
+            payload[i] ^= mask[i % 4]
+    return bool(first & 0x80), first & 0x0F, bytes(payload)
+
+
+# Read one complete text message. Answers pings, and returns None when the
+# other side closes the connection.
+def readMessage(aSocket, aMask=True):
+    message = b''
+    while True:
+        final, opcode, payload = readFrame(aSocket)
+        if opcode == 0x8:
+            return None
+        if opcode == 0x9:
+            aSocket.sendall(encodeFrame(payload, 0xA, aMask))
+            continue
+        if opcode == 0xA:
+            continue
+        message += payload
+        if final:
+            return message.decode('utf-8')
+
+
+def openWebSocket(aPort, aTimeout=1.0):
+    linkSocket = socket.create_connection(('127.0.0.1', aPort), aTimeout)
+    try:
+        key = base64.b64encode(os.urandom(16)).decode('latin-1')
+        linkSocket.sendall(('GET / HTTP/1.1\r\n'
+                            'Host: 127.0.0.1:%d\r\n'
+                            'Upgrade: websocket\r\n'
+                            'Connection: Upgrade\r\n'
+                            'Sec-WebSocket-Key: %s\r\n'
+                            'Sec-WebSocket-Version: 13\r\n\r\n' %
+                            (aPort, key)).encode('latin-1'))
+        response = recvHandshake(linkSocket)
+        if (' 101 ' not in response.split('\r\n')[0] or
+                websocketAccept(key) not in response):
+            raise IOError('Painter link handshake failed')
+    except (socket.error, IOError):
+        linkSocket.close()
+        raise
+    linkSocket.settimeout(None)
+    return linkSocket
+
+
+# Maya's end of the link. Messages are queued until the Painter plugin can
+# be reached, so a request can be sent while Painter is still starting up.
+# Incoming messages are handed to the handler registered for their "type",
+# through aDispatch, which in Maya gets them on the main thread. aHandlers
+# can be a dictionary of handlers by type that is filled in later, and
+# aWarn is called with a message if requests couldn't be delivered.
+class PainterLink(object):
+
+    def __init__(self, aPort=painterLinkPort, aDispatch=callDirectly,
+                 aConnectTimeout=120.0, aHandlers=None, aWarn=print):
+        self.port = aPort
+        self.dispatch = aDispatch
+        self.connectTimeout = aConnectTimeout
+        self.warn = aWarn
+        self.socket = None
+        self.connecting = False
+        self.pending = []
+        self.handlers = aHandlers if aHandlers is not None else {}
+        self.lock = threading.RLock()
+
+    def on(self, aType, aHandler):
+        self.handlers[aType] = aHandler
+
+    def isConnected(self):
+        return self.socket is not None
+
+    def send(self, aMessage):
+        with self.lock:
+            self.pending.append(json.dumps(aMessage))
+        self.flush()
+
+    def connect(self):
+        with self.lock:
+            if self.socket is not None or self.connecting:
+                return
+            self.connecting = True
+        thread = threading.Thread(target=self._connect)
+        thread.daemon = True
+        thread.start()
+
+    def flush(self):
+        with self.lock:
+            if self.socket is None:
+                self.connect()
+                return
+            try:
+                while self.pending:
+                    self.socket.sendall(
+                        encodeFrame(self.pending[0].encode('utf-8')))
+                    self.pending.pop(0)
+            except (socket.error, IOError):
+                self.socket.close()
+                self.socket = None
+                self.connect()
+
+    def close(self):
+        with self.lock:
+            if self.socket is not None:
+                try:
+                    self.socket.sendall(encodeFrame(b'', 0x8))
+                except (socket.error, IOError):
+                    pass
+                self.socket.close()
+                self.socket = None
+
+    def _connect(self):
+        deadline = time.time() + self.connectTimeout
+        while time.time() < deadline:
+            try:
+                linkSocket = openWebSocket(self.port)
+            except (socket.error, IOError):
+                time.sleep(1.0)
+                continue
+            with self.lock:
+                self.socket = linkSocket
+                self.connecting = False
+            reader = threading.Thread(target=self._read, args=(linkSocket,))
+            reader.daemon = True
+            reader.start()
+            self.flush()
+            return
+        with self.lock:
+            self.connecting = False
+            undelivered = len(self.pending)
+        if undelivered:
+            self.dispatch(self.warn,
+                          'Could not reach the Painter plugin on port %d, '
+                          '%d request(s) not delivered.' %
+                          (self.port, undelivered))
+
+    def _read(self, aSocket):
+        try:
+            while True:
+                text = readMessage(aSocket)
+                if text is None:
+                    break
+                message = json.loads(text)
+                handler = self.handlers.get(message.get("type"))
+                if handler:
+                    self.dispatch(handler, message)
+        except (socket.error, IOError, ValueError):
+            pass
+        with self.lock:
+            if self.socket is aSocket:
+                self.socket.close()
+                self.socket = None
+
+
+# Stands in for the Painter plugin's end of the link, so the protocol can be
+# exercised without Painter. Received messages are stored in "messages", and
+# passed to aOnMessage(server, message) if it's set. Use port 0 to get a free
+# port, which is then available in "port".
+class PainterLinkStandIn(object):
+
+    def __init__(self, aPort=painterLinkPort, aOnMessage=None):
+        self.onMessage = aOnMessage
+        self.messages = []
+        self.clients = []
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', aPort))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def send(self, aMessage):
+        frame = encodeFrame(json.dumps(aMessage).encode('utf-8'), aMask=False)
+        for client in list(self.clients):
+            try:
+                client.sendall(frame)
+            except (socket.error, IOError):
+                self.clients.remove(client)
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, address = self.server.accept()
+            except (socket.error, IOError):
+                return
+            thread = threading.Thread(target=self._serve, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, aClient):
+        try:
+            request = recvHandshake(aClient)
+            key = ''
+            for line in request.split('\r\n'):
+                if line.lower().startswith('sec-websocket-key:'):
+                    key = line.split(':', 1)[1].strip()
+            aClient.sendall(('HTTP/1.1 101 Switching Protocols\r\n'
+                             'Upgrade: websocket\r\n'
+                             'Connection: Upgrade\r\n'
+                             'Sec-WebSocket-Accept: %s\r\n\r\n' %
+                             websocketAccept(key)).encode('latin-1'))
+            self.clients.append(aClient)
+            while True:
+                text = readMessage(aClient, aMask=False)
+                if text is None:
+                    break
+                message = json.loads(text)
+                self.messages.append(message)
+                if self.onMessage:
+                    self.onMessage(self, message)
+        except (socket.error, IOError, ValueError):
+            pass
+        if aClient in self.clients:
+            self.clients.remove(aClient)
+        aClient.close()
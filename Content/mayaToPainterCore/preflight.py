@@ -0,0 +1,139 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2023 Viktor Pramberg <hi@viktorpramberg.com>
+"""
+
+# The checks need numpy. mayaToPainter only runs them when it's installed.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Only this many components of every problem are listed.
+maxComponents = 10
+
+
+# The indices of faces with an area of at most aTolerance. aPoints is flat
+# x, y, z, and aCounts and aIndices are the vertices of every face. Polygons
+# are measured as a fan of triangles from their first vertex.
+def findZeroAreaFaces(aPoints, aCounts, aIndices, aTolerance=1e-10):
+    points = numpy.asarray(aPoints, dtype=numpy.float64).reshape(-1, 3)
+    counts = numpy.asarray(aCounts, dtype=numpy.int64)
+    indices = numpy.asarray(aIndices, dtype=numpy.int64)
+    starts = numpy.cumsum(counts) - counts
+    faces = numpy.repeat(numpy.arange(len(counts)), counts)
+    position = numpy.arange(len(indices)) - starts[faces]
+    # Every face vertex except the first and last starts a fan triangle.
+    fan = numpy.nonzero((position >= 1) & (position < counts[faces] - 1))[0]
+    first = points[indices[starts[faces[fan]]]]
+    cross = numpy.cross(points[indices[fan]] - first,
+                        points[indices[fan + 1]] - first)
+    area = numpy.zeros((len(counts), 3))
+    for axis in range(3):
+        area[:, axis] = numpy.bincount(faces[fan], cross[:, axis],
+                                       len(counts))
+    return numpy.nonzero(
+        0.5 * numpy.sqrt((area * area).sum(axis=1)) <= aTolerance)[0]
+
+
+# The edges used by more than two faces, as (vertex, vertex) rows.
+def findNonManifoldEdges(aCounts, aIndices):
+    counts = numpy.asarray(aCounts, dtype=numpy.int64)
+    indices = numpy.asarray(aIndices, dtype=numpy.int64)
+    if not len(indices):
+        return numpy.zeros((0, 2), dtype=numpy.int64)
+    starts = numpy.cumsum(counts) - counts
+    following = numpy.arange(1, len(indices) + 1)
+    last = starts + counts - 1
+    following[last[counts > 0]] = starts[counts > 0]
+    # Every edge as one number, smallest vertex first, which is much faster
+    # to count than rows.
+    vertexCount = indices.max() + 1
+    keys = (numpy.minimum(indices, indices[following]) * vertexCount +
+            numpy.maximum(indices, indices[following]))
+    keys, edgeCounts = numpy.unique(keys, return_counts=True)
+    keys = keys[edgeCounts > 2]
+    return numpy.column_stack((keys // vertexCount, keys % vertexCount))
+
+
+# An approximation of the faces whose UVs overlap another face. The UV
+# triangles are rasterized at aResolution texels per tile, and faces that
+# cover the center of a texel another face covers are returned. Texel
+# centers on a shared edge belong to neither face, so neighbours don't count
+# as overlapping. Faces smaller than a texel may be missed.
+def findOverlappingUVs(aUVs, aUVCounts, aUVIndices, aResolution=512,
+                       aMaxSamples=20000000):
+    uvs = numpy.asarray(aUVs, dtype=numpy.float64)
+    counts = numpy.asarray(aUVCounts, dtype=numpy.int64)
+    indices = numpy.asarray(aUVIndices, dtype=numpy.int64)
+    if not len(indices):
+        return numpy.zeros(0, dtype=numpy.int64)
+    half = len(uvs) // 2
+    points = numpy.column_stack((uvs[:half], uvs[half:])) * aResolution
+    starts = numpy.cumsum(counts) - counts
+    faces = numpy.repeat(numpy.arange(len(counts)), counts)
+    position = numpy.arange(len(indices)) - starts[faces]
+    fan = numpy.nonzero((position >= 1) & (position < counts[faces] - 1))[0]
+    triangleFaces = faces[fan]
+    a = points[indices[starts[triangleFaces]]]
+    b = points[indices[fan]]
+    c = points[indices[fan + 1]]
+
+    # Every texel center in the bounding box of a triangle is a sample.
+    low = numpy.ceil(numpy.minimum(numpy.minimum(a, b), c) - 0.5)
+    high = numpy.floor(numpy.maximum(numpy.maximum(a, b), c) - 0.5)
+    size = numpy.maximum(high - low + 1, 0).astype(numpy.int64)
+    sampleCounts = size[:, 0] * size[:, 1]
+    if sampleCounts.sum() > aMaxSamples and aResolution > 1:
+        return findOverlappingUVs(aUVs, aUVCounts, aUVIndices,
+                                  aResolution // 2, aMaxSamples)
+    triangles = numpy.repeat(numpy.arange(len(fan)), sampleCounts)
+    offset = (numpy.arange(len(triangles)) -
+              numpy.repeat(numpy.cumsum(sampleCounts) - sampleCounts,
+                           sampleCounts))
+    x = low[triangles, 0] + offset % size[triangles, 0]
+    y = low[triangles, 1] + offset // size[triangles, 0]
+    px, py = x + 0.5, y + 0.5
+
+    def edge(aStart, aEnd):
+        return ((aEnd[triangles, 0] - aStart[triangles, 0]) *
+                (py - aStart[triangles, 1]) -
+                (aEnd[triangles, 1] - aStart[triangles, 1]) *
+                (px - aStart[triangles, 0]))
+
+    e0, e1, e2 = edge(a, b), edge(b, c), edge(c, a)
+    inside = (((e0 > 0) & (e1 > 0) & (e2 > 0)) |
+              ((e0 < 0) & (e1 < 0) & (e2 < 0)))
+    x, y = x[inside].astype(numpy.int64), y[inside].astype(numpy.int64)
+    if not len(x):
+        return numpy.zeros(0, dtype=numpy.int64)
+    texels = (y - y.min()) * (x.max() - x.min() + 1) + x - x.min()
+    sampleFaces = triangleFaces[triangles[inside]]
+    hits = numpy.unique(texels * len(counts) + sampleFaces)
+    texelIds, texelFaces = numpy.unique(hits // len(counts),
+                                        return_counts=True)
+    shared = numpy.isin(hits // len(counts), texelIds[texelFaces > 1])
+    return numpy.unique(hits[shared] % len(counts))
+
+
+# True if the bounding boxes aLowBounds and aHighBounds, as (xmin, ymin,
+# zmin, xmax, ymax, zmax), differ by more than aTolerance of the size of the
+# lowpoly's bounding box on any side.
+def findBoundsMismatch(aLowBounds, aHighBounds, aTolerance=0.05):
+    low = numpy.asarray(aLowBounds, dtype=numpy.float64)
+    high = numpy.asarray(aHighBounds, dtype=numpy.float64)
+    diagonal = numpy.sqrt(((low[3:] - low[:3]) ** 2).sum())
+    return bool(numpy.abs(low - high).max() > aTolerance * max(diagonal,
+                                                               1e-9))
+
+
+# A list of components of aShape for a message. aComponents are the ids in
+# aFormat, e.g. "f[%d]". Only the first aMaxComponents are listed.
+def formatComponents(aShape, aFormat, aComponents,
+                     aMaxComponents=maxComponents):
+    names = [aShape.split('|')[-1] + '.' + aFormat % component
+             for component in aComponents[:aMaxComponents]]
+    if len(aComponents) > aMaxComponents:
+        names.append('...')
+    return ', '.join(names)
@@ -12,6 +12,7 @@ mkdir %TARGET%\maya\plug-ins
 )
 
 copy .\Content\mayaToPainter.py %TARGET%\maya\plug-ins
+robocopy ".\Content\mayaToPainterCore" %TARGET%\maya\plug-ins\mayaToPainterCore /E /XD __pycache__
 CLS
 echo Would you like to install marking menu?(Y/N)
 set INPUT=
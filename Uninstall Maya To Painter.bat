@@ -12,6 +12,7 @@ If /I "%INPUT%"=="n" goto continue
 
 :yes
 del %TARGET%\maya\plug-ins\mayaToPainter.py
+RD %TARGET%\maya\plug-ins\mayaToPainterCore /S /Q
 del %TARGET%\maya\scripts\contextPolyToolsObjectMM.mel
 del %TARGET%\maya\scripts\contextPolyToolsObjectMM.res.mel
 goto version
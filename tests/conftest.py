@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# The Maya-free modules are next to the plugin, in Content.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "Content"))
+# The fake Maya modules are next to the tests.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+# mayaToPainter imported on top of the fake maya and pymel modules in
+# fakeMaya. Yields the plugin module and the FakeMaya, whose optionVars
+# start out empty.
+@pytest.fixture
+def fakeMaya():
+    import fakeMaya as harness
+
+    fake, replaced = harness.install()
+    sys.modules.pop("mayaToPainter", None)
+    try:
+        import mayaToPainter
+        yield mayaToPainter, fake
+    finally:
+        sys.modules.pop("mayaToPainter", None)
+        harness.uninstall(replaced)
+
+
+# The plugin with its export directory in tmp_path. Yields the plugin module
+# and the FakeMaya.
+@pytest.fixture
+def plugin(fakeMaya, tmp_path):
+    mayaToPainter, fake = fakeMaya
+    fake.optionVars["mayaToPainterExportDirectory"] = str(tmp_path)
+    return mayaToPainter, fake
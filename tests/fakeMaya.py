@@ -0,0 +1,127 @@
+"""
+Fake maya and pymel modules, so mayaToPainter can be imported and the parts
+of it that only need optionVars, files and deferred calls can run with a
+plain Python. Anything else a fake module is asked for raises an
+AttributeError, so a test that strays into real Maya calls fails loudly.
+"""
+
+import sys
+import types
+
+
+class FakeMaya(object):
+
+    def __init__(self):
+        self.optionVars = {}
+        self.deferred = []
+        self.warnings = []
+
+    def executeDeferred(self, aFunction, *aArguments):
+        self.deferred.append((aFunction, aArguments))
+
+    # Run the deferred calls, including any they defer themselves.
+    def runDeferred(self):
+        while self.deferred:
+            function, arguments = self.deferred.pop(0)
+            function(*arguments)
+
+    # maya.cmds.optionVar
+    def optionVar(self, exists=None, q=None, sv=None, iv=None, fv=None,
+                  remove=None):
+        if exists is not None:
+            return exists in self.optionVars
+        if q is not None:
+            return self.optionVars.get(q, 0)
+        if remove is not None:
+            self.optionVars.pop(remove, None)
+            return None
+        for value in (sv, iv, fv):
+            if value is not None:
+                self.optionVars[value[0]] = value[1]
+        return None
+
+    def about(self, batch=False, version=False):
+        if version:
+            return "fake"
+        return True
+
+    def warning(self, aMessage):
+        self.warnings.append(aMessage)
+
+    def error(self, aMessage):
+        raise RuntimeError(aMessage)
+
+
+# pymel.core.optionVar, a dictionary that can also be called like the
+# command to remove a variable.
+class FakePymelOptionVars(object):
+
+    def __init__(self, aFake):
+        self.fake = aFake
+
+    def __getitem__(self, aName):
+        return self.fake.optionVars[aName]
+
+    def __setitem__(self, aName, aValue):
+        self.fake.optionVars[aName] = aValue
+
+    def __contains__(self, aName):
+        return aName in self.fake.optionVars
+
+    def __call__(self, remove=None):
+        self.fake.optionVars.pop(remove, None)
+
+
+def makeModule(aName, **aAttributes):
+    module = types.ModuleType(aName)
+    module.__dict__.update(aAttributes)
+    return module
+
+
+moduleNames = ["maya", "maya.cmds", "maya.mel", "maya.utils", "maya.api",
+               "maya.api.OpenMaya", "maya.OpenMaya", "maya.OpenMayaMPx",
+               "pymel", "pymel.core"]
+
+
+# Put the fake modules in sys.modules, and return the FakeMaya behind them
+# together with the modules they replaced, for uninstall.
+def install():
+    fake = FakeMaya()
+    replaced = dict((name, sys.modules.get(name)) for name in moduleNames)
+
+    optionVars = FakePymelOptionVars(fake)
+    modules = {
+        "maya.cmds": makeModule("maya.cmds", optionVar=fake.optionVar,
+                                about=fake.about, warning=fake.warning,
+                                error=fake.error),
+        "maya.mel": makeModule("maya.mel"),
+        "maya.utils": makeModule("maya.utils",
+                                 executeDeferred=fake.executeDeferred),
+        "maya.api.OpenMaya": makeModule("maya.api.OpenMaya"),
+        "maya.OpenMaya": makeModule("maya.OpenMaya"),
+        "maya.OpenMayaMPx": makeModule("maya.OpenMayaMPx",
+                                       MPxCommand=object),
+        "pymel.core": makeModule("pymel.core", optionVar=optionVars,
+                                 env=makeModule("env",
+                                                optionVars=optionVars),
+                                 warning=fake.warning, error=fake.error),
+    }
+    modules["maya.api"] = makeModule("maya.api",
+                                     OpenMaya=modules["maya.api.OpenMaya"])
+    modules["maya"] = makeModule("maya", cmds=modules["maya.cmds"],
+                                 mel=modules["maya.mel"],
+                                 utils=modules["maya.utils"],
+                                 api=modules["maya.api"],
+                                 OpenMaya=modules["maya.OpenMaya"],
+                                 OpenMayaMPx=modules["maya.OpenMayaMPx"])
+    modules["pymel"] = makeModule("pymel", core=modules["pymel.core"])
+    sys.modules.update(modules)
+    return fake, replaced
+
+
+def uninstall(aReplaced):
+    for name, module in aReplaced.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
@@ -0,0 +1,143 @@
+import os
+import threading
+
+from mayaToPainterCore.backgroundExport import (BackgroundExporter,
+                                                exportWorkerScript,
+                                                getSnapshotPath,
+                                                getWorkerArguments)
+
+
+# Stands in for a worker process. Jobs with "fail" in the file name exit
+# with an error, like a worker that couldn't write its file.
+class FakeProcess(object):
+
+    def __init__(self, aJob, aTracker):
+        self.job = aJob
+        self.tracker = aTracker
+        self.returncode = None
+
+    def communicate(self):
+        with self.tracker["lock"]:
+            self.tracker["running"] += 1
+            self.tracker["peak"] = max(self.tracker["peak"],
+                                       self.tracker["running"])
+        self.tracker["release"].wait(5)
+        with self.tracker["lock"]:
+            self.tracker["running"] -= 1
+        if "fail" in self.job["filename"]:
+            self.returncode = 1
+            return b"", b"Couldn't write " + self.job["filename"].encode()
+        self.returncode = 0
+        return b"", b""
+
+
+# Runs aJobs through a BackgroundExporter with fake workers, and returns the
+# finished jobs, the jobs reported as progress and the peak worker count.
+def runFakeExport(aJobs, aMaxWorkers=2, aCreateProcess=None):
+    tracker = {"lock": threading.Lock(), "running": 0, "peak": 0,
+               "release": threading.Event()}
+    progress = []
+    finished = []
+    done = threading.Event()
+
+    def onFinished(aJobs):
+        finished.append(aJobs)
+        done.set()
+
+    exporter = BackgroundExporter(
+        aCreateProcess=aCreateProcess or (
+            lambda aJob: FakeProcess(aJob, tracker)),
+        aMaxWorkers=aMaxWorkers)
+    exporter.run(aJobs, progress.append, onFinished)
+    tracker["release"].set()
+    assert done.wait(5)
+    return finished, progress, tracker["peak"]
+
+
+def makeJobs(aNames):
+    return [{"snapshot": "snapshot_%s.mb" % name,
+             "filename": "%s.fbx" % name,
+             "command": "FBXExport"} for name in aNames]
+
+
+def testEveryJobIsReportedAndFinishedOnce():
+    jobs = makeJobs(["a", "b", "c", "d", "e"])
+    finished, progress, peak = runFakeExport(jobs)
+    assert len(finished) == 1
+    assert finished[0] is jobs
+    assert sorted(job["filename"] for job in progress) == sorted(
+        job["filename"] for job in jobs)
+    assert all(job["returncode"] == 0 for job in jobs)
+    assert all(job["seconds"] >= 0 for job in jobs)
+
+
+def testWorkersAreLimited():
+    jobs = makeJobs(["a", "b", "c", "d", "e", "f"])
+    finished, progress, peak = runFakeExport(jobs, aMaxWorkers=2)
+    assert 1 <= peak <= 2
+
+
+def testFailedWorkerKeepsItsError():
+    jobs = makeJobs(["ok", "fail"])
+    runFakeExport(jobs)
+    assert jobs[0]["returncode"] == 0 and jobs[0]["error"] == ""
+    assert jobs[1]["returncode"] == 1
+    assert "Couldn't write fail.fbx" in jobs[1]["error"]
+
+
+def testWorkerThatCantStartIsReported():
+    def createProcess(aJob):
+        raise OSError("mayapy not found")
+
+    jobs = makeJobs(["a", "b"])
+    finished, progress, peak = runFakeExport(jobs,
+                                             aCreateProcess=createProcess)
+    assert len(finished) == 1
+    assert all(job["returncode"] == -1 for job in jobs)
+    assert all(job["error"] == "mayapy not found" for job in jobs)
+
+
+def testCallbacksGoThroughDispatch():
+    calls = []
+    done = threading.Event()
+
+    def dispatch(aFunction, *aArguments):
+        calls.append(aFunction.__name__)
+        aFunction(*aArguments)
+
+    def onProgress(aJob):
+        pass
+
+    def onFinished(aJobs):
+        done.set()
+
+    class Process(object):
+        returncode = 0
+
+        def communicate(self):
+            return b"", b""
+
+    BackgroundExporter(aCreateProcess=lambda aJob: Process(),
+                       aDispatch=dispatch).run(makeJobs(["a"]), onProgress,
+                                               onFinished)
+    assert done.wait(5)
+    assert calls == ["onProgress", "onFinished"]
+
+
+def testSnapshotPathsAreUnique():
+    first = getSnapshotPath("temp", os.path.join("a", "box_low.fbx"))
+    second = getSnapshotPath("temp", os.path.join("b", "box_low.fbx"))
+    assert first != second
+    assert os.path.dirname(first) == "temp"
+    assert os.path.basename(first).startswith("snapshot_box_low_")
+    assert first.endswith(".mb")
+
+
+def testWorkerArgumentsFollowTheProtocol():
+    job = {"snapshot": "snapshot.mb", "filename": "box.fbx",
+           "command": 'FBXExport -f "box.fbx" -s'}
+    arguments = getWorkerArguments(job, "mayapy")
+    assert arguments == ["mayapy", "-c", exportWorkerScript, "snapshot.mb",
+                         "box.fbx", 'FBXExport -f "box.fbx" -s']
+    assert "sys.argv[1]" in exportWorkerScript
+    assert "sys.argv[3]" in exportWorkerScript
@@ -0,0 +1,74 @@
+import pytest
+
+
+@pytest.fixture
+def sent(plugin, monkeypatch):
+    mayaToPainter, fake = plugin
+    sent = []
+    monkeypatch.setattr(mayaToPainter.getPainterLink(), "send", sent.append)
+    monkeypatch.setattr(mayaToPainter, "writeTimingLine", lambda aLine: None)
+    monkeypatch.setattr(mayaToPainter, "getUdimSettings", lambda aLow: {})
+    yield sent
+    mayaToPainter.stopBakeJobTimer()
+
+
+def queueJobs(aPlugin, aNames):
+    mayaToPainter, fake = aPlugin
+    for name in aNames:
+        mayaToPainter.queueBakeJob(name, name + "_low.fbx", [], name + ".spp",
+                                   {"Output_Size": [10, 10]})
+    mayaToPainter.bakeQueueState["running"] = True
+    mayaToPainter.runNextBakeJob()
+    return mayaToPainter.getBakeQueue().get("jobs")
+
+
+def testOpenProjectStopsTheQueue(plugin, sent):
+    mayaToPainter, fake = plugin
+    jobs = queueJobs(plugin, ["a", "b"])
+    mayaToPainter.onBakeJobDone({"id": jobs[0]["id"], "seconds": 0.0,
+                                 "error": "open", "projectOpen": True})
+    assert not mayaToPainter.bakeQueueState["running"]
+    assert [job["status"] for job in jobs] == ["queued", "queued"]
+    assert jobs[0]["attempts"] == 0
+    assert len(sent) == 1
+    assert "project is open" in fake.warnings[-1]
+
+
+def testTimedOutJobIsQueuedAgain(plugin, sent):
+    mayaToPainter, fake = plugin
+    jobs = queueJobs(plugin, ["a"])
+    mayaToPainter.onBakeJobTimedOut(jobs[0]["id"], jobs[0]["started"])
+    # It's handed to Painter again right away.
+    assert jobs[0]["status"] == "running"
+    assert jobs[0]["attempts"] == 2
+    assert len(sent) == 2
+
+
+def testJobFailsAfterItsLastAttempt(plugin, sent, monkeypatch):
+    mayaToPainter, fake = plugin
+    monkeypatch.setattr(mayaToPainter, "bakeJobAttempts", 1)
+    jobs = queueJobs(plugin, ["a"])
+    mayaToPainter.onBakeJobTimedOut(jobs[0]["id"], jobs[0]["started"])
+    assert jobs[0]["status"] == "failed"
+    assert not mayaToPainter.bakeQueueState["running"]
+
+
+def testLateReportOfATimedOutJobIsIgnored(plugin, sent, monkeypatch):
+    mayaToPainter, fake = plugin
+    monkeypatch.setattr(mayaToPainter, "bakeJobAttempts", 1)
+    jobs = queueJobs(plugin, ["a"])
+    mayaToPainter.onBakeJobTimedOut(jobs[0]["id"], jobs[0]["started"])
+    mayaToPainter.onBakeJobDone({"id": jobs[0]["id"], "seconds": 1.0,
+                                 "error": ""})
+    assert jobs[0]["status"] == "failed"
+
+
+def testJobParametersLeaveOutTheStoreVersion(plugin, sent, tmp_path, monkeypatch):
+    mayaToPainter, fake = plugin
+    store = mayaToPainter.JsonStateStore(
+        str(tmp_path / "bakingParameters.json"),
+        {"Output_Size": [11, 11]})
+    store.update({"Match": 1})
+    monkeypatch.setattr(mayaToPainter, "bakingParametersStore", store)
+    job = mayaToPainter.queueBakeJob("a", "a_low.fbx", [], "a.spp")
+    assert job["bakingParameters"] == {"Output_Size": [11, 11], "Match": 1}
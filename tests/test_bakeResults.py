@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+
+def writeResults(aDirectory, aProjects):
+    with open(str(aDirectory / "bakeResults.jsonl"), 'w') as resultsFile:
+        for project in aProjects:
+            resultsFile.write(json.dumps({"project": project}) + '\n')
+
+
+@pytest.mark.parametrize("blockSize", [7, 65536])
+def testLastLinesAreReadFromTheEnd(tmp_path, fakeMaya, blockSize):
+    mayaToPainter, fake = fakeMaya
+    path = tmp_path / "log.jsonl"
+    path.write_text("".join("line %d\n" % i for i in range(100)))
+    assert (mayaToPainter.readLastLines(str(path), 3, blockSize) ==
+            ["line 97", "line 98", "line 99"])
+    assert len(mayaToPainter.readLastLines(str(path), 500, blockSize)) == 100
+
+
+def testRecentResultsAreNewestFirst(plugin, tmp_path, monkeypatch):
+    mayaToPainter, fake = plugin
+    monkeypatch.setattr(mayaToPainter, "maxRecentBakeResults", 2)
+    writeResults(tmp_path, ["a", "b", "c"])
+    assert ([result["project"]
+             for result in mayaToPainter.getRecentBakeResults()] ==
+            ["c", "b"])
+
+
+def testRecentResultsFollowTheExportDirectory(plugin, tmp_path):
+    mayaToPainter, fake = plugin
+    other = tmp_path / "other"
+    other.mkdir()
+    writeResults(tmp_path, ["a"])
+    writeResults(other, ["b"])
+    assert mayaToPainter.getRecentBakeResults()[0]["project"] == "a"
+    fake.optionVars["mayaToPainterExportDirectory"] = str(other)
+    assert mayaToPainter.getRecentBakeResults()[0]["project"] == "b"
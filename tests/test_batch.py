@@ -0,0 +1,19 @@
+def testNestedPartsArePairedWithTheirGroup(fakeMaya):
+    mayaToPainter, fake = fakeMaya
+    transforms = ["|robot_low", "|robot_low|arm_low", "|robot_low|leg_low",
+                  "|robot_high", "|robot_high|arm_high",
+                  "|robot_high|leg_high"]
+    pairs, unmatched, duplicates = mayaToPainter.findLowHighPairs(transforms)
+    assert pairs == [("robot", "|robot_low", "|robot_high")]
+    assert not unmatched
+    assert not duplicates
+
+
+def testPartsUnderAPlainGroupArePaired(fakeMaya):
+    mayaToPainter, fake = fakeMaya
+    transforms = ["|props", "|props|box_low", "|props|box_high",
+                  "|props|lamp_low", "|other|box_low"]
+    pairs, unmatched, duplicates = mayaToPainter.findLowHighPairs(transforms)
+    assert pairs == [("box", "|props|box_low", "|props|box_high")]
+    assert unmatched == ["|props|lamp_low"]
+    assert duplicates == ["|other|box_low"]
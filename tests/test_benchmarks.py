@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import threading
+
+import pytest
+
+
+# The benchmark folders go in their own temp directory, next to the user's
+# export directory.
+@pytest.fixture(autouse=True)
+def benchmarkTemp(plugin, tmp_path, monkeypatch):
+    mayaToPainter, fake = plugin
+    tempDir = tmp_path / "temp"
+    tempDir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tempDir))
+    fake.optionVars.update({
+        "mayaToPainterBackgroundExport": 1,
+        "mayaToPainterDiskBudgetMB": 0,
+    })
+    yield tempDir
+    mayaToPainter.waitForCleanup()
+
+
+def createUserExport(aPlugin, aFake, aName):
+    path = os.path.join(aFake.optionVars["mayaToPainterExportDirectory"],
+                        aName)
+    with open(path, "w") as exportFile:
+        exportFile.write("mesh")
+    aPlugin.addObjectToList(path)
+    aFake.runDeferred()
+    return path
+
+
+def testCleanupBenchmarkWaitsForDeletes(plugin):
+    mayaToPainter, fake = plugin
+    results = []
+
+    with mayaToPainter.benchmarkExportDirectory() as benchmarkDir:
+        def record(aName, aCount, aSeconds):
+            # The files are already gone when the time is recorded.
+            results.append((aName, sorted(
+                name.split("_")[-1] for name in os.listdir(benchmarkDir)
+                if name.endswith(".fbx"))))
+
+        mayaToPainter.benchmarkCleanup(20, record)
+
+    assert results == [("addObjectToList", ["high.fbx"] * 10 +
+                        ["low.fbx"] * 10),
+                       ("removeNotLowHighTempFiles", ["high.fbx"] * 10 +
+                        ["low.fbx"] * 10),
+                       ("removeHighTempFiles", ["low.fbx"] * 10),
+                       ("removeLowTempFiles", []),
+                       ("removeAllTempFiles", [])]
+
+
+def testBenchmarksLeaveTheUserRegistryAlone(plugin):
+    mayaToPainter, fake = plugin
+    userFile = createUserExport(mayaToPainter, fake, "box_low.fbx")
+    userDir = fake.optionVars["mayaToPainterExportDirectory"]
+
+    with mayaToPainter.benchmarkExportDirectory() as benchmarkDir:
+        assert benchmarkDir != userDir
+        assert fake.optionVars["mayaToPainterExportDirectory"] == benchmarkDir
+        assert fake.optionVars["mayaToPainterBackgroundExport"] == 0
+        mayaToPainter.benchmarkCleanup(10, lambda *aResult: None)
+        mayaToPainter.removeAndWait(mayaToPainter.removeAllTempFiles)
+    fake.runDeferred()
+
+    assert fake.optionVars["mayaToPainterExportDirectory"] == userDir
+    assert fake.optionVars["mayaToPainterBackgroundExport"] == 1
+    assert not os.path.exists(benchmarkDir)
+    assert os.path.isfile(userFile)
+    assert mayaToPainter.getExportRegistry().paths() == [userFile]
+
+
+def testOldOptionVarFilesStayWithTheUser(plugin, tmp_path):
+    mayaToPainter, fake = plugin
+    oldFile = tmp_path / "old_high.fbx"
+    oldFile.write_text("mesh")
+    fake.optionVars["mayaToPainterExportedFiles"] = [str(oldFile)]
+
+    with mayaToPainter.benchmarkExportDirectory():
+        mayaToPainter.removeAndWait(mayaToPainter.removeAllTempFiles)
+    fake.runDeferred()
+
+    assert oldFile.is_file()
+    assert mayaToPainter.getExportRegistry().paths() == [str(oldFile)]
+    registryPath = tmp_path / "mayaToPainterExports.json"
+    assert str(oldFile) in json.loads(registryPath.read_text())["files"]
+
+
+def testBenchmarkFilesWaitForPendingDeletes(plugin, monkeypatch):
+    mayaToPainter, fake = plugin
+    release = threading.Event()
+    deleteFile = mayaToPainter.deleteFile
+
+    def slowDelete(aFilename):
+        release.wait(5)
+        return deleteFile(aFilename)
+
+    monkeypatch.setattr(mayaToPainter, "deleteFile", slowDelete)
+    with mayaToPainter.benchmarkExportDirectory():
+        filenames = mayaToPainter.createBenchmarkFiles(4)
+        for filename in filenames:
+            mayaToPainter.addObjectToList(filename)
+        mayaToPainter.removeAllTempFiles()
+        threading.Timer(0.2, release.set).start()
+        filenames = mayaToPainter.createBenchmarkFiles(4)
+        mayaToPainter.waitForCleanup()
+        assert all(os.path.isfile(filename) for filename in filenames)
+
@@ -0,0 +1,21 @@
+def testSplitFacesAlongLongestAxis(fakeMaya):
+    mayaToPainter, fake = fakeMaya
+    centers = [[0.0, 0.0, x] for x in (5.0, 1.0, 3.0, 0.0, 4.0, 2.0)]
+    axis, chunks = mayaToPainter.splitFacesSpatially(centers, 3)
+    assert axis == 2
+    assert [sorted(int(face) for face in faces) for faces in chunks] == [
+        [1, 3], [2, 5], [0, 4]]
+
+
+def testChunkBoundsGrowAlongTheAxis(fakeMaya):
+    mayaToPainter, fake = fakeMaya
+    centers = [[x * 7 % 11, 0.0, 0.0] for x in range(22)]
+    axis, chunks = mayaToPainter.splitFacesSpatially(centers, 4)
+    bounds = [max(centers[face][axis] for face in faces) for faces in chunks]
+    assert bounds == sorted(bounds)
+    assert sum(len(faces) for faces in chunks) == len(centers)
+
+
+def testSplitWithoutFaces(fakeMaya):
+    mayaToPainter, fake = fakeMaya
+    assert mayaToPainter.splitFacesSpatially([], 3) == (0, [])
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+import pytest
+
+
+@pytest.mark.parametrize("path, role", [
+    ("box_low.fbx", "low"),
+    ("box_high.fbx", "high"),
+    ("box_high_part01.fbx", "high"),
+    ("box_high_proxy.abc", "high"),
+    (os.path.join("exports_low", "box.fbx"), "other"),
+    ("flow_lowres.fbx", "other"),
+    ("highway_sign.obj", "other"),
+    ("box_low_part01.fbx", "low"),
+    ("box_highres_low.fbx", "low"),
+    ("box_lowpoly.fbx", "other"),
+    ("box.fbx", "other"),
+])
+def testExportRoleUsesTheEndOfTheName(plugin, path, role):
+    mayaToPainter, fake = plugin
+    assert mayaToPainter.getExportRole(path) == role
+
+
+@pytest.mark.parametrize("name, role", [
+    ("box_low", "low"),
+    ("|grp|box_high", "high"),
+    ("flow_lowres", "other"),
+    ("box_high_01", "other"),
+    ("box_lowpoly", "other"),
+])
+def testObjectRoleUsesTheEndOfTheName(plugin, name, role):
+    mayaToPainter, fake = plugin
+    assert mayaToPainter.getObjectRole(name) == role
+
+
+def testHighpolyPathsOnlyReplaceTheSuffix(plugin, tmp_path):
+    mayaToPainter, fake = plugin
+    fake.optionVars["mayaToPainterIterationQuality"] = 0
+    highpoly = tmp_path / "flow_lowres_high.fbx"
+    highpoly.write_text("mesh")
+    assert mayaToPainter.getHighpolyPaths(
+        str(tmp_path / "flow_lowres_low.fbx")) == [str(highpoly)]
+    assert mayaToPainter.getHighpolyPaths(
+        str(tmp_path / "flow_lowres.fbx")) == []
+
+
+def testCleanupRemovesByRole(plugin, tmp_path):
+    mayaToPainter, fake = plugin
+    paths = {}
+    for name in ("box_low.fbx", "box_high.fbx", "flow_lowres.fbx"):
+        paths[name] = str(tmp_path / name)
+        (tmp_path / name).write_text("mesh")
+        mayaToPainter.addObjectToList(paths[name])
+
+    mayaToPainter.removeAndWait(mayaToPainter.removeLowTempFiles)
+    fake.runDeferred()
+    assert sorted(name for name in os.listdir(str(tmp_path))
+                  if name.endswith(".fbx")) == ["box_high.fbx",
+                                                "flow_lowres.fbx"]
+    assert mayaToPainter.getExportRegistry().paths(["other"]) == [
+        paths["flow_lowres.fbx"]]
+
+
+# Replaces deleteFile with one that waits for the returned event, and
+# records which files it has started on.
+def blockDeletes(aPlugin, aMonkeypatch):
+    release = threading.Event()
+    started = []
+    deleteFile = aPlugin.deleteFile
+
+    def slowDelete(aFilename):
+        started.append(aFilename)
+        release.wait(5)
+        return deleteFile(aFilename)
+
+    aMonkeypatch.setattr(aPlugin, "deleteFile", slowDelete)
+    return release, started
+
+
+def testQueuedDeleteIsCancelledBeforeWriting(plugin, tmp_path, monkeypatch):
+    mayaToPainter, fake = plugin
+    release, started = blockDeletes(mayaToPainter, monkeypatch)
+    # Two files and their assbin files keep all four delete threads busy.
+    for name in ("a_low.fbx", "b_low.fbx", "box_high.fbx"):
+        (tmp_path / name).write_text("mesh")
+        mayaToPainter.addObjectToList(str(tmp_path / name))
+    mayaToPainter.getExportRegistry().remove([str(tmp_path / "a_low.fbx"),
+                                              str(tmp_path / "b_low.fbx")])
+    mayaToPainter.removeHighTempFiles()
+
+    highpoly = str(tmp_path / "box_high.fbx")
+    assert highpoly not in started
+    mayaToPainter.keepExportPath(highpoly)
+    (tmp_path / "box_high.fbx").write_text("new mesh")
+    release.set()
+    mayaToPainter.waitForCleanup()
+    fake.runDeferred()
+
+    assert (tmp_path / "box_high.fbx").read_text() == "new mesh"
+    assert highpoly not in started
+    assert not (tmp_path / "a_low.fbx").exists()
+
+
+def testRunningDeleteIsWaitedForBeforeWriting(plugin, tmp_path,
+                                              monkeypatch):
+    mayaToPainter, fake = plugin
+    release, started = blockDeletes(mayaToPainter, monkeypatch)
+    (tmp_path / "box_low.fbx").write_text("mesh")
+    lowpoly = str(tmp_path / "box_low.fbx")
+    mayaToPainter.addObjectToList(lowpoly)
+    mayaToPainter.removeLowTempFiles()
+
+    deadline = time.time() + 5
+    while lowpoly not in started and time.time() < deadline:
+        time.sleep(0.01)
+    threading.Timer(0.1, release.set).start()
+    mayaToPainter.keepExportPath(lowpoly)
+    assert not (tmp_path / "box_low.fbx").exists()
+    (tmp_path / "box_low.fbx").write_text("new mesh")
+    mayaToPainter.waitForCleanup()
+    fake.runDeferred()
+
+    assert (tmp_path / "box_low.fbx").read_text() == "new mesh"
@@ -0,0 +1,101 @@
+from array import array
+
+import pytest
+
+from mayaToPainterCore.fingerprint import (computeFingerprint,
+                                           computeMeshFingerprint)
+
+
+# Hands out mesh data like mayaToPainter.getMeshData does, from plain
+# descriptions instead of a Maya scene.
+class FakeMeshProvider(object):
+
+    def __init__(self):
+        self.meshes = {}
+
+    def addPlane(self, aName, aOffset=0.0, aMaterial="lambert1"):
+        self.meshes[aName] = {
+            "name": aName,
+            "points": [aOffset, 0.0, 0.0, 1.0, 0.0, 0.0,
+                       1.0, 0.0, 1.0, aOffset, 0.0, 1.0],
+            "counts": [4],
+            "indices": [0, 1, 2, 3],
+            "uvs": [0.0, 1.0, 1.0, 0.0, 0.0, 0.0, 1.0, 1.0],
+            "uvIndices": [0, 1, 2, 3],
+            "matrix": [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                       0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0],
+            "materials": [aMaterial],
+            "faceMaterials": [0],
+        }
+
+    def getMeshData(self, aNames):
+        return [dict(self.meshes[name]) for name in aNames]
+
+
+@pytest.fixture
+def provider():
+    meshProvider = FakeMeshProvider()
+    meshProvider.addPlane("|a|aShape")
+    meshProvider.addPlane("|b|bShape")
+    return meshProvider
+
+
+def testSameMeshesGiveSameFingerprint(provider):
+    assert (computeFingerprint(provider.getMeshData(["|a|aShape"])) ==
+            computeFingerprint(provider.getMeshData(["|a|aShape"])))
+
+
+def testOrderOfMeshesDoesNotMatter(provider):
+    assert (computeFingerprint(provider.getMeshData(["|a|aShape",
+                                                     "|b|bShape"])) ==
+            computeFingerprint(provider.getMeshData(["|b|bShape",
+                                                     "|a|aShape"])))
+
+
+@pytest.mark.parametrize("key, value", [
+    ("name", "|c|cShape"),
+    ("points", [0.5, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 1.0, 0.0, 0.0, 1.0]),
+    ("indices", [0, 1, 3, 2]),
+    ("uvs", [0.0, 1.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.5]),
+    ("matrix", [2.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]),
+    ("materials", ["blinn1SG"]),
+    ("faceMaterials", [-1]),
+])
+def testChangesChangeFingerprint(provider, key, value):
+    mesh = provider.getMeshData(["|a|aShape"])[0]
+    before = computeFingerprint([mesh])
+    mesh[key] = value
+    assert computeFingerprint([mesh]) != before
+
+
+def testArraysGiveSameFingerprintAsLists(provider):
+    mesh = provider.getMeshData(["|a|aShape"])[0]
+    packed = dict(mesh,
+                  points=array("f", mesh["points"]),
+                  counts=array("i", mesh["counts"]),
+                  indices=array("i", mesh["indices"]),
+                  uvs=array("f", mesh["uvs"]),
+                  uvIndices=array("i", mesh["uvIndices"]),
+                  faceMaterials=array("i", mesh["faceMaterials"]))
+    assert computeFingerprint([packed]) == computeFingerprint([mesh])
+
+
+def testNumpyArraysGiveSameFingerprintAsLists(provider):
+    numpy = pytest.importorskip("numpy")
+    mesh = provider.getMeshData(["|a|aShape"])[0]
+    packed = dict(mesh,
+                  points=numpy.array(mesh["points"],
+                                     dtype=numpy.float32).reshape(-1, 3),
+                  counts=numpy.array(mesh["counts"]),
+                  uvs=numpy.array(mesh["uvs"], dtype=numpy.float64))
+    assert computeFingerprint([packed]) == computeFingerprint([mesh])
+
+
+def testKnownMeshFingerprintsGiveSameFingerprint(provider):
+    meshes = provider.getMeshData(["|a|aShape", "|b|bShape"])
+    meshFingerprints = [computeMeshFingerprint(mesh) for mesh in meshes]
+    assert (computeFingerprint(meshes, meshFingerprints) ==
+            computeFingerprint(meshes))
+    assert (computeFingerprint(meshes) ==
+            computeFingerprint(list(reversed(meshes))))
@@ -0,0 +1,27 @@
+import pytest
+
+
+def testGetOptionFallsBackToTheDefault(plugin):
+    mayaToPainter, fake = plugin
+    assert mayaToPainter.getOption("mayaToPainterSPDirectory") is None
+    assert mayaToPainter.getOption("mayaToPainterSPDirectory", "") == ""
+    fake.optionVars["mayaToPainterSPDirectory"] = "painter.exe"
+    assert mayaToPainter.getOption("mayaToPainterSPDirectory") == "painter.exe"
+
+
+def testExportOnlyDoesNotNeedThePainterPath(plugin):
+    mayaToPainter, fake = plugin
+    mayaToPainter.verifyPaths(False)
+
+
+def testMissingPainterPathIsAnError(plugin):
+    mayaToPainter, fake = plugin
+    with pytest.raises(RuntimeError, match="Substance Painter executable"):
+        mayaToPainter.verifyPaths()
+
+
+def testMissingExportPathIsAnError(plugin, tmp_path):
+    mayaToPainter, fake = plugin
+    fake.optionVars["mayaToPainterExportDirectory"] = str(tmp_path / "nope")
+    with pytest.raises(RuntimeError, match="is not a path"):
+        mayaToPainter.verifyPaths(False)
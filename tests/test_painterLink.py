@@ -0,0 +1,172 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from mayaToPainterCore.painterLink import (PainterLink, PainterLinkStandIn,
+                                           encodeFrame, openWebSocket,
+                                           readFrame, readMessage,
+                                           websocketAccept)
+
+
+# Waits until aCondition() is true, or fails after aTimeout seconds.
+def waitFor(aCondition, aTimeout=5.0):
+    deadline = time.time() + aTimeout
+    while time.time() < deadline:
+        if aCondition():
+            return
+        time.sleep(0.01)
+    pytest.fail("Timed out")
+
+
+@pytest.fixture
+def standIn():
+    server = PainterLinkStandIn(aPort=0)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def socketPair():
+    first, second = socket.socketpair()
+    yield first, second
+    first.close()
+    second.close()
+
+
+def testAcceptMatchesTheSpecification():
+    # The example from RFC 6455.
+    assert (websocketAccept("dGhlIHNhbXBsZSBub25jZQ==") ==
+            "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=")
+
+
+@pytest.mark.parametrize("size", [0, 1, 125, 126, 65535, 65536, 200000])
+@pytest.mark.parametrize("mask", [True, False])
+def testFramesRoundTrip(socketPair, size, mask):
+    payload = bytes(bytearray(i % 251 for i in range(size)))
+    writer, reader = socketPair
+    sender = threading.Thread(target=writer.sendall,
+                              args=(encodeFrame(payload, aMask=mask),))
+    sender.start()
+    final, opcode, received = readFrame(reader)
+    sender.join()
+    assert final
+    assert opcode == 0x1
+    assert received == payload
+
+
+def testOnlyClientFramesAreMasked():
+    assert encodeFrame(b"abc", aMask=True)[1] & 0x80
+    assert not encodeFrame(b"abc", aMask=False)[1] & 0x80
+    assert encodeFrame(b"abc", aMask=False)[2:] == b"abc"
+
+
+def testPingsAreAnswered(socketPair):
+    client, server = socketPair
+    server.sendall(encodeFrame(b"ping", 0x9, aMask=False) +
+                   encodeFrame(b'{"type": "x"}', aMask=False))
+    assert readMessage(client) == '{"type": "x"}'
+    assert readFrame(server) == (True, 0xA, b"ping")
+
+
+def testCloseEndsTheMessages(socketPair):
+    client, server = socketPair
+    server.sendall(encodeFrame(b"", 0x8, aMask=False))
+    assert readMessage(client) is None
+
+
+def testHandshakeWithStandIn(standIn):
+    linkSocket = openWebSocket(standIn.port)
+    try:
+        linkSocket.sendall(encodeFrame(b'{"type": "bake"}'))
+        waitFor(lambda: standIn.messages)
+        assert standIn.messages == [{"type": "bake"}]
+    finally:
+        linkSocket.close()
+
+
+def testHandshakeFailsWithoutWebSocket():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def answer():
+        client, address = server.accept()
+        client.recv(4096)
+        client.sendall(b"HTTP/1.1 404 Not Found\r\n\r\n")
+        client.close()
+
+    thread = threading.Thread(target=answer)
+    thread.start()
+    try:
+        with pytest.raises(IOError):
+            openWebSocket(server.getsockname()[1])
+    finally:
+        thread.join()
+        server.close()
+
+
+def testLinkSendsAndReceivesMessages(standIn):
+    received = []
+    link = PainterLink(aPort=standIn.port,
+                       aHandlers={"bakeResult": received.append})
+    try:
+        link.send({"type": "batch", "manifest": {"pairs": []}})
+        waitFor(lambda: standIn.messages)
+        assert standIn.messages == [{"type": "batch",
+                                     "manifest": {"pairs": []}}]
+        assert link.isConnected()
+
+        standIn.send({"type": "bakeResult", "status": "done"})
+        standIn.send({"type": "unknown"})
+        waitFor(lambda: received)
+        assert received == [{"type": "bakeResult", "status": "done"}]
+    finally:
+        link.close()
+
+
+def testHandlersCanBeAddedAfterTheLinkIsMade(standIn):
+    handlers = {}
+    received = []
+    link = PainterLink(aPort=standIn.port, aHandlers=handlers)
+    try:
+        handlers["ready"] = received.append
+        link.send({"type": "hello"})
+        waitFor(lambda: standIn.messages)
+        standIn.send({"type": "ready"})
+        waitFor(lambda: received)
+        assert received == [{"type": "ready"}]
+    finally:
+        link.close()
+
+
+def testStandInAnswersThroughOnMessage():
+    received = []
+    server = PainterLinkStandIn(
+        aPort=0, aOnMessage=lambda aServer, aMessage: aServer.send(
+            {"type": "echo", "message": aMessage}))
+    link = PainterLink(aPort=server.port,
+                       aHandlers={"echo": received.append})
+    try:
+        link.send({"type": "bake"})
+        waitFor(lambda: received)
+        assert received == [{"type": "echo", "message": {"type": "bake"}}]
+    finally:
+        link.close()
+        server.close()
+
+
+def testUndeliveredRequestsAreReported():
+    unused = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    unused.bind(("127.0.0.1", 0))
+    port = unused.getsockname()[1]
+    unused.close()
+
+    warnings = []
+    link = PainterLink(aPort=port, aConnectTimeout=0.1,
+                       aWarn=warnings.append)
+    link.send({"type": "bake"})
+    waitFor(lambda: warnings)
+    assert "1 request(s) not delivered" in warnings[0]
+    assert not link.isConnected()
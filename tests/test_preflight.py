@@ -0,0 +1,97 @@
+import pytest
+
+from mayaToPainterCore.preflight import (findBoundsMismatch,
+                                         findNonManifoldEdges,
+                                         findOverlappingUVs,
+                                         findZeroAreaFaces,
+                                         formatComponents)
+
+# The checks are only run when numpy is installed.
+pytest.importorskip("numpy")
+
+
+# A 2x1 grid of quads in the XZ plane: vertices 0-2 along z=0 and 3-5
+# along z=1.
+gridPoints = [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 2.0, 0.0, 0.0,
+              0.0, 0.0, 1.0, 1.0, 0.0, 1.0, 2.0, 0.0, 1.0]
+gridCounts = [4, 4]
+gridIndices = [0, 1, 4, 3, 1, 2, 5, 4]
+
+
+def testFlatGridHasNoZeroAreaFaces():
+    assert not len(findZeroAreaFaces(gridPoints, gridCounts, gridIndices))
+
+
+def testCollapsedFaceHasZeroArea():
+    points = list(gridPoints)
+    # Move vertex 5 onto vertex 4, and vertex 2 onto vertex 1.
+    points[15:18] = points[12:15]
+    points[6:9] = points[3:6]
+    assert findZeroAreaFaces(points, gridCounts, gridIndices).tolist() == [1]
+
+
+def testTrianglesAndNgonsAreMeasured():
+    points = [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 1.0,
+              0.5, 0.0, 1.5, 0.0, 0.0, 1.0]
+    assert not len(findZeroAreaFaces(points, [3, 5],
+                                     [0, 1, 2, 0, 1, 2, 3, 4]))
+
+
+def testSharedEdgeIsManifold():
+    assert not len(findNonManifoldEdges(gridCounts, gridIndices))
+
+
+def testEdgeWithThreeFacesIsNonManifold():
+    # A third quad hangs off the edge between vertices 1 and 4.
+    counts = gridCounts + [4]
+    indices = gridIndices + [1, 4, 7, 6]
+    assert findNonManifoldEdges(counts, indices).tolist() == [[1, 4]]
+
+
+def testNoFacesHaveNoNonManifoldEdges():
+    assert findNonManifoldEdges([], []).shape == (0, 2)
+
+
+# UVs of two quads, the second moved by aOffset in U. All U values come
+# first, then all V values, like MFnMesh.getUVs.
+def twoQuadUVs(aOffset):
+    us = [0.1, 0.4, 0.4, 0.1, 0.1 + aOffset, 0.4 + aOffset, 0.4 + aOffset,
+          0.1 + aOffset]
+    vs = [0.1, 0.1, 0.4, 0.4] * 2
+    return us + vs, [4, 4], list(range(8))
+
+
+def testSeparateUVsDontOverlap():
+    assert not len(findOverlappingUVs(*twoQuadUVs(0.5)))
+
+
+def testNeighbouringUVsDontOverlap():
+    assert not len(findOverlappingUVs(*twoQuadUVs(0.3)))
+
+
+def testStackedUVsOverlap():
+    assert findOverlappingUVs(*twoQuadUVs(0.1)).tolist() == [0, 1]
+
+
+def testOverlapsAreFoundAtALowerResolutionForLargeMeshes():
+    uvs, counts, indices = twoQuadUVs(0.0)
+    assert findOverlappingUVs(uvs, counts, indices,
+                              aMaxSamples=100).tolist() == [0, 1]
+
+
+@pytest.mark.parametrize("high, mismatch", [
+    ([0.0, 0.0, 0.0, 1.0, 1.0, 1.0], False),
+    ([0.01, 0.0, 0.0, 1.0, 1.02, 1.0], False),
+    ([0.0, 0.0, 0.0, 1.0, 1.5, 1.0], True),
+])
+def testBoundsMismatch(high, mismatch):
+    assert findBoundsMismatch([0.0, 0.0, 0.0, 1.0, 1.0, 1.0],
+                              high) == mismatch
+
+
+def testOnlyTheFirstComponentsAreListed():
+    assert (formatComponents("|a|aShape", "f[%d]", [0, 1, 2],
+                             aMaxComponents=2) ==
+            "aShape.f[0], aShape.f[1], ...")
+    assert (formatComponents("aShape", "vtx[%d] to vtx[%d]", [(1, 4)]) ==
+            "aShape.vtx[1] to vtx[4]")
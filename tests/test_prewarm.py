@@ -0,0 +1,53 @@
+import pytest
+
+
+@pytest.fixture
+def launches(plugin, monkeypatch):
+    mayaToPainter, fake = plugin
+    launches = []
+    monkeypatch.setattr(mayaToPainter, "isPainterRunning", lambda: False)
+    monkeypatch.setattr(mayaToPainter, "launchPainter", launches.append)
+    monkeypatch.setattr(mayaToPainter.getPainterLink(), "connect",
+                        lambda: None)
+    return launches
+
+
+def testPrewarmWithoutPainterPathOnlyWarns(plugin, launches):
+    mayaToPainter, fake = plugin
+    mayaToPainter.prewarmPainter()
+    assert not launches
+    assert not mayaToPainter.painterProcess["prewarmed"]
+    assert "not started ahead of time" in fake.warnings[-1]
+
+
+def testPrewarmWithMissingPainterOnlyWarns(plugin, launches, tmp_path):
+    mayaToPainter, fake = plugin
+    fake.optionVars["mayaToPainterSPDirectory"] = str(tmp_path / "nope.exe")
+    mayaToPainter.prewarmPainter()
+    assert not launches
+    assert "not started ahead of time" in fake.warnings[-1]
+
+
+def testPrewarmThatFailsToStartOnlyWarns(plugin, launches, tmp_path, monkeypatch):
+    mayaToPainter, fake = plugin
+    painter = tmp_path / "painter.exe"
+    painter.write_text("")
+    fake.optionVars["mayaToPainterSPDirectory"] = str(painter)
+
+    def launch(aArguments):
+        raise OSError("permission denied")
+
+    monkeypatch.setattr(mayaToPainter, "launchPainter", launch)
+    mayaToPainter.prewarmPainter()
+    assert not mayaToPainter.painterProcess["prewarmed"]
+    assert "permission denied" in fake.warnings[-1]
+
+
+def testPrewarmStartsPainter(plugin, launches, tmp_path):
+    mayaToPainter, fake = plugin
+    painter = tmp_path / "painter.exe"
+    painter.write_text("")
+    fake.optionVars["mayaToPainterSPDirectory"] = str(painter)
+    mayaToPainter.prewarmPainter()
+    assert launches == [[]]
+    assert mayaToPainter.painterProcess["prewarmed"]
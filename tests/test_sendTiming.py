@@ -0,0 +1,57 @@
+class FakeExporter(object):
+    runs = []
+
+    def __init__(self, aDispatch=None):
+        pass
+
+    def run(self, aJobs, aOnProgress, aOnFinished):
+        self.runs.append((aJobs, aOnProgress, aOnFinished))
+
+
+def queueExport(aMayaToPainter, aPath):
+    aPath.write_text("mesh")
+    job = {"snapshot": str(aPath) + ".mb",
+           "filename": str(aPath),
+           "sources": [],
+           "fingerprint": None,
+           "materialName": None,
+           "returncode": 0,
+           "error": "",
+           "seconds": 1.0}
+    aMayaToPainter.pendingExports.append(job)
+    return job
+
+
+def testBackgroundSendKeepsItsOwnTimingAndReport(plugin, tmp_path,
+                                                 monkeypatch):
+    mayaToPainter, fake = plugin
+    monkeypatch.setattr(FakeExporter, "runs", [])
+    monkeypatch.setattr(mayaToPainter, "BackgroundExporter", FakeExporter)
+    written = []
+    monkeypatch.setattr(mayaToPainter, "writeTimingLine", written.append)
+    finished = []
+
+    def onFinished():
+        finished.append(mayaToPainter.printExportReport())
+        mayaToPainter.endSendTiming()
+
+    mayaToPainter.beginSendTiming("send")
+    job = queueExport(mayaToPainter, tmp_path / "first_low.fbx")
+    mayaToPainter.runPendingExports(onFinished)
+
+    # A second send starts and queues its own file before the first one's
+    # file is written.
+    mayaToPainter.beginSendTiming("watch")
+    queueExport(mayaToPainter, tmp_path / "second_low.fbx")
+    mayaToPainter.runPendingExports(onFinished)
+
+    jobs, onProgress, onDone = FakeExporter.runs[0]
+    onProgress(job)
+    onDone(jobs)
+
+    assert finished == [[str(tmp_path / "first_low.fbx")]]
+    assert [timing["kind"] for timing in written] == ["send"]
+    assert written[0]["filesExported"] == 1
+    assert written[0]["stages"] == {"backgroundExport": 1.0}
+    assert mayaToPainter.currentSend["timing"] is None
+    assert mayaToPainter.currentSend["report"]["exported"] == []
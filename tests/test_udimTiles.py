@@ -0,0 +1,47 @@
+import pytest
+
+
+# Two quads side by side, both with lambert1, with their UVs moved by
+# aOffsets in U.
+def makeMesh(aOffsets):
+    us = []
+    vs = []
+    for offset in aOffsets:
+        us.extend([offset + 0.1, offset + 0.9, offset + 0.9, offset + 0.1])
+        vs.extend([0.1, 0.1, 0.9, 0.9])
+    return {"name": "|a|aShape",
+            "points": [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 1.0,
+                       0.0, 0.0, 1.0, 2.0, 0.0, 0.0, 2.0, 0.0, 1.0],
+            "counts": [4, 4],
+            "indices": [0, 1, 2, 3, 1, 4, 5, 2],
+            "uvs": us + vs,
+            "uvCounts": [4, 4],
+            "uvIndices": list(range(8)),
+            "matrix": [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                       0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0],
+            "textureSets": ["lambert1"],
+            "faceMaterials": [0, 0]}
+
+
+@pytest.mark.parametrize("offsets, layout, split", [
+    ([0.0, 0.0], {"lambert1": [1001]}, False),
+    ([0.0, 1.0], {"lambert1": [1001, 1002]}, True),
+])
+def testTileLayout(fakeMaya, offsets, layout, split):
+    mayaToPainter, fake = fakeMaya
+    tiles, tileSets = mayaToPainter.computeTileLayout([makeMesh(offsets)],
+                                                      True)
+    assert tiles == layout
+    assert mayaToPainter.isSplitByUdim(tiles) == split
+    assert sorted(tileSets) == ["lambert1_%d" % tile
+                                for tile in layout["lambert1"]]
+
+
+def testOnlyTheChangedTileGetsANewFingerprint(fakeMaya):
+    mayaToPainter, fake = fakeMaya
+    mesh = makeMesh([0.0, 1.0])
+    before = mayaToPainter.computeTileLayout([mesh], True)[1]
+    mesh["points"][13] = 0.5
+    after = mayaToPainter.computeTileLayout([mesh], True)[1]
+    assert before["lambert1_1001"] == after["lambert1_1001"]
+    assert before["lambert1_1002"] != after["lambert1_1002"]
@@ -0,0 +1,37 @@
+import time
+
+
+def waitForDeferred(aFake, aSeconds=2.0):
+    end = time.time() + aSeconds
+    while not aFake.deferred and time.time() < end:
+        time.sleep(0.01)
+
+
+def testDirtyNodesWhilePausedAreIgnored(fakeMaya):
+    mayaToPainter, fake = fakeMaya
+    with mayaToPainter.pausedWatch():
+        with mayaToPainter.pausedWatch():
+            mayaToPainter.onWatchedNodeDirty(None, "|low")
+        # Still paused after the nested pause ends.
+        mayaToPainter.onWatchedNodeDirty(None, "|low")
+    assert not mayaToPainter.watchState["exporting"]
+    assert not mayaToPainter.watchState["dirty"]
+    assert mayaToPainter.watchState["timer"] is None
+
+
+def testChangesAreResentOnceTheySettle(fakeMaya, monkeypatch):
+    mayaToPainter, fake = fakeMaya
+    monkeypatch.setattr(mayaToPainter, "watchDelay", 0.05)
+    mayaToPainter.onWatchedNodeDirty(None, "|low")
+    mayaToPainter.onWatchedNodeDirty(None, "|high")
+    waitForDeferred(fake)
+    assert fake.deferred == [(mayaToPainter.resendChangedObjects, ())]
+    assert mayaToPainter.watchState["timer"] is None
+    assert mayaToPainter.watchState["dirty"] == set(["|low", "|high"])
+
+
+def testNothingIsScheduledWithoutChanges(fakeMaya, monkeypatch):
+    mayaToPainter, fake = fakeMaya
+    monkeypatch.setattr(mayaToPainter, "watchDelay", 0.01)
+    mayaToPainter.scheduleResend()
+    assert mayaToPainter.watchState["timer"] is None